@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+录制循环跳帧基准测试
+比较逐帧 read()（每帧都解码）与 grab() 跳帧、只 retrieve() 需要保存的帧两种方式
+每保存一帧所消耗的 CPU 时间。使用合成帧源（dh_usb_frame_source.SyntheticSource），无需真实设备。
+
+用法:
+  python3 benchmarks/bench_grab_skip.py
+  python3 benchmarks/bench_grab_skip.py --fps 30 --interval 1 --duration 10 --resolution 1920x1080
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture_dh_usb_service as service
+from dh_usb_frame_source import SyntheticSource
+
+
+def read_every_frame_loop(cap, interval, stop_event, on_save):
+    """
+    原有录制循环的取帧方式：每帧 read()，到保存时间才使用
+    """
+    last_save_time = time.time()
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if ret and frame is not None:
+            current_time = time.time()
+            if current_time - last_save_time >= interval:
+                on_save(frame)
+                last_save_time = current_time
+
+
+def measure(run, duration):
+    """
+    运行 run(stop_event) 指定时长，返回 (进程 CPU 秒数, 墙钟秒数)
+    """
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run, args=(stop_event,), daemon=True)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    thread.join()
+    return time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+
+def bench_read_every_frame(width, height, fps, interval, duration):
+    saved = []
+    cap = SyntheticSource(width, height, fps, exposure_ramp=0)
+    cpu, wall = measure(lambda stop: read_every_frame_loop(cap, interval, stop, saved.append), duration)
+    return cpu, wall, len(saved)
+
+
+class CountingPipeline:
+    """
+    只计数不保存的流水线，用于单独测量取帧开销
+    """
+
+    def __init__(self):
+        self.saved = []
+
+    def start(self):
+        return self
+
+    def submit(self, frame, captured_at=None, encoded=False, force=False):
+        self.saved.append(frame)
+        return True
+
+    def close(self):
+        pass
+
+    def summary(self):
+        return {"saved": len(self.saved), "dropped": 0}
+
+    def format_summary(self):
+        return f"提交 {len(self.saved)} 帧"
+
+
+def bench_recording_loop(width, height, fps, interval, duration):
+    pipeline = CountingPipeline()
+    service.cap = SyntheticSource(width, height, fps, exposure_ramp=0)
+
+    def run(stop_event):
+        def stop_when_done():
+            stop_event.wait()
+            service.recording = False
+            service.recording_wakeup.set()
+
+        service.recording_wakeup.clear()
+        service.recording = True
+        watcher = threading.Thread(target=stop_when_done)
+        watcher.start()
+        service.recording_loop(interval=interval, pipeline=pipeline)
+        watcher.join()
+
+    cpu, wall = measure(run, duration)
+    return cpu, wall, len(pipeline.saved)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='录制循环跳帧基准测试')
+    parser.add_argument('--fps', type=float, default=30.0, help='合成摄像头帧率，默认 30')
+    parser.add_argument('--interval', type=float, default=1.0, help='保存间隔（秒），默认 1.0')
+    parser.add_argument('--duration', type=float, default=5.0, help='每种方式运行时长（秒），默认 5')
+    parser.add_argument('--resolution', type=str, default='1920x1080', help='分辨率，默认 1920x1080')
+    args = parser.parse_args()
+
+    width, height = map(int, args.resolution.lower().split('x'))
+    print(f"合成摄像头: MJPEG {width}x{height} @ {args.fps:g} fps，保存间隔 {args.interval}秒，"
+          f"每种方式运行 {args.duration}秒")
+
+    results = [
+        ("逐帧 read()", bench_read_every_frame(width, height, args.fps, args.interval, args.duration)),
+        ("grab() 跳帧", bench_recording_loop(width, height, args.fps, args.interval, args.duration)),
+    ]
+
+    print(f"{'方式':<14}{'保存帧数':>8}{'CPU 秒':>10}{'CPU 占用':>10}{'CPU ms/保存帧':>16}")
+    for name, (cpu, wall, saved) in results:
+        per_frame = cpu / saved * 1000 if saved else float('nan')
+        print(f"{name:<14}{saved:>8}{cpu:>10.3f}{cpu / wall * 100:>9.1f}%{per_frame:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+打包存储基准测试
+比较逐帧 JPEG 文件与打包文件（dh_usb_pack）的写入耗时，以及下游读取一段序列的耗时：
+  JPEG 文件 - 列目录、按文件名筛选时间范围、逐个打开读取
+  打包文件  - 内存映射索引，二分查找时间范围，直接切片读取
+只比较存储开销（读取原始 JPEG 数据，不解码）。使用合成帧，无需真实设备。
+
+用法:
+  python3 benchmarks/bench_pack.py
+  python3 benchmarks/bench_pack.py --frames 20000 --dir /data/bench
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dh_usb_frame_source import SyntheticSource
+from dh_usb_pack import PackReader, PackWriter
+from dh_usb_pipeline import make_filename, write_file
+
+
+def make_jpegs(width, height, count):
+    source = SyntheticSource(width, height, exposure_ramp=0, realtime=False)
+    source.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    data = source.read()[1].tobytes()
+    start = datetime.now()
+    return data, [start + timedelta(milliseconds=33 * i) for i in range(count)]
+
+
+def bench_files(directory, data, times, first, last):
+    start = time.perf_counter()
+    for captured_at in times:
+        write_file(os.path.join(directory, make_filename(captured_at)), data)
+    write_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lo, hi = make_filename(times[first]), make_filename(times[last])
+    names = sorted(name for name in os.listdir(directory) if lo <= name < hi)
+    total = 0
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            total += len(f.read())
+    return write_seconds, time.perf_counter() - start, len(names), total
+
+
+def bench_pack(directory, data, times, first, last):
+    path = os.path.join(directory, make_filename(times[0], ext=".pack"))
+    start = time.perf_counter()
+    writer = PackWriter(path)
+    for captured_at in times:
+        writer.append(data, captured_at)
+    writer.close()
+    write_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with PackReader(path) as reader:
+        frames = reader.find_range(times[first], times[last])
+        # 复制出数据，确保实际读取了映射的页面
+        total = sum(len(bytes(reader.frame_bytes(k))) for k in frames)
+    return write_seconds, time.perf_counter() - start, len(frames), total
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='打包存储基准测试')
+    parser.add_argument('--resolution', type=str, default='640x480', help='合成帧分辨率，默认 640x480')
+    parser.add_argument('--frames', type=int, default=5000, help='写入帧数，默认 5000')
+    parser.add_argument('--range', type=int, default=300, help='读取的连续帧数（位于序列中间），默认 300')
+    parser.add_argument('--dir', type=str, default=None, help='测试目录（默认系统临时目录）')
+    args = parser.parse_args()
+
+    width, height = map(int, args.resolution.lower().split('x'))
+    data, times = make_jpegs(width, height, args.frames)
+    first = max(0, (args.frames - args.range) // 2)
+    last = min(args.frames - 1, first + args.range)
+    print(f"合成帧: {width}x{height}，每帧 {len(data) / 1024:.0f} KB，写入 {args.frames} 帧，读取中间 {last - first} 帧")
+
+    print(f"{'方式':<12}{'写入 微秒/帧':>14}{'读取范围 毫秒':>16}{'帧数':>8}{'读取 MB':>10}")
+    for name, bench in (("JPEG 文件", bench_files), ("打包文件", bench_pack)):
+        directory = tempfile.mkdtemp(prefix="dh_usb_bench_", dir=args.dir)
+        try:
+            write_seconds, read_seconds, count, total = bench(directory, data, times, first, last)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print(f"{name:<12}{write_seconds / args.frames * 1e6:>14.1f}{read_seconds * 1000:>16.2f}{count:>8}"
+              f"{total / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
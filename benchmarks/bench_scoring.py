@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+选帧评分基准测试
+比较原有方式（整帧 cvtColor 转灰度 + np.mean，更亮时 frame.copy()）与
+FrameSelector（缩小图评分，只交换引用）每帧的评分耗时。使用合成帧，无需真实设备。
+
+用法:
+  python3 benchmarks/bench_scoring.py
+  python3 benchmarks/bench_scoring.py --resolution 1280x720 --frames 200
+"""
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dh_usb_frame_source import SyntheticSource
+from dh_usb_scoring import SCORERS, FrameSelector
+
+
+def make_frames(width, height, count):
+    """
+    生成亮度逐渐升高的帧（每帧都比上一帧亮，原有方式每帧都会复制，对应最差情况）
+    """
+    source = SyntheticSource(width, height, fps=count, exposure_ramp=1.0, realtime=False)
+    source.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"BGR3"))
+    return [source.read()[1] for _ in range(count)]
+
+
+def select_original(frames):
+    """
+    原有的选帧方式
+    """
+    best_frame = None
+    best_brightness = 0
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        brightness = np.mean(gray)
+        if brightness > best_brightness:
+            best_brightness = brightness
+            best_frame = frame.copy()
+    return best_frame, best_brightness
+
+
+def select_with(frames, score):
+    selector = FrameSelector(score)
+    for frame in frames:
+        selector.offer(frame)
+    return selector.best, selector.best_score
+
+
+def per_frame_us(run, frames, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = run(frames)
+    return (time.perf_counter() - start) / (repeat * len(frames)) * 1e6, result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='选帧评分基准测试')
+    parser.add_argument('--resolution', type=str, default='1920x1080', help='分辨率，默认 1920x1080')
+    parser.add_argument('--frames', type=int, default=20, help='每轮帧数（对应 --capture-frames），默认 20')
+    parser.add_argument('--repeat', type=int, default=20, help='重复轮数，默认 20')
+    args = parser.parse_args()
+
+    width, height = map(int, args.resolution.lower().split('x'))
+    frames = make_frames(width, height, args.frames)
+    print(f"合成帧: {width}x{height}，每轮 {args.frames} 帧，重复 {args.repeat} 轮")
+
+    baseline_us, (_, baseline_score) = per_frame_us(select_original, frames, args.repeat)
+    print(f"{'方式':<24}{'微秒/帧':>10}{'加速比':>10}{'最佳帧评分':>12}")
+    print(f"{'原有（cvtColor+copy）':<24}{baseline_us:>10.1f}{1.0:>10.1f}{baseline_score:>12.1f}")
+    for name in SCORERS:
+        us, (_, score) = per_frame_us(lambda batch: select_with(batch, name), frames, args.repeat)
+        print(f"{'FrameSelector ' + name:<24}{us:>10.1f}{baseline_us / us:>10.1f}{score:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
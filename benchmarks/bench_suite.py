@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+采集、编码、保存热路径基准测试套件
+使用合成帧源（无需摄像头），在不同分辨率、JPEG 质量、保存间隔和编码线程数下运行：
+  recording - recording_loop() + SavePipeline 异步保存
+  save_image - 同步 save_image()（编码 + 写盘）
+  capture   - capture_dh_usb_image() 单次捕获全流程
+每次运行记录帧率、各阶段延迟分位数、CPU 时间和写入字节数，结果写入 JSON 文件，
+可用 --baseline 与之前的结果比较
+
+用法:
+  python3 benchmarks/bench_suite.py
+  python3 benchmarks/bench_suite.py --quick
+  python3 benchmarks/bench_suite.py --benchmarks recording --resolutions 1920x1080 --workers 1,2,4
+  python3 benchmarks/bench_suite.py --output after.json --baseline before.json
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture_dh_usb_service as service
+from capture_dh_usb import capture_dh_usb_image
+from dh_usb_frame_source import SyntheticSource
+from dh_usb_pipeline import SavePipeline, percentile
+
+
+BENCHMARKS = ("recording", "save_image", "capture")
+# 与基线比较时，帧率下降超过该比例标记为回退
+REGRESSION_RATIO = 0.9
+
+
+def parse_list(text, convert):
+    return [convert(item) for item in text.split(",") if item]
+
+
+def parse_resolution(text):
+    width, height = map(int, text.lower().split("x"))
+    return width, height
+
+
+def latency_stats(samples):
+    """
+    延迟样本（秒）的分位数（毫秒）
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {"p50": percentile(ordered, 0.5) * 1000, "p95": percentile(ordered, 0.95) * 1000,
+            "p99": percentile(ordered, 0.99) * 1000, "max": ordered[-1] * 1000}
+
+
+def directory_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+@contextlib.contextmanager
+def measured():
+    """
+    测量代码块的墙钟时间和进程 CPU 时间，静默其中的打印输出
+    """
+    result = {}
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield result
+    result["wall_seconds"] = time.perf_counter() - wall_start
+    result["cpu_seconds"] = time.process_time() - cpu_start
+
+
+def bench_recording(width, height, quality, interval, workers, duration, fps):
+    """
+    recording_loop() 在合成帧源上运行 duration 秒
+    """
+    output_dir = tempfile.mkdtemp(prefix="dh_usb_bench_")
+    pipeline = SavePipeline(output_dir, quality=quality, encoder_workers=workers, verbose=False)
+    service.cap = SyntheticSource(width, height, fps, exposure_ramp=0)
+    service.camera_passthrough = False
+    service.recording_wakeup.clear()
+    service.recording = True
+
+    def stop_after_duration():
+        time.sleep(duration)
+        service.recording = False
+        service.recording_wakeup.set()
+
+    stopper = threading.Thread(target=stop_after_duration)
+    try:
+        with measured() as result:
+            stopper.start()
+            service.recording_loop(output_dir, interval, pipeline=pipeline)
+            stopper.join()
+        stats = pipeline.summary()
+        schedule = service.recording_scheduler.summary()
+        result.update({
+            "frames": stats["saved"],
+            "fps": stats["saved"] / result["wall_seconds"],
+            "dropped": stats["dropped"],
+            "missed": schedule["missed"],
+            "bytes_written": stats["bytes_written"],
+            "latency_ms": pipeline.latency_summary(),
+            "jitter_p95_ms": schedule.get("jitter_p95_ms"),
+        })
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return result
+
+
+def bench_save_image(width, height, quality, frames):
+    """
+    同步 save_image() 保存 frames 帧
+    """
+    output_dir = tempfile.mkdtemp(prefix="dh_usb_bench_")
+    source = SyntheticSource(width, height, exposure_ramp=0, realtime=False)
+    source.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"BGR3"))
+    _, frame = source.read()
+    # 同一毫秒内保存的文件会重名，用不同的子目录避免覆盖
+    calls = []
+    try:
+        with measured() as result:
+            for i in range(frames):
+                start = time.perf_counter()
+                service.save_image(frame, os.path.join(output_dir, str(i)), quality)
+                calls.append(time.perf_counter() - start)
+        written = sum(directory_bytes(os.path.join(output_dir, name)) for name in os.listdir(output_dir))
+        result.update({
+            "frames": frames,
+            "fps": frames / result["wall_seconds"],
+            "bytes_written": written,
+            "latency_ms": {"save": latency_stats(calls)},
+        })
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return result
+
+
+def bench_capture(width, height, capture_frames, warmup_frames):
+    """
+    capture_dh_usb_image() 单次捕获（合成帧源不按帧率等待，只测量处理开销）
+    """
+    output_dir = tempfile.mkdtemp(prefix="dh_usb_bench_")
+    source = f"synthetic:width={width},height={height},ramp=0,realtime=0"
+    try:
+        with measured() as result:
+            success = capture_dh_usb_image("bench.jpg", warmup_seconds=0, warmup_frames=warmup_frames,
+                                           capture_frames=capture_frames, width=width, height=height,
+                                           output_dir=output_dir, source=source)
+        frames = warmup_frames + capture_frames
+        result.update({
+            "success": bool(success),
+            "frames": frames,
+            "fps": frames / result["wall_seconds"],
+            "bytes_written": directory_bytes(output_dir),
+            "latency_ms": {"capture": {"total": result["wall_seconds"] * 1000}},
+        })
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return result
+
+
+def run_suite(args):
+    runs = []
+
+    def record(name, params, run):
+        label = " ".join(f"{key}={value}" for key, value in params.items())
+        print(f"[{name}] {label} ...", end=" ", flush=True)
+        result = run()
+        print(f"{result['fps']:.1f} 帧/秒，CPU {result['cpu_seconds']:.2f} 秒")
+        runs.append({"benchmark": name, "params": params, **result})
+
+    for width, height in args.resolutions:
+        resolution = f"{width}x{height}"
+        if "recording" in args.benchmarks:
+            for quality in args.qualities:
+                for interval in args.intervals:
+                    for workers in args.workers:
+                        params = {"resolution": resolution, "quality": quality, "interval": interval,
+                                  "workers": workers}
+                        record("recording", params, lambda: bench_recording(
+                            width, height, quality, interval, workers, args.duration, args.fps))
+        if "save_image" in args.benchmarks:
+            for quality in args.qualities:
+                params = {"resolution": resolution, "quality": quality}
+                record("save_image", params, lambda: bench_save_image(width, height, quality, args.frames))
+        if "capture" in args.benchmarks:
+            params = {"resolution": resolution}
+            record("capture", params, lambda: bench_capture(width, height, args.capture_frames, args.warmup_frames))
+    return runs
+
+
+def run_key(run):
+    return run["benchmark"], tuple(sorted(run["params"].items()))
+
+
+def compare(runs, baseline_path):
+    """
+    与基线结果比较帧率，返回回退的运行数
+    """
+    with open(baseline_path) as f:
+        baseline = {run_key(run): run for run in json.load(f)["runs"]}
+    regressions = 0
+    print(f"\n与基线 {baseline_path} 比较（帧率）:")
+    for run in runs:
+        old = baseline.get(run_key(run))
+        if old is None or not old["fps"]:
+            continue
+        ratio = run["fps"] / old["fps"]
+        flag = ""
+        if ratio < REGRESSION_RATIO:
+            flag = "  <-- 回退"
+            regressions += 1
+        label = " ".join(f"{key}={value}" for key, value in run["params"].items())
+        print(f"  [{run['benchmark']}] {label}: {old['fps']:.1f} -> {run['fps']:.1f} 帧/秒 ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='采集、编码、保存热路径基准测试套件',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python3 benchmarks/bench_suite.py --quick
+  python3 benchmarks/bench_suite.py --benchmarks recording --workers 1,2,4 --intervals 0.02
+  python3 benchmarks/bench_suite.py --output after.json --baseline before.json
+        """
+    )
+    parser.add_argument('--benchmarks', type=str, default=",".join(BENCHMARKS),
+                        help=f'运行的基准测试，逗号分隔，默认 {",".join(BENCHMARKS)}')
+    parser.add_argument('--resolutions', type=str, default='640x480,1280x720,1920x1080',
+                        help='分辨率列表，默认 640x480,1280x720,1920x1080')
+    parser.add_argument('--qualities', type=str, default='75,95', help='JPEG 质量列表，默认 75,95')
+    parser.add_argument('--intervals', type=str, default='0.1,0.033', help='保存间隔列表（秒），默认 0.1,0.033')
+    parser.add_argument('--workers', type=str, default='1,2,4', help='编码线程数列表，默认 1,2,4')
+    parser.add_argument('--fps', type=float, default=30.0, help='recording 合成帧源帧率，默认 30')
+    parser.add_argument('--duration', type=float, default=3.0, help='recording 每次运行时长（秒），默认 3')
+    parser.add_argument('--frames', type=int, default=30, help='save_image 每次保存帧数，默认 30')
+    parser.add_argument('--capture-frames', type=int, default=20, help='capture 捕获帧数，默认 20')
+    parser.add_argument('--warmup-frames', type=int, default=30, help='capture 预热帧数，默认 30')
+    parser.add_argument('--quick', action='store_true',
+                        help='快速模式：只测 640x480 和 1920x1080、质量 95、间隔 0.1、1 和 2 个编码线程，每次 1 秒')
+    parser.add_argument('--output', '-o', type=str, default='bench_results.json',
+                        help='结果 JSON 文件，默认 bench_results.json')
+    parser.add_argument('--baseline', type=str, default=None, help='与之前的结果 JSON 比较帧率')
+    args = parser.parse_args()
+
+    args.benchmarks = parse_list(args.benchmarks, str)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        print(f"错误: 未知的基准测试: {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    if args.quick:
+        args.resolutions, args.qualities, args.intervals, args.workers = '640x480,1920x1080', '95', '0.1', '1,2'
+        args.duration = 1.0
+        args.frames = 10
+    args.resolutions = parse_list(args.resolutions, parse_resolution)
+    args.qualities = parse_list(args.qualities, int)
+    args.intervals = parse_list(args.intervals, float)
+    args.workers = parse_list(args.workers, int)
+
+    started = datetime.now()
+    runs = run_suite(args)
+    report = {
+        "started_at": started.isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已写入 {args.output}（{len(runs)} 次运行）")
+
+    if args.baseline:
+        regressions = compare(runs, args.baseline)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
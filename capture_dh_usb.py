@@ -7,96 +7,156 @@ DH USB 摄像头图像捕获脚本
 import cv2
 import sys
 import os
-import subprocess
 import time
-import numpy as np
 from datetime import datetime
 from pathlib import Path
 
+from dh_usb_camera import PIXEL_FORMAT_CHOICES, WARMUP_TOLERANCE, configure_capture, warmup_camera
+from dh_usb_discovery import find_dh_usb_camera, invalidate_cached_camera
+from dh_usb_frame_source import BACKEND_OPENCV, BACKENDS, SOURCE_CAMERA, is_virtual_source, open_frame_source
+from dh_usb_merge import MERGE_METHODS, FrameMerger
+from dh_usb_scoring import SCORERS, FrameSelector, format_details
+from dh_usb_v4l2 import print_modes, select_camera_mode
 
-def find_dh_usb_camera():
+
+def select_best_frame(cap, capture_frames, score="brightness"):
     """
-    查找 DH USB 摄像头设备
-    返回设备路径（如 /dev/video2）或索引，如果未找到则返回 None
+    读取 capture_frames 帧并返回评分最高的一帧（评分在缩小图上计算，最佳帧只保留引用）
+    无法读取任何帧时返回 None
     """
-    print("正在查找 DH USB 摄像头...")
+    print(f"正在捕获图像（读取 {capture_frames} 帧，选择最佳）...")
+    selector = FrameSelector(score, copy=getattr(cap, "zero_copy", False))
     
-    for dev in ['/dev/video0', '/dev/video1', '/dev/video2', '/dev/video3', 
-               '/dev/video4', '/dev/video5', '/dev/video6', '/dev/video7']:
-        if not os.path.exists(dev):
-            continue
-        
-        try:
-            cap = cv2.VideoCapture(dev)
-            if not cap.isOpened():
-                cap.release()
-                continue
-            
-            ret, _ = cap.read()
-            cap.release()
-            if not ret:
-                continue
-            
-            try:
-                result = subprocess.run(
-                    ['udevadm', 'info', '--query=all', '--name', dev],
-                    capture_output=True,
-                    text=True,
-                    timeout=2
-                )
-                if 'DH' in result.stdout or 'DH_USB' in result.stdout:
-                    print(f"找到 DH USB 摄像头: {dev}")
-                    return dev
-            except:
-                idx = int(dev.replace('/dev/video', ''))
-                if idx in [2, 3, 4, 5]:
-                    print(f"找到可用摄像头: {dev} (索引 {idx})，假设是 DH USB")
-                    return dev
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-            continue
-    
-    return None
+    for i in range(capture_frames):
+        ret, frame = cap.read()
+        if ret and frame is not None:
+            selector.offer(frame)
+    
+    if selector.best is not None:
+        print(f"  捕获到最佳图像（第 {selector.best_index + 1} 帧，选帧方式 {selector.name}，"
+              f"评分耗时 {selector.score_us_per_frame:.0f} 微秒/帧）")
+        print(f"  {format_details(selector.best_details)}")
+    return selector.best
+
+
+def merge_frames(cap, capture_frames, method="mean", align=False):
+    """
+    读取 capture_frames 帧并逐帧累加合并为一张降噪图像（见 dh_usb_merge）
+    无法读取任何帧时返回 None
+    """
+    print(f"正在捕获图像（读取 {capture_frames} 帧，{method} 合并{'，平移对齐' if align else ''}）...")
+    merger = FrameMerger(method, align)
+    
+    for i in range(capture_frames):
+        ret, frame = cap.read()
+        if ret and frame is not None:
+            merger.add(frame)
+    
+    if merger.frames > 0:
+        print(f"  已合并 {merger.frames} 帧，累加器内存 {merger.memory_bytes / 1e6:.1f} MB，"
+              f"合并耗时 {merger.ms_per_frame:.1f} ms/帧")
+        if align:
+            print(f"  最大平移: {merger.max_shift:.1f} 像素")
+    return merger.result()
+
+
+def resolve_output_path(output_path, output_dir):
+    """
+    确定输出文件路径：未指定时使用时间戳命名，只有文件名时放到 output_dir 中，补全 .jpg 扩展名
+    """
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"dh_usb_image_{timestamp}.jpg"
+        output_path = os.path.join(output_dir, filename)
+    else:
+        if os.path.dirname(output_path) == '' or os.path.dirname(output_path) == '.':
+            filename = os.path.basename(output_path)
+            output_path = os.path.join(output_dir, filename)
+    
+    if not output_path.lower().endswith('.jpg') and not output_path.lower().endswith('.jpeg'):
+        output_path += '.jpg'
+    return output_path
 
 
-def capture_dh_usb_image(output_path=None, warmup_seconds=3, warmup_frames=30, capture_frames=20, width=1920, height=1080, output_dir="captures"):
+def sequence_path(output_path, number):
+    """
+    在扩展名前追加序号：calib.jpg -> calib_003.jpg
+    """
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{number:03d}{ext}"
+
+
+def drain_until(cap, deadline):
+    """
+    等待到 deadline（time.monotonic()），期间持续 grab() 丢弃旧帧（不解码）
+    """
+    while time.monotonic() < deadline:
+        if not cap.grab():
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+
+
+def capture_dh_usb_image(output_path=None, warmup_seconds=3, warmup_frames=30, capture_frames=20, width=1920, height=1080, output_dir="captures", use_cache=True, pixel_format="auto", backend=BACKEND_OPENCV, source=SOURCE_CAMERA, adaptive_warmup=True, warmup_tolerance=WARMUP_TOLERANCE, score="brightness", merge=None, align=False, count=1, every=0.0):
     """
     从 DH USB 摄像头捕获图像并保存为 JPG 文件
     
     参数:
         output_path: 输出文件路径，如果为 None 则使用时间戳命名
-        warmup_seconds: 预热等待时间（秒），默认3秒
-        warmup_frames: 预热帧数，默认30帧
+        warmup_seconds: 预热等待时间（秒），默认3秒（自适应预热时为上限）
+        warmup_frames: 预热帧数，默认30帧（自适应预热时为上限）
         capture_frames: 捕获帧数（选择最亮的），默认20帧
         width: 图像宽度，默认1920（1080p）
         height: 图像高度，默认1080（1080p）
         output_dir: 输出文件夹，默认 "captures"
+        use_cache: 是否使用发现缓存，默认 True（False 时强制重新扫描设备）
+        pixel_format: 像素格式，"auto"（选择请求分辨率下帧率最高的格式）或 MJPG/YUYV/NV12
+        backend: 采集后端，"opencv"（cv2.VideoCapture）或 "v4l2"（V4L2 mmap 零拷贝后端）
+        source: 帧源，"camera"（DH USB 摄像头）或虚拟帧源描述，如 "synthetic"、"replay:recordings"
+        adaptive_warmup: 是否在亮度稳定后提前结束预热，默认 True（False 时固定预热帧数并等待）
+        warmup_tolerance: 自适应预热的亮度收敛容差（灰度级）
+        score: 选帧评分方式，dh_usb_scoring.SCORERS 中的名称或评分函数，默认 "brightness"（最亮的帧）；
+            "composite" 综合曝光（接近目标亮度、过曝/欠曝少）和清晰度（拉普拉斯方差），避免选中模糊的帧
+        merge: 多帧降噪合并方式，None（选择一帧，默认）、"mean" 或 "median"，设置后忽略 score
+        align: 合并前是否按平移对齐到第一帧（默认假设画面静止）
+        count: 拍摄张数，默认 1。大于 1 时只初始化和预热一次，文件名追加序号（_001、_002 ...）
+        every: 连续拍摄的间隔（秒），默认 0（每张拍完立即拍下一张）
     """
-    camera_device = find_dh_usb_camera()
-    
-    if camera_device is None:
-        print("错误: 未找到 DH USB 摄像头")
-        print("提示:")
-        print("  1. 请检查 DH USB 摄像头是否已连接")
-        print("  2. 检查设备权限: ls -la /dev/video*")
-        print("  3. 检查用户是否在 video 组中: groups $USER")
-        return False
+    start_time = time.monotonic()
+    if is_virtual_source(source):
+        # 虚拟帧源（合成图像或回放录制目录）不需要查找和查询摄像头
+        camera_device = source
+        mode = None
+    else:
+        camera_device = find_dh_usb_camera(use_cache=use_cache)
+        
+        if camera_device is None:
+            print("错误: 未找到 DH USB 摄像头")
+            print("提示:")
+            print("  1. 请检查 DH USB 摄像头是否已连接")
+            print("  2. 检查设备权限: ls -la /dev/video*")
+            print("  3. 检查用户是否在 video 组中: groups $USER")
+            return False
+        
+        # 打开前通过 V4L2 查询选择满足请求分辨率的最快模式
+        print("正在查询摄像头支持的模式...")
+        mode = select_camera_mode(camera_device, width, height, pixel_format)
     
     print(f"正在打开摄像头: {camera_device}")
-    cap = cv2.VideoCapture(camera_device)
+    try:
+        cap = open_frame_source(camera_device, backend)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return False
     
     if not cap.isOpened():
+        if not is_virtual_source(source):
+            # 缓存的设备可能已失效，下次运行时重新扫描
+            invalidate_cached_camera(dev_path=camera_device)
         print(f"错误: 无法打开摄像头 {camera_device}")
         print("提示: 摄像头可能被其他程序占用，或需要权限")
         return False
     
-    print(f"设置分辨率: {width}x{height}")
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-    
     # 验证实际设置的分辨率（摄像头可能不支持请求的分辨率，会使用最接近的支持值）
-    actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    print(f"实际分辨率: {actual_width}x{actual_height}")
+    actual_width, actual_height, _ = configure_capture(cap, mode, width, height, pixel_format)
     
     if actual_width != width or actual_height != height:
         print(f"注意: 摄像头不支持 {width}x{height}，已使用 {actual_width}x{actual_height}")
@@ -107,70 +167,55 @@ def capture_dh_usb_image(output_path=None, warmup_seconds=3, warmup_frames=30, c
     except:
         pass
     
-    # 预热摄像头：丢弃前几帧，让摄像头有时间调整曝光
-    print(f"正在预热摄像头（调整曝光）...")
-    print(f"  预热帧数: {warmup_frames}, 等待时间: {warmup_seconds}秒")
-    for i in range(warmup_frames):
-        ret, _ = cap.read()
-        if not ret:
-            break
-        if (i + 1) % 10 == 0:
-            print(f"  预热进度: {i + 1}/{warmup_frames} 帧")
-    
-    # 等待额外时间让曝光稳定（摄像头需要几秒钟来调整）
-    print(f"等待曝光稳定 ({warmup_seconds}秒)...")
-    time.sleep(warmup_seconds)
+    # 预热摄像头：丢弃帧直到曝光稳定，同时验证实际帧率
+    warmup_camera(cap, warmup_frames, warmup_seconds, mode.max_fps if mode else None,
+                  adaptive=adaptive_warmup, tolerance=warmup_tolerance)
     
-    # 再读取一些帧，选择亮度合适的帧
-    print(f"正在捕获图像（读取 {capture_frames} 帧，选择最佳）...")
-    best_frame = None
-    best_brightness = 0
-    
-    for i in range(capture_frames):
-        ret, frame = cap.read()
-        if ret and frame is not None:
-            # 计算图像平均亮度（转换为灰度图后计算均值）
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            brightness = np.mean(gray)
-            
-            # 选择最亮的帧（曝光调整好的帧通常更亮）
-            if brightness > best_brightness:
-                best_brightness = brightness
-                best_frame = frame.copy()
-    
-    if best_frame is None:
-        print("错误: 无法从摄像头读取图像")
-        cap.release()
-        return False
-    
-    frame = best_frame
-    print(f"  捕获到最佳图像，平均亮度: {best_brightness:.1f}/255")
+    init_seconds = time.monotonic() - start_time
     
     Path(output_dir).mkdir(parents=True, exist_ok=True)
-    
-    if output_path is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"dh_usb_image_{timestamp}.jpg"
-        output_path = os.path.join(output_dir, filename)
-    else:
-        if os.path.dirname(output_path) == '' or os.path.dirname(output_path) == '.':
-            filename = os.path.basename(output_path)
-            output_path = os.path.join(output_dir, filename)
-    
-    if not output_path.lower().endswith('.jpg') and not output_path.lower().endswith('.jpeg'):
-        output_path += '.jpg'
-    
-    success = cv2.imwrite(output_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-    
-    if success:
-        print(f"✓ 图像已成功保存到: {output_path}")
-        print(f"  图像尺寸: {frame.shape[1]}x{frame.shape[0]}")
-    else:
-        print(f"错误: 无法保存图像到 {output_path}")
+    output_path = resolve_output_path(output_path, output_dir)
+    
+    saved = 0
+    capture_seconds = 0.0
+    first_deadline = time.monotonic()
+    for index in range(count):
+        if count > 1:
+            # 连拍/定时拍摄：按绝对时间点 t0 + k*every 拍摄，等待期间持续 grab() 保持缓冲区为最新帧
+            drain_until(cap, first_deadline + index * every)
+            print(f"\n[{index + 1}/{count}] {datetime.now().strftime('%H:%M:%S')}")
+        shot_start = time.monotonic()
+        
+        if merge:
+            # 多帧降噪：合并所有捕获帧
+            frame = merge_frames(cap, capture_frames, merge, align)
+        else:
+            # 再读取一些帧，选择最佳帧
+            frame = select_best_frame(cap, capture_frames, score)
+        
+        if frame is None:
+            print("错误: 无法从摄像头读取图像")
+            break
+        
+        path = sequence_path(output_path, index + 1) if count > 1 else output_path
+        success = cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        capture_seconds += time.monotonic() - shot_start
+        
+        if success:
+            saved += 1
+            print(f"✓ 图像已成功保存到: {path}")
+            print(f"  图像尺寸: {frame.shape[1]}x{frame.shape[0]}")
+        else:
+            print(f"错误: 无法保存图像到 {path}")
     
     cap.release()
     
-    return success
+    if count > 1:
+        per_image = capture_seconds / max(1, saved)
+        print(f"\n连拍完成: 保存 {saved}/{count} 张，初始化和预热 {init_seconds:.2f} 秒，"
+              f"每张捕获 {per_image:.2f} 秒（分别运行 {count} 次约需 {(init_seconds + per_image) * count:.1f} 秒）")
+    
+    return saved == count
 
 
 if __name__ == "__main__":
@@ -184,8 +229,19 @@ if __name__ == "__main__":
   python3 capture_dh_usb.py
   python3 capture_dh_usb.py output.jpg
   python3 capture_dh_usb.py --warmup-seconds 5 output.jpg
+  python3 capture_dh_usb.py --fixed-warmup output.jpg
+  python3 capture_dh_usb.py --select composite output.jpg
+  python3 capture_dh_usb.py --merge mean --capture-frames 30 calib.jpg
+  python3 capture_dh_usb.py --count 20 calib.jpg
+  python3 capture_dh_usb.py --count 60 --every 10 timelapse.jpg
   python3 capture_dh_usb.py --resolution 1920x1080 output.jpg
   python3 capture_dh_usb.py --output-dir my_images output.jpg
+  python3 capture_dh_usb.py --rescan output.jpg
+  python3 capture_dh_usb.py --list-modes
+  python3 capture_dh_usb.py --pixel-format MJPG output.jpg
+  python3 capture_dh_usb.py --backend v4l2 output.jpg
+  python3 capture_dh_usb.py --source synthetic:fps=30,ramp=1 output.jpg
+  python3 capture_dh_usb.py --source replay:recordings output.jpg
         """
     )
     
@@ -210,6 +266,20 @@ if __name__ == "__main__":
         help='预热帧数，默认 30'
     )
     
+    parser.add_argument(
+        '--fixed-warmup',
+        action='store_true',
+        help='固定预热：读取 --warmup-frames 帧后再等待 --warmup-seconds 秒（默认在亮度稳定后提前结束，'
+             '两者只作为上限）'
+    )
+    
+    parser.add_argument(
+        '--warmup-tolerance',
+        type=float,
+        default=WARMUP_TOLERANCE,
+        help=f'自适应预热的亮度收敛容差（0-255 灰度级），默认 {WARMUP_TOLERANCE:g}'
+    )
+    
     parser.add_argument(
         '--capture-frames',
         type=int,
@@ -217,6 +287,44 @@ if __name__ == "__main__":
         help='捕获帧数，默认 20'
     )
     
+    parser.add_argument(
+        '--select',
+        type=str,
+        choices=tuple(SCORERS),
+        default='brightness',
+        help='选帧方式：brightness（最亮，默认）、exposure（曝光最接近目标且过曝/欠曝少）、'
+             'sharpness（中心区域最清晰）、composite（曝光和清晰度综合）'
+    )
+    
+    parser.add_argument(
+        '--merge',
+        type=str,
+        choices=MERGE_METHODS,
+        default=None,
+        help='多帧降噪：将 --capture-frames 帧合并为一张低噪声图像（mean 平均，median 近似中值，'
+             '抗偶发干扰），设置后不再选择单帧'
+    )
+    
+    parser.add_argument(
+        '--align',
+        action='store_true',
+        help='与 --merge 一起使用：合并前按平移对齐各帧（默认假设画面静止）'
+    )
+    
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=1,
+        help='拍摄张数，默认 1。大于 1 时只打开和预热摄像头一次，文件名追加序号（例如 calib_001.jpg）'
+    )
+    
+    parser.add_argument(
+        '--every',
+        type=float,
+        default=0.0,
+        help='与 --count 一起使用：每张之间的间隔（秒），默认 0（连拍）；按固定时间点拍摄，不累积误差'
+    )
+    
     parser.add_argument(
         '--resolution',
         type=str,
@@ -231,8 +339,51 @@ if __name__ == "__main__":
         help="输出文件夹，默认 'captures'，所有图像将保存到此文件夹中"
     )
     
+    parser.add_argument(
+        '--rescan',
+        action='store_true',
+        help='忽略发现缓存，重新扫描摄像头设备'
+    )
+    
+    parser.add_argument(
+        '--pixel-format',
+        type=str,
+        choices=PIXEL_FORMAT_CHOICES,
+        default='auto',
+        help='像素格式，默认 auto（选择请求分辨率下帧率最高的格式，通常为 MJPG）'
+    )
+    
+    parser.add_argument(
+        '--backend',
+        type=str,
+        choices=BACKENDS,
+        default=BACKEND_OPENCV,
+        help='采集后端：opencv（cv2.VideoCapture，默认）或 v4l2（V4L2 mmap 零拷贝）'
+    )
+    
+    parser.add_argument(
+        '--source',
+        type=str,
+        default=SOURCE_CAMERA,
+        help='帧源，默认 camera（DH USB 摄像头）；synthetic[:width=W,height=H,fps=F,ramp=秒] 使用合成图像，'
+             'replay[:目录] 按原始时间间隔回放录制目录，无需摄像头'
+    )
+    
+    parser.add_argument(
+        '--list-modes',
+        action='store_true',
+        help='列出摄像头支持的像素格式、分辨率和帧率后退出'
+    )
+    
     args = parser.parse_args()
     
+    if args.list_modes:
+        camera_device = find_dh_usb_camera(use_cache=not args.rescan)
+        if camera_device is None:
+            print("错误: 未找到 DH USB 摄像头")
+            sys.exit(1)
+        sys.exit(0 if print_modes(camera_device) else 1)
+    
     if args.output_file and args.output_file.startswith('/dev/video'):
         print("错误: 输出文件名不能是设备路径")
         sys.exit(1)
@@ -248,6 +399,10 @@ if __name__ == "__main__":
         print(f"错误: 无效的分辨率格式 '{args.resolution}'，应为 WIDTHxHEIGHT (例如: 1920x1080)")
         sys.exit(1)
     
+    if args.count < 1 or args.every < 0:
+        print("错误: --count 至少为 1，--every 不能为负数")
+        sys.exit(1)
+    
     success = capture_dh_usb_image(
         args.output_file,
         args.warmup_seconds,
@@ -255,7 +410,18 @@ if __name__ == "__main__":
         args.capture_frames,
         width,
         height,
-        args.output_dir
+        args.output_dir,
+        use_cache=not args.rescan,
+        pixel_format=args.pixel_format,
+        backend=args.backend,
+        source=args.source,
+        adaptive_warmup=not args.fixed_warmup,
+        warmup_tolerance=args.warmup_tolerance,
+        score=args.select,
+        merge=args.merge,
+        align=args.align,
+        count=args.count,
+        every=args.every
     )
     sys.exit(0 if success else 1)
 
@@ -6,9 +6,15 @@ DH USB 摄像头录制服务控制脚本
 
 import sys
 import os
+import json
+import select
+import time
 
 command_pipe_path = "/tmp/dh_usb_camera_service_pipe"
 service_pid_file = "/tmp/dh_usb_camera_service.pid"
+# 查询类命令的回复管道前缀（实际路径后附加控制脚本 PID）和等待回复的超时时间（秒）
+reply_pipe_prefix = "/tmp/dh_usb_camera_service_reply"
+reply_timeout = 5.0
 
 
 def send_command(command):
@@ -31,6 +37,47 @@ def send_command(command):
         return False
 
 
+def query_service(command):
+    """
+    发送查询命令并等待服务通过回复管道返回 JSON
+    返回解析后的字典，失败或超时时返回 None
+    """
+    reply_path = f"{reply_pipe_prefix}_{os.getpid()}"
+    if os.path.exists(reply_path):
+        os.remove(reply_path)
+    os.mkfifo(reply_path)
+    
+    try:
+        # 先以非阻塞方式打开读端，服务端才能以非阻塞方式打开写端
+        fd = os.open(reply_path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            if not send_command(f"{command} {reply_path}"):
+                return None
+            
+            data = b""
+            deadline = time.monotonic() + reply_timeout
+            while not data.endswith(b"\n"):
+                remaining = deadline - time.monotonic()
+                readable, _, _ = select.select([fd], [], [], max(0, remaining))
+                if not readable:
+                    print(f"错误: 等待服务回复超时（{reply_timeout}秒）")
+                    return None
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            os.close(fd)
+    finally:
+        os.remove(reply_path)
+    
+    try:
+        return json.loads(data.decode())
+    except ValueError:
+        print("错误: 无法解析服务回复")
+        return None
+
+
 def check_service_running():
     """
     检查服务是否运行
@@ -60,12 +107,15 @@ def main():
         print("  start  或  1  - 启动录制")
         print("  stop   或  2  - 停止录制")
         print("  status        - 查看服务状态")
+        print("  stats         - 查看录制计数器（排队/丢弃/延迟帧数等）")
+        print("  snapshot [目录] - 将环形缓冲区中最近的帧保存到磁盘（服务需使用 --ring-seconds 启动）")
         print("")
         print("示例:")
         print("  python3 capture_dh_usb_control.py start")
         print("  python3 capture_dh_usb_control.py stop")
         print("  python3 capture_dh_usb_control.py 1")
         print("  python3 capture_dh_usb_control.py 2")
+        print("  python3 capture_dh_usb_control.py snapshot")
         sys.exit(1)
     
     command = sys.argv[1].strip().lower()
@@ -76,12 +126,14 @@ def main():
         "start": "1",
         "2": "2",
         "stop": "2",
-        "status": "status"
+        "status": "status",
+        "stats": "stats",
+        "snapshot": "snapshot"
     }
     
     if command not in command_map:
         print(f"错误: 未知命令 '{command}'")
-        print("可用命令: start/1, stop/2, status")
+        print("可用命令: start/1, stop/2, status, stats, snapshot")
         sys.exit(1)
     
     # 检查服务是否运行
@@ -90,8 +142,18 @@ def main():
         print("提示: 请先启动服务: python3 capture_dh_usb_service.py &")
         sys.exit(1)
     
+    if command == "stats":
+        stats = query_service("stats")
+        if stats is None:
+            sys.exit(1)
+        for key, value in stats.items():
+            print(f"{key}: {value}")
+        return
+    
     # 发送命令
     actual_command = command_map[command]
+    if command == "snapshot" and len(sys.argv) > 2:
+        actual_command += " " + sys.argv[2]
     if send_command(actual_command):
         if command == "status":
             print("状态查询已发送")
@@ -99,6 +161,8 @@ def main():
             print("启动录制命令已发送")
         elif command in ["2", "stop"]:
             print("停止录制命令已发送")
+        elif command == "snapshot":
+            print("快照命令已发送（保存结果见服务日志）")
     else:
         sys.exit(1)
 
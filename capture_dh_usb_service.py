@@ -9,119 +9,132 @@ DH USB 摄像头录制服务
 import cv2
 import sys
 import os
-import subprocess
+import json
 import time
 import numpy as np
 import signal
 import threading
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 
+from dh_usb_camera import (PIXEL_FORMAT_CHOICES, WARMUP_TOLERANCE, configure_capture, enable_passthrough,
+                           warmup_camera)
+from dh_usb_dedup import DEDUP_DISTANCE, DEDUP_MODES, HASHES, FrameDeduplicator
+from dh_usb_discovery import find_dh_usb_camera, invalidate_cached_camera
+from dh_usb_frame_source import BACKEND_OPENCV, BACKENDS, SOURCE_CAMERA, is_virtual_source, open_frame_source
+from dh_usb_hotplug import UeventMonitor
+from dh_usb_pack import PackPipeline
+from dh_usb_pipeline import (BACKPRESSURE_POLICIES, POLICY_DROP_NEWEST, SavePipeline, encode_jpeg,
+                             make_filename, write_file)
+from dh_usb_motion import MOTION_THRESHOLD, MotionGate
+from dh_usb_ring import FrameRing
+from dh_usb_scheduler import IntervalScheduler
+from dh_usb_scoring import frame_luminance
+from dh_usb_v4l2 import select_camera_mode
+from dh_usb_video import CONTAINERS, SEGMENT_SECONDS, SegmentPipeline
+
 
 # 全局变量
 recording = False
 recording_thread = None
 camera_device = None
 cap = None
+# 帧源：camera 表示 DH USB 摄像头，也可以是虚拟帧源描述（见 dh_usb_frame_source.open_virtual_source）
+camera_source = SOURCE_CAMERA
+# 当前摄像头是否处于 MJPEG 直通模式（retrieve() 返回 JPEG 数据而不是 BGR 图像）
+camera_passthrough = False
 command_pipe_path = "/tmp/dh_usb_camera_service_pipe"
 service_pid_file = "/tmp/dh_usb_camera_service.pid"
 # 录制频率（秒），启动时设置，运行期间不修改
 recording_interval = 1.0
+# 其他录制参数（服务启动时由命令行设置，启动录制时传给 start_recording）
+recording_options = {}
+# 当前录制的调度器和保存流水线（用于状态查询），以及停止录制时唤醒录制线程的事件
+recording_scheduler = None
+# 当前录制的运动门控（--motion 开启时）
+motion_gate = None
+save_pipeline = None
+recording_wakeup = threading.Event()
+# 截止时间前连续 grab() 的帧数：用于排空驱动缓冲区中的旧帧，保证保存的是最新帧
+DRAIN_FRAMES = 6
+# 无法获取摄像头帧率时假定的帧率
+DEFAULT_FPS = 30.0
+# 摄像头参数（启动录制时记录，断开重连时复用）
+camera_settings = {}
+# 热插拔状态：camera_attached 表示 camera_device 当前可用，变化时通知 camera_condition
+hotplug_monitor = None
+camera_condition = threading.Condition()
+camera_attached = False
+camera_lost_time = None
+last_recovery_seconds = None
+# 最近一次预热的结果（dh_usb_camera.WarmupResult）
+last_warmup = None
+# 待机保温：录制停止后保持摄像头打开并持续取帧（只 grab 不解码），下次启动无需重新初始化
+standby_enabled = False
+standby_thread = None
+standby_stop = threading.Event()
+# 待机期间每隔 STANDBY_CHECK_SECONDS 解码一帧检查亮度
+STANDBY_CHECK_SECONDS = 2.0
+standby_luminance = None
+# 每次启动命令的启动延迟（从收到命令到保存第一帧，秒）
+start_latencies = deque(maxlen=100)
+# 帧环形缓冲区（--ring-seconds 开启），待机和录制期间持续保留最近的帧，snapshot 命令写入磁盘
+frame_ring = None
+SNAPSHOT_DIR = "snapshots"
 
 
-def find_dh_usb_camera():
-    """
-    查找 DH USB 摄像头设备
-    返回设备路径（如 /dev/video2），如果未找到则返回 None
-    """
-    print("正在查找 DH USB 摄像头...")
-    
-    # 方法1: 通过 udevadm 查找
-    try:
-        for dev in ['/dev/video0', '/dev/video1', '/dev/video2', '/dev/video3', 
-                   '/dev/video4', '/dev/video5', '/dev/video6', '/dev/video7']:
-            if not os.path.exists(dev):
-                continue
-                
-            try:
-                result = subprocess.run(
-                    ['udevadm', 'info', '--query=all', '--name', dev],
-                    capture_output=True,
-                    text=True,
-                    timeout=2
-                )
-                
-                # 检查是否包含 DH USB 相关信息
-                if 'DH' in result.stdout or 'DH_USB' in result.stdout:
-                    # 验证这个设备是否可以打开
-                    test_cap = cv2.VideoCapture(dev)
-                    if test_cap.isOpened():
-                        ret, _ = test_cap.read()
-                        test_cap.release()
-                        if ret:
-                            print(f"找到 DH USB 摄像头: {dev}")
-                            return dev
-                    test_cap.release()
-            except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-                continue
-    except Exception as e:
-        print(f"使用 udevadm 查找时出错: {e}")
-    
-    # 方法2: 尝试常见的 DH USB 设备索引（通常是 video2 或 video3）
-    print("尝试通过设备索引查找...")
-    for idx in [2, 3, 4, 5]:
-        dev = f'/dev/video{idx}'
-        if os.path.exists(dev):
-            test_cap = cv2.VideoCapture(idx)
-            if test_cap.isOpened():
-                ret, _ = test_cap.read()
-                test_cap.release()
-                if ret:
-                    # 再次验证是否是 DH USB
-                    try:
-                        result = subprocess.run(
-                            ['udevadm', 'info', '--query=all', '--name', dev],
-                            capture_output=True,
-                            text=True,
-                            timeout=2
-                        )
-                        if 'DH' in result.stdout or 'DH_USB' in result.stdout:
-                            print(f"找到 DH USB 摄像头: {dev} (索引 {idx})")
-                            return idx
-                    except:
-                        print(f"找到可用摄像头: {dev} (索引 {idx})，假设是 DH USB")
-                        return idx
-            test_cap.release()
-    
-    return None
-
-
-def initialize_camera(width=1920, height=1080, warmup_seconds=3, warmup_frames=30):
+def initialize_camera(width=1920, height=1080, warmup_seconds=3, warmup_frames=30, pixel_format="auto",
+                      passthrough=False, backend=BACKEND_OPENCV, adaptive_warmup=True,
+                      warmup_tolerance=WARMUP_TOLERANCE):
     """
     初始化摄像头并预热
+    passthrough 为 True 时使用 MJPEG 像素格式并直接保存摄像头输出的 JPEG 数据
+    backend 为采集后端（见 dh_usb_frame_source.BACKENDS）
+    adaptive_warmup 为 True 时亮度稳定后提前结束预热，warmup_frames/warmup_seconds 只作为上限
     """
-    global camera_device, cap
+    global camera_device, cap, camera_attached, camera_passthrough, last_warmup
+    
+    if passthrough:
+        pixel_format = "MJPG"
     
-    if camera_device is None:
-        camera_device = find_dh_usb_camera()
+    virtual = is_virtual_source(camera_source)
+    if virtual:
+        # 虚拟帧源不需要查找和查询摄像头
+        camera_device = camera_source
+        mode = None
+    else:
         if camera_device is None:
-            print("错误: 未找到 DH USB 摄像头")
-            return False
+            camera_device = find_dh_usb_camera()
+            if camera_device is None:
+                print("错误: 未找到 DH USB 摄像头")
+                return False
+        
+        # 打开前通过 V4L2 查询选择满足请求分辨率的最快模式
+        print("正在查询摄像头支持的模式...")
+        mode = select_camera_mode(camera_device, width, height, pixel_format)
     
     print(f"正在打开摄像头: {camera_device}")
-    cap = cv2.VideoCapture(camera_device)
+    try:
+        cap = open_frame_source(camera_device, backend)
+    except ValueError as e:
+        print(f"错误: {e}")
+        cap = None
+        return False
     
     if not cap.isOpened():
         print(f"错误: 无法打开摄像头 {camera_device}")
+        if not virtual:
+            # 设备可能已重新枚举，清除缓存，下次启动时重新查找
+            invalidate_cached_camera(dev_path=camera_device)
+            camera_device = None
         return False
     
-    print(f"设置分辨率: {width}x{height}")
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    with camera_condition:
+        camera_attached = True
     
-    actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    print(f"实际分辨率: {actual_width}x{actual_height}")
+    configure_capture(cap, mode, width, height, pixel_format)
+    camera_passthrough = enable_passthrough(cap) if passthrough else False
     
     # 尝试启用自动曝光
     try:
@@ -129,17 +142,8 @@ def initialize_camera(width=1920, height=1080, warmup_seconds=3, warmup_frames=3
     except:
         pass
     
-    print(f"正在预热摄像头（调整曝光）...")
-    print(f"  预热帧数: {warmup_frames}, 等待时间: {warmup_seconds}秒")
-    for i in range(warmup_frames):
-        ret, _ = cap.read()
-        if not ret:
-            break
-        if (i + 1) % 10 == 0:
-            print(f"  预热进度: {i + 1}/{warmup_frames} 帧")
-    
-    print(f"等待曝光稳定 ({warmup_seconds}秒)...")
-    time.sleep(warmup_seconds)
+    last_warmup = warmup_camera(cap, warmup_frames, warmup_seconds, mode.max_fps if mode else None,
+                                adaptive=adaptive_warmup, tolerance=warmup_tolerance)
     
     print("摄像头初始化完成，准备录制")
     return True
@@ -150,23 +154,218 @@ def close_camera():
     关闭摄像头
     """
     global cap
+    leave_standby()
     if cap is not None:
         cap.release()
         cap = None
         print("摄像头已关闭")
 
 
-def save_image(frame, output_dir="recordings"):
+def standby_loop():
+    """
+    待机保温循环：持续 grab() 保持驱动缓冲区为最新帧、摄像头保持出流以便自动曝光持续调整，
+    不解码帧（只定期解码一帧记录亮度），CPU 占用很低；开启帧环形缓冲区时每帧存入缓冲区
+    """
+    global standby_luminance
+    
+    last_check = 0.0
+    while not standby_stop.is_set():
+        if cap is None or not cap.grab():
+            print("警告: 待机期间无法读取摄像头帧，退出待机，下次启动时重新初始化摄像头")
+            threading.Thread(target=close_camera, daemon=True).start()
+            return
+        now = time.monotonic()
+        if frame_ring is not None:
+            frame_ring.offer(cap, now, camera_passthrough)
+        if now - last_check >= STANDBY_CHECK_SECONDS:
+            ret, frame = cap.retrieve()
+            if ret:
+                standby_luminance = frame_luminance(frame)
+            last_check = now
+
+
+def enter_standby():
+    """
+    摄像头已打开时进入待机保温状态
+    """
+    global standby_thread
+    
+    if standby_thread is not None or cap is None or not cap.isOpened():
+        return False
+    standby_stop.clear()
+    standby_thread = threading.Thread(target=standby_loop, name="dh_usb_standby", daemon=True)
+    standby_thread.start()
+    print("摄像头待机保温中（保持打开，下次启动立即开始录制）")
+    return True
+
+
+def leave_standby():
+    """
+    停止待机取帧（最多等待一帧时间），摄像头保持打开
+    待机线程在一次成功的 grab() 之后退出，此时摄像头持有刚取到的最新帧，可直接 retrieve()
+    返回之前是否处于待机状态
+    """
+    global standby_thread
+    
+    thread = standby_thread
+    if thread is None:
+        return False
+    standby_stop.set()
+    if thread is not threading.current_thread():
+        thread.join()
+    standby_thread = None
+    return True
+
+
+def start_standby():
+    """
+    服务启动时按录制参数打开并预热摄像头，进入待机保温状态
+    """
+    settings = {key: recording_options[key] for key in
+                ("pixel_format", "passthrough", "backend", "adaptive_warmup", "warmup_tolerance")
+                if key in recording_options}
+    print("待机模式：预先打开并预热摄像头...")
+    if not initialize_camera(**settings):
+        print("警告: 摄像头初始化失败，启动录制时将重试")
+        return False
+    return enter_standby()
+
+
+def dump_ring(output_dir=None):
     """
-    保存图像到文件
+    将帧环形缓冲区中最近的帧写入磁盘（snapshot 命令，在后台线程中执行，不阻塞命令监听）
+    默认写入 snapshots/snapshot_YYYYMMDD_HHMMSS
+    """
+    if frame_ring is None:
+        print("帧环形缓冲区未开启（使用 --ring-seconds 启动服务）")
+        return False
+    if output_dir is None:
+        output_dir = os.path.join(SNAPSHOT_DIR, f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    
+    def dump():
+        start = time.monotonic()
+        frames, written = frame_ring.dump(output_dir)
+        print(f"快照已保存到 {output_dir}: {frames} 帧，{written / 1024 / 1024:.1f} MB，"
+              f"用时 {time.monotonic() - start:.2f} 秒")
+    
+    threading.Thread(target=dump, name="dh_usb_snapshot", daemon=True).start()
+    return True
+
+
+def handle_uevent(event):
+    """
+    热插拔事件处理：摄像头移除时标记不可用，新设备接入时重新查找 DH 摄像头
+    """
+    global camera_device, camera_attached, camera_lost_time
+    
+    if event.action == "remove":
+        if camera_device is None or event.devname != os.path.basename(str(camera_device)):
+            return
+        print(f"\n检测到摄像头移除: {camera_device}")
+        invalidate_cached_camera(dev_path=camera_device)
+        with camera_condition:
+            camera_device = None
+            camera_attached = False
+            if camera_lost_time is None:
+                camera_lost_time = time.monotonic()
+            camera_condition.notify_all()
+    elif event.action == "add":
+        if camera_attached:
+            return
+        device = find_dh_usb_camera(verify=False)
+        if device is None:
+            return
+        print(f"检测到摄像头接入: {device}")
+        with camera_condition:
+            camera_device = device
+            camera_attached = True
+            camera_condition.notify_all()
+
+
+def start_hotplug_monitor():
+    """
+    启动热插拔监听，无法打开 netlink 套接字时返回 False
+    """
+    global hotplug_monitor
+    
+    monitor = UeventMonitor(handle_uevent)
+    try:
+        monitor.start()
+    except OSError as e:
+        print(f"警告: 无法监听热插拔事件（{e}），摄像头断开后需重新启动录制")
+        return False
+    hotplug_monitor = monitor
+    print("热插拔监听已启动")
+    return True
+
+
+def stop_hotplug_monitor():
+    """
+    停止热插拔监听
+    """
+    global hotplug_monitor
+    if hotplug_monitor is not None:
+        hotplug_monitor.stop()
+        hotplug_monitor = None
+
+
+def reattach_camera():
+    """
+    摄像头读取失败后阻塞等待热插拔事件（不轮询），设备可用时重新打开摄像头
+    返回断开时刻（time.monotonic()），录制已停止时返回 None
+    """
+    global camera_attached, camera_lost_time
+    
+    with camera_condition:
+        lost_time = camera_lost_time if camera_lost_time is not None else time.monotonic()
+    close_camera()
+    print("警告: 无法读取摄像头帧，等待摄像头重新连接...")
+    
+    while recording:
+        with camera_condition:
+            camera_condition.wait_for(lambda: camera_attached or not recording)
+        if not recording:
+            return None
+        if initialize_camera(**camera_settings):
+            with camera_condition:
+                camera_lost_time = None
+            return lost_time
+        # 打开失败（例如 udev 尚未设置设备权限），等待下一次插入事件
+        with camera_condition:
+            camera_attached = False
+    return None
+
+
+def save_image(frame, output_dir="recordings", quality=95, dedup=None):
+    """
+    同步保存图像到文件（录制循环使用 SavePipeline 异步保存）
+    dedup 为 FrameDeduplicator 时，与上一次保存的帧重复的帧跳过或硬链接到上一次保存的文件
     """
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-    filename = f"dh_usb_{timestamp}.jpg"
+    filename = make_filename(datetime.now())
     filepath = os.path.join(output_dir, filename)
     
-    success = cv2.imwrite(filepath, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    link = dedup.check(frame, filename) if dedup is not None else None
+    if link is not None:
+        if dedup.mode == "skip":
+            print(f"  [{datetime.now().strftime('%H:%M:%S')}] 重复帧，跳过: {filename}")
+            return True
+        try:
+            os.link(os.path.join(output_dir, link), filepath)
+        except OSError as e:
+            print(f"  错误: 无法创建硬链接 {filename} -> {link}: {e}")
+            return False
+        print(f"  [{datetime.now().strftime('%H:%M:%S')}] 重复帧: {filename} -> {link}")
+        return True
+    
+    data = encode_jpeg(frame, quality)
+    success = data is not None and write_file(filepath, data)
+    if dedup is not None:
+        if success:
+            dedup.record_written(len(data))
+        else:
+            dedup.reset()
     
     if success:
         print(f"  [{datetime.now().strftime('%H:%M:%S')}] 保存: {filename}")
@@ -176,62 +375,203 @@ def save_image(frame, output_dir="recordings"):
     return success
 
 
-def recording_loop(output_dir="recordings", interval=1.0):
+def recording_loop(output_dir="recordings", interval=1.0, encoder_workers=2, pipeline=None,
+                   backpressure=POLICY_DROP_NEWEST, requested_at=None, immediate=False, pending_grab=False,
+                   motion_threshold=None, motion_keepalive=0.0, dedup=None, dedup_distance=DEDUP_DISTANCE,
+                   dedup_hash="dhash", container="jpeg", segment_seconds=SEGMENT_SECONDS, segment_mb=0,
+                   pack_sync=0.0):
     """
-    录制循环：每隔指定时间保存一帧图像
+    录制循环：在绝对截止时间 t0 + k*interval 保存一帧图像（只解码需要保存的帧）
+    距下一个截止时间较远时休眠，截止时间前的短窗口内连续 grab() 排空驱动缓冲区
+    保存的帧交给 SavePipeline 异步编码和写盘，录制线程不等待编码和磁盘 I/O
+    
+    参数:
+        output_dir: 保存目录
+        interval: 保存间隔（秒）
+        encoder_workers: 编码线程数
+        pipeline: 自定义保存流水线（需提供 start/submit/close/summary/format_summary），默认新建 SavePipeline；
+            submit(frame, captured_at, encoded=..., force=...) 返回是否接受该帧，force 为 True 时不得按去重跳过
+            summary() 返回的字典至少包含 saved（已写入帧数）和 dropped（丢弃帧数），可选 linked（硬链接的重复帧数）
+        backpressure: 保存队列积压时的背压策略（见 dh_usb_pipeline.BACKPRESSURE_POLICIES）
+        requested_at: 收到启动命令的时刻（time.monotonic()），用于统计启动延迟
+        immediate: 是否立即保存第一帧（摄像头已预热时），否则第一帧在一个间隔之后
+        pending_grab: 摄像头是否已持有刚 grab() 的帧（从待机转入录制时），第一次循环直接使用该帧
+        motion_threshold: 运动门控阈值（变化像素占比 %），None 表示每个时间点都保存；
+            开启后与上一次保存的帧相比变化不足阈值的时间点跳过不保存
+        motion_keepalive: 运动门控开启时，画面不变的情况下至少每隔多少秒保存一帧，0 表示不保活
+        dedup: 重复帧处理方式（None、"skip" 或 "link"），与上一次保存的帧感知哈希距离不超过 dedup_distance 时
+            跳过或硬链接到上一次保存的文件
+        dedup_distance: 视为重复帧的最大汉明距离（64 位哈希）
+        dedup_hash: 感知哈希方式（dhash 或 ahash）
+        container: 保存格式，jpeg（每帧一个 JPEG 文件）、pack（追加到打包文件，见 dh_usb_pack）
+            或 CONTAINERS 中的视频格式（按时长/大小滚动的分段视频）
+        segment_seconds: 视频分段/打包文件时长（秒）
+        segment_mb: 视频分段/打包文件大小上限（MB），0 表示不限制
+        pack_sync: 打包模式下每隔多少秒 fsync 一次，0 表示只在文件结束时 fsync
     """
-    global recording, cap
+    global recording, cap, last_recovery_seconds, recording_scheduler, save_pipeline, motion_gate
     
     print(f"开始录制，保存目录: {output_dir}")
     print(f"录制间隔: {interval}秒")
     
     frame_count = 0
-    last_save_time = time.time()
+    recovery_start = None
+    fps = cap.get(cv2.CAP_PROP_FPS) if cap is not None else 0
+    drain_seconds = DRAIN_FRAMES / (fps if fps and fps > 0 else DEFAULT_FPS)
+    scheduler = IntervalScheduler(interval)
+    recording_scheduler = scheduler
+    gate = None
+    if motion_threshold is not None:
+        gate = MotionGate(motion_threshold, motion_keepalive)
+        print(f"运动门控: 变化像素超过 {motion_threshold:g}% 时保存"
+              + (f"，画面不变时每 {motion_keepalive:g} 秒保活保存一帧" if motion_keepalive > 0 else ""))
+    motion_gate = gate
+    if pipeline is None:
+        deduplicator = FrameDeduplicator(dedup, dedup_distance, dedup_hash) if dedup else None
+        if container == "jpeg":
+            pipeline = SavePipeline(output_dir, encoder_workers=encoder_workers, policy=backpressure,
+                                    dedup=deduplicator)
+        elif container == "pack":
+            pipeline = PackPipeline(output_dir, encoder_workers=encoder_workers, pack_seconds=segment_seconds,
+                                    pack_bytes=int(segment_mb * 1e6), sync_seconds=pack_sync,
+                                    policy=backpressure, dedup=deduplicator)
+        else:
+            pipeline = SegmentPipeline(output_dir, container=container, fps=1.0 / interval,
+                                       segment_seconds=segment_seconds, segment_bytes=int(segment_mb * 1e6),
+                                       policy=backpressure, dedup=deduplicator)
+    save_pipeline = pipeline.start()
+    scheduler.start(immediate=immediate)
     
     while recording:
         if cap is None or not cap.isOpened():
             print("错误: 摄像头未打开")
             break
         
-        ret, frame = cap.read()
+        # 开启帧环形缓冲区时不休眠，每帧都 grab() 并存入缓冲区
+        sleep_seconds = scheduler.time_until_deadline() - drain_seconds
+        if sleep_seconds > 0 and frame_ring is None:
+            recording_wakeup.wait(sleep_seconds)
+            continue
         
-        if ret and frame is not None:
-            current_time = time.time()
+        # 每帧只 grab() 以保持驱动队列最新，到保存时间才 retrieve() 解码，
+        # 避免解码随后被丢弃的帧
+        if pending_grab or cap.grab():
+            pending_grab = False
+            if recovery_start is not None:
+                last_recovery_seconds = time.monotonic() - recovery_start
+                recovery_start = None
+                print(f"摄像头已恢复，继续录制（恢复用时 {last_recovery_seconds:.2f} 秒）")
             
-            # 每隔指定时间保存一次
-            if current_time - last_save_time >= interval:
-                save_image(frame, output_dir)
-                last_save_time = current_time
-                frame_count += 1
+            # 到达截止时间后保存第一帧，抖动按取帧时刻计算
+            grab_time = time.monotonic()
+            stored = frame_ring.offer(cap, grab_time, camera_passthrough) if frame_ring is not None else None
+            if scheduler.is_due(grab_time):
+                if stored is not None:
+                    ret, frame = True, stored
+                else:
+                    ret, frame = cap.retrieve()
+                if ret and frame is not None:
+                    motion = gate.check(frame, grab_time) if gate is not None else None
+                    if motion is not None and motion[0] is None:
+                        # 画面没有变化，跳过这个时间点
+                        scheduler.record_skip(grab_time)
+                        continue
+                    # 环形缓冲区槽位之后会被覆盖；零拷贝后端直通时 frame 是驱动缓冲区的视图，
+                    # 下一次 grab() 后失效，提交前都需要复制
+                    if stored is not None or (camera_passthrough and getattr(cap, "zero_copy", False)):
+                        frame = frame.copy()
+                    # 保活帧用于确认录制仍在运行，画面不变时也不能被去重跳过
+                    keepalive = motion is not None and motion[0] == "keepalive"
+                    if not pipeline.submit(frame, datetime.now(), encoded=camera_passthrough, force=keepalive):
+                        # 重复帧被跳过或队列已满被丢弃，这个时间点没有保存（运动门控的参考帧不变）
+                        scheduler.record_skip(grab_time)
+                        continue
+                    if motion is not None:
+                        gate.commit(motion[1], grab_time, motion[0])
+                    scheduler.record_save(grab_time)
+                    frame_count += 1
+                    if frame_count == 1 and requested_at is not None:
+                        start_latencies.append(grab_time - requested_at)
+                        print(f"启动延迟: {(grab_time - requested_at) * 1000:.1f} ms（从收到命令到保存第一帧）")
+                else:
+                    print("警告: 无法解码摄像头帧")
+        elif getattr(cap, "exhausted", False):
+            print("帧源已播放完毕，停止录制")
+            recording = False
+            break
+        elif hotplug_monitor is not None:
+            recovery_start = reattach_camera()
+            if recovery_start is None:
+                break
         else:
             print("警告: 无法读取摄像头帧")
             time.sleep(0.1)
     
-    print(f"录制已停止，共保存 {frame_count} 帧图像")
-    close_camera()
+    # 等待队列中的帧全部写入磁盘
+    pipeline.close()
+    # 按流水线实际写入的帧数报告（drop-oldest 策略下已提交的帧之后仍可能被丢弃）
+    saved = pipeline.summary()
+    linked = saved.get("linked", 0)
+    print(f"录制已停止，共保存 {saved['saved']} 帧图像"
+          + (f"，另有 {linked} 个重复帧硬链接到已保存的图像" if linked else "")
+          + f"，丢弃 {saved['dropped']} 帧")
+    print(f"调度统计: {scheduler.format_summary()}")
+    print(f"保存统计: {pipeline.format_summary()}")
+    if gate is not None:
+        print(f"运动门控: {gate.format_summary()}")
+    # 待机模式下由 stop_recording() 转入待机，保持摄像头打开
+    if not standby_enabled:
+        close_camera()
 
 
 def start_recording(output_dir="recordings", interval=1.0, width=1920, height=1080, 
-                   warmup_seconds=3, warmup_frames=30):
+                   warmup_seconds=3, warmup_frames=30, pixel_format="auto", encoder_workers=2,
+                   backpressure=POLICY_DROP_NEWEST, passthrough=False, backend=BACKEND_OPENCV,
+                   adaptive_warmup=True, warmup_tolerance=WARMUP_TOLERANCE, motion_threshold=None,
+                   motion_keepalive=0.0, dedup=None, dedup_distance=DEDUP_DISTANCE, dedup_hash="dhash",
+                   container="jpeg", segment_seconds=SEGMENT_SECONDS, segment_mb=0, pack_sync=0.0,
+                   requested_at=None):
     """
     启动录制
+    摄像头处于待机保温状态时跳过初始化，立即保存第一帧
+    requested_at 为收到启动命令的时刻（time.monotonic()），默认为调用时刻
     """
-    global recording, recording_thread
+    global recording, recording_thread, camera_settings
     
     if recording:
         print("录制已在运行中")
         return False
     
+    requested_at = time.monotonic() if requested_at is None else requested_at
     print("准备启动录制...")
     
-    if not initialize_camera(width, height, warmup_seconds, warmup_frames):
+    camera_settings = {
+        "width": width,
+        "height": height,
+        "warmup_seconds": warmup_seconds,
+        "warmup_frames": warmup_frames,
+        "pixel_format": pixel_format,
+        "passthrough": passthrough,
+        "backend": backend,
+        "adaptive_warmup": adaptive_warmup,
+        "warmup_tolerance": warmup_tolerance,
+    }
+    warm = leave_standby() and cap is not None and cap.isOpened()
+    if warm:
+        print("摄像头已预热（待机保温），跳过初始化")
+    elif not initialize_camera(**camera_settings):
         return False
     
     # 启动录制线程
+    recording_wakeup.clear()
     recording = True
     recording_thread = threading.Thread(
         target=recording_loop,
-        args=(output_dir, interval),
+        args=(output_dir, interval, encoder_workers, None, backpressure, requested_at, warm, warm),
+        kwargs={"motion_threshold": motion_threshold, "motion_keepalive": motion_keepalive,
+                "dedup": dedup, "dedup_distance": dedup_distance, "dedup_hash": dedup_hash,
+                "container": container, "segment_seconds": segment_seconds, "segment_mb": segment_mb,
+                "pack_sync": pack_sync},
         daemon=True
     )
     recording_thread.start()
@@ -239,9 +579,10 @@ def start_recording(output_dir="recordings", interval=1.0, width=1920, height=10
     return True
 
 
-def stop_recording():
+def stop_recording(keep_warm=True):
     """
     停止录制
+    开启待机模式且 keep_warm 为 True 时摄像头转入待机保温状态，否则关闭
     """
     global recording
     
@@ -251,22 +592,81 @@ def stop_recording():
     
     print("正在停止录制...")
     recording = False
+    # 唤醒正在休眠等待截止时间或等待摄像头重新连接的录制线程
+    recording_wakeup.set()
+    with camera_condition:
+        camera_condition.notify_all()
     
     # 等待录制线程结束
     if recording_thread is not None:
         recording_thread.join(timeout=5)
     
+    if standby_enabled:
+        if not keep_warm or not enter_standby():
+            close_camera()
+    
     print("录制已停止")
     return True
 
 
+def get_service_stats():
+    """
+    汇总服务状态和录制计数器（供 stats 命令返回）
+    late 为错过的保存时间点数
+    """
+    stats = {
+        "recording": recording,
+        "camera": camera_device,
+        "camera_attached": camera_attached,
+        "last_recovery_seconds": last_recovery_seconds,
+        "warmup_seconds": last_warmup.seconds if last_warmup else None,
+        "warmup_converged": last_warmup.converged if last_warmup else None,
+        "standby": standby_thread is not None,
+        "standby_luminance": standby_luminance,
+        "start_latency_ms": start_latencies[-1] * 1000 if start_latencies else None,
+        "start_latency_max_ms": max(start_latencies) * 1000 if start_latencies else None,
+    }
+    if save_pipeline is not None:
+        stats.update(save_pipeline.summary())
+        stats["latency_ms"] = save_pipeline.latency_summary()
+    if recording_scheduler is not None:
+        schedule = recording_scheduler.summary()
+        stats["late"] = schedule.pop("missed")
+        stats.update(schedule)
+    if motion_gate is not None:
+        stats.update(motion_gate.summary())
+    if frame_ring is not None:
+        stats.update(frame_ring.summary())
+    return stats
+
+
+def reply_stats(reply_path):
+    """
+    将统计信息以 JSON 写入控制脚本创建的回复管道，并在日志中打印
+    """
+    stats = get_service_stats()
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+    if not reply_path:
+        return
+    try:
+        # 非阻塞打开：控制脚本已退出（没有读端）时立即失败，不会卡住命令监听
+        fd = os.open(reply_path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as e:
+        print(f"无法打开回复管道 {reply_path}: {e}")
+        return
+    with os.fdopen(fd, 'w') as reply:
+        reply.write(json.dumps(stats, ensure_ascii=False) + '\n')
+
+
 def signal_handler(signum, frame):
     """
     信号处理：优雅退出
     """
     print(f"\n收到信号 {signum}，正在退出...")
-    stop_recording()
+    stop_recording(keep_warm=False)
     close_camera()
+    stop_hotplug_monitor()
     # 清理管道和PID文件
     if os.path.exists(command_pipe_path):
         os.remove(command_pipe_path)
@@ -299,6 +699,7 @@ def command_listener(interval=1.0):
             # 打开管道读取命令（阻塞等待）
             with open(command_pipe_path, 'r') as pipe:
                 command = pipe.read().strip()
+            received_at = time.monotonic()
                 
             if not command:
                 continue
@@ -306,21 +707,43 @@ def command_listener(interval=1.0):
             print(f"\n收到命令: {command}")
             
             if command == "1" or command.lower() == "start":
-                start_recording(interval=recording_interval)
+                start_recording(interval=recording_interval, requested_at=received_at, **recording_options)
             elif command == "2" or command.lower() == "stop":
                 stop_recording()
             elif command.lower() == "status":
                 if recording:
                     print("状态: 正在录制")
+                    if recording_scheduler is not None:
+                        print(f"调度统计: {recording_scheduler.format_summary()}")
+                    if save_pipeline is not None:
+                        print(f"保存统计: {save_pipeline.format_summary()}")
+                    if motion_gate is not None:
+                        print(f"运动门控: {motion_gate.format_summary()}")
                 else:
-                    print("状态: 未录制")
+                    print("状态: 未录制" + ("（摄像头待机保温中）" if standby_thread is not None else ""))
+                if frame_ring is not None:
+                    ring = frame_ring.summary()
+                    print(f"环形缓冲区: {ring['ring_frames']}/{ring['ring_capacity']} 帧（{ring['ring_seconds_held']} 秒）")
+                if start_latencies:
+                    print(f"最近一次启动延迟: {start_latencies[-1] * 1000:.1f} ms")
+                if hotplug_monitor is not None:
+                    print(f"摄像头: {camera_device if camera_attached else '未连接'}")
+                    if last_recovery_seconds is not None:
+                        print(f"最近一次断开恢复用时: {last_recovery_seconds:.2f} 秒")
+            elif command.lower().split()[0] == "snapshot":
+                parts = command.split(maxsplit=1)
+                dump_ring(parts[1] if len(parts) > 1 else None)
+            elif command.lower().split()[0] == "stats":
+                parts = command.split(maxsplit=1)
+                reply_stats(parts[1] if len(parts) > 1 else None)
             elif command.lower() == "quit" or command.lower() == "exit":
                 print("收到退出命令")
-                stop_recording()
+                stop_recording(keep_warm=False)
                 break
             else:
                 print(f"未知命令: {command}")
-                print("可用命令: 1/start (启动录制), 2/stop (停止录制), status (状态), quit/exit (退出)")
+                print("可用命令: 1/start (启动录制), 2/stop (停止录制), status (状态), stats (统计), "
+                      "snapshot [目录] (保存环形缓冲区), quit/exit (退出)")
         
         except Exception as e:
             print(f"处理命令时出错: {e}")
@@ -331,6 +754,8 @@ def main():
     """
     主函数
     """
+    global camera_source, standby_enabled, frame_ring
+    
     import argparse
     
     parser = argparse.ArgumentParser(
@@ -341,6 +766,19 @@ def main():
   python3 capture_dh_usb_service.py                    # 使用默认频率 1秒
   python3 capture_dh_usb_service.py --interval 2       # 每2秒捕获一次
   python3 capture_dh_usb_service.py -i 0.5              # 每0.5秒捕获一次
+  python3 capture_dh_usb_service.py --pixel-format MJPG  # 强制使用 MJPG 像素格式
+  python3 capture_dh_usb_service.py -i 0.05 --encoder-workers 4  # 高频录制，使用 4 个编码线程
+  python3 capture_dh_usb_service.py --backpressure drop-oldest    # 积压时丢弃最旧的帧
+  python3 capture_dh_usb_service.py --passthrough                 # 直接保存摄像头输出的 MJPEG 数据
+  python3 capture_dh_usb_service.py --backend v4l2 --passthrough  # V4L2 mmap 后端，直通时不经过 OpenCV
+  python3 capture_dh_usb_service.py --standby                     # 待机保温，启动命令立即开始录制
+  python3 capture_dh_usb_service.py --motion --motion-keepalive 60  # 画面变化时才保存，不变时每 60 秒保存一帧
+  python3 capture_dh_usb_service.py --dedup link                  # 与上一帧几乎相同的帧硬链接到上一个文件
+  python3 capture_dh_usb_service.py -i 0.1 --container avi --segment-seconds 600  # 写入 10 分钟一段的 MJPEG AVI
+  python3 capture_dh_usb_service.py -i 0.05 --container pack --passthrough  # 追加到打包文件（带索引，可随机读取）
+  python3 capture_dh_usb_service.py --passthrough --ring-seconds 10  # 保留最近 10 秒的帧，snapshot 命令保存
+  python3 capture_dh_usb_service.py --source synthetic:fps=60     # 合成图像帧源，无需摄像头
+  python3 capture_dh_usb_service.py --source replay:recordings    # 回放录制目录
         """
     )
     parser.add_argument(
@@ -349,6 +787,162 @@ def main():
         default=1.0,
         help='录制频率（秒），即每隔多少秒捕获一次图像，默认 1.0 秒'
     )
+    parser.add_argument(
+        '--pixel-format',
+        type=str,
+        choices=PIXEL_FORMAT_CHOICES,
+        default='auto',
+        help='像素格式，默认 auto（选择 1080p 下帧率最高的格式，通常为 MJPG）'
+    )
+    
+    parser.add_argument(
+        '--encoder-workers',
+        type=int,
+        default=2,
+        help='JPEG 编码线程数，默认 2'
+    )
+    
+    parser.add_argument(
+        '--backpressure',
+        type=str,
+        choices=BACKPRESSURE_POLICIES,
+        default=POLICY_DROP_NEWEST,
+        help='保存队列积压时的处理策略：block（等待）、drop-newest（丢弃新帧，默认）、'
+             'drop-oldest（丢弃最旧的帧）、degrade-quality（降低 JPEG 质量）'
+    )
+    
+    parser.add_argument(
+        '--passthrough',
+        action='store_true',
+        help='MJPEG 直通：使用 MJPG 像素格式并直接保存摄像头压缩好的 JPEG 数据（不解码、不重新编码）'
+    )
+    
+    parser.add_argument(
+        '--backend',
+        type=str,
+        choices=BACKENDS,
+        default=BACKEND_OPENCV,
+        help='采集后端：opencv（cv2.VideoCapture，默认）或 v4l2（V4L2 mmap 零拷贝）'
+    )
+    
+    parser.add_argument(
+        '--fixed-warmup',
+        action='store_true',
+        help='固定预热：读取 30 帧后再等待 3 秒（默认在亮度稳定后提前结束，两者只作为上限）'
+    )
+    
+    parser.add_argument(
+        '--warmup-tolerance',
+        type=float,
+        default=WARMUP_TOLERANCE,
+        help=f'自适应预热的亮度收敛容差（0-255 灰度级），默认 {WARMUP_TOLERANCE:g}'
+    )
+    
+    parser.add_argument(
+        '--standby',
+        action='store_true',
+        help='待机保温：服务启动时即打开并预热摄像头，录制停止后保持打开并持续取帧（不解码），'
+             '启动命令无需重新初始化，立即保存第一帧'
+    )
+    
+    parser.add_argument(
+        '--motion',
+        action='store_true',
+        help='运动门控：每个保存时间点先与上一次保存的帧比较（缩小灰度图），变化不足阈值时跳过，'
+             '适合画面长时间静止的无人值守录制'
+    )
+    
+    parser.add_argument(
+        '--motion-threshold',
+        type=float,
+        default=MOTION_THRESHOLD,
+        help=f'运动门控阈值：变化像素占比（%%），默认 {MOTION_THRESHOLD:g}'
+    )
+    
+    parser.add_argument(
+        '--motion-keepalive',
+        type=float,
+        default=0,
+        help='运动门控开启时，画面不变的情况下至少每隔多少秒保存一帧，默认 0（不保活）'
+    )
+    
+    parser.add_argument(
+        '--dedup',
+        type=str,
+        choices=DEDUP_MODES,
+        default=None,
+        help='重复帧去重：保存前计算感知哈希，与上一次保存的帧几乎相同时 skip（不保存）'
+             '或 link（硬链接到上一次保存的文件，文件序列保持完整），默认不去重'
+    )
+    
+    parser.add_argument(
+        '--dedup-distance',
+        type=int,
+        default=DEDUP_DISTANCE,
+        help=f'视为重复帧的最大汉明距离（64 位哈希，0-64），默认 {DEDUP_DISTANCE}'
+    )
+    
+    parser.add_argument(
+        '--dedup-hash',
+        type=str,
+        choices=sorted(HASHES),
+        default='dhash',
+        help='感知哈希方式：dhash（相邻像素差，默认）或 ahash（与平均亮度比较）'
+    )
+    
+    parser.add_argument(
+        '--container',
+        type=str,
+        choices=("jpeg", "pack") + tuple(CONTAINERS),
+        default='jpeg',
+        help='保存格式：jpeg（每帧一个 JPEG 文件，默认）、pack（JPEG 数据追加到 .pack 文件，'
+             '.idx 索引记录偏移、长度、时间戳和评分，用 dh_usb_pack.PackReader 随机读取）、'
+             'avi（MJPEG AVI 分段）或 mp4（mp4v 分段）；视频分段旁边写入同名 .csv 索引记录每帧的采集时刻'
+    )
+    
+    parser.add_argument(
+        '--segment-seconds',
+        type=float,
+        default=SEGMENT_SECONDS,
+        help=f'视频分段/打包文件时长（秒），默认 {SEGMENT_SECONDS:g}'
+    )
+    
+    parser.add_argument(
+        '--segment-mb',
+        type=float,
+        default=0,
+        help='视频分段/打包文件大小上限（MB），达到任一上限即开始新文件，默认 0（只按时长分段）'
+    )
+    
+    parser.add_argument(
+        '--pack-sync',
+        type=float,
+        default=0,
+        help='打包模式下每隔多少秒 fsync 一次，默认 0（只在文件结束和停止录制时 fsync）'
+    )
+    
+    parser.add_argument(
+        '--ring-seconds',
+        type=float,
+        default=0,
+        help='帧环形缓冲区：在待机和录制期间持续保留最近 N 秒的帧（隐含 --standby），'
+             'snapshot 命令写入磁盘；默认 0（关闭）。直通模式保存 MJPEG 数据，否则保存解码帧（1080p 每帧约 6 MB）'
+    )
+    
+    parser.add_argument(
+        '--ring-fps',
+        type=float,
+        default=None,
+        help='环形缓冲区存入帧率上限，默认与摄像头帧率相同'
+    )
+    
+    parser.add_argument(
+        '--source',
+        type=str,
+        default=SOURCE_CAMERA,
+        help='帧源，默认 camera（DH USB 摄像头）；synthetic[:width=W,height=H,fps=F,ramp=秒] 使用合成图像，'
+             'replay[:目录] 按原始时间间隔回放录制目录，无需摄像头'
+    )
     
     args = parser.parse_args()
     
@@ -356,6 +950,42 @@ def main():
         print("错误: 录制频率必须大于 0")
         sys.exit(1)
     
+    if args.encoder_workers < 1:
+        print("错误: 编码线程数必须大于 0")
+        sys.exit(1)
+    
+    recording_options["pixel_format"] = args.pixel_format
+    recording_options["encoder_workers"] = args.encoder_workers
+    recording_options["backpressure"] = args.backpressure
+    recording_options["passthrough"] = args.passthrough
+    recording_options["backend"] = args.backend
+    recording_options["adaptive_warmup"] = not args.fixed_warmup
+    recording_options["warmup_tolerance"] = args.warmup_tolerance
+    if args.container != "jpeg":
+        if args.dedup == "link" and args.container != "pack":
+            print("错误: 视频分段模式不支持 --dedup link")
+            sys.exit(1)
+        if args.segment_seconds <= 0:
+            print("错误: 视频分段时长必须大于 0")
+            sys.exit(1)
+        recording_options["container"] = args.container
+        recording_options["segment_seconds"] = args.segment_seconds
+        recording_options["segment_mb"] = args.segment_mb
+        recording_options["pack_sync"] = args.pack_sync
+    if args.dedup:
+        recording_options["dedup"] = args.dedup
+        recording_options["dedup_distance"] = args.dedup_distance
+        recording_options["dedup_hash"] = args.dedup_hash
+    if args.motion:
+        recording_options["motion_threshold"] = args.motion_threshold
+        recording_options["motion_keepalive"] = args.motion_keepalive
+    camera_source = args.source
+    standby_enabled = args.standby
+    if args.ring_seconds > 0:
+        frame_ring = FrameRing(args.ring_seconds, fps=args.ring_fps)
+        # 环形缓冲区需要在录制之外也保持取帧
+        standby_enabled = True
+    
     # 注册信号处理
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -372,15 +1002,26 @@ def main():
     print("  1 或 start  - 启动录制")
     print("  2 或 stop   - 停止录制")
     print("  status      - 查看状态")
+    print("  stats       - 查看录制计数器（排队/丢弃/延迟帧数）")
+    print("  snapshot    - 将环形缓冲区中最近的帧保存到 snapshots/（需要 --ring-seconds）")
     print("  quit/exit   - 退出服务")
     print("=" * 50)
     
+    if is_virtual_source(camera_source):
+        print(f"帧源: {camera_source}")
+    else:
+        start_hotplug_monitor()
+    
+    if standby_enabled:
+        start_standby()
+    
     try:
         command_listener(interval=args.interval)
     finally:
         # 清理
-        stop_recording()
+        stop_recording(keep_warm=False)
         close_camera()
+        stop_hotplug_monitor()
         if os.path.exists(command_pipe_path):
             os.remove(command_pipe_path)
         if os.path.exists(service_pid_file):
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+DH USB 摄像头配置模块
+打开摄像头后协商像素格式、分辨率和帧率，并在预热时验证实际帧率
+预热默认按亮度收敛判断曝光是否稳定，稳定后立即结束
+"""
+
+import time
+from dataclasses import dataclass
+
+import cv2
+
+from dh_usb_scoring import frame_luminance
+from dh_usb_v4l2 import PIXEL_FORMATS
+
+
+# 命令行可选的像素格式
+PIXEL_FORMAT_CHOICES = ("auto",) + PIXEL_FORMATS
+# 实测帧率低于模式标称帧率的该比例时给出警告
+FPS_WARNING_RATIO = 0.8
+# 自适应预热：最近 WARMUP_STABLE_FRAMES 帧的亮度极差不超过容差（0-255 灰度级）时认为曝光已收敛
+WARMUP_TOLERANCE = 2.0
+WARMUP_STABLE_FRAMES = 8
+# 亮度低于该值的帧不参与收敛判断（部分摄像头启动时先输出若干全黑帧）
+WARMUP_DARK_LEVEL = 5.0
+
+
+def get_fourcc(cap):
+    """
+    读取当前像素格式（FOURCC 字符串），无法获取时返回空字符串
+    """
+    code = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return "".join(chr((code >> (8 * i)) & 0xff) for i in range(4)).strip("\0 ") if code > 0 else ""
+
+
+def _set_format(cap, fourcc, width, height, fps=None):
+    # 先设置 FOURCC 再设置分辨率，否则 V4L2 后端可能按旧格式协商分辨率
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc.ljust(4)))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+
+
+def configure_capture(cap, mode, width, height, pixel_format="auto"):
+    """
+    设置摄像头像素格式、分辨率和帧率
+
+    参数:
+        cap: 已打开的 cv2.VideoCapture
+        mode: dh_usb_v4l2.select_camera_mode() 选择的 VideoMode，为 None 时通过 OpenCV 协商
+        width, height: 请求的分辨率
+        pixel_format: "auto" 或 PIXEL_FORMATS 中的一种
+    返回:
+        (实际宽度, 实际高度, 实际 FOURCC)
+    """
+    if mode is not None:
+        print(f"设置模式: {mode.fourcc} {mode.width}x{mode.height} @ {mode.max_fps:g} fps")
+        _set_format(cap, mode.fourcc, mode.width, mode.height, mode.max_fps)
+    else:
+        # 无法查询模式时按优先级逐个尝试，读回 FOURCC 确认设备接受
+        preferences = PIXEL_FORMATS if pixel_format == "auto" else (pixel_format,)
+        print(f"设置分辨率: {width}x{height}，尝试像素格式: {'/'.join(preferences)}")
+        for fourcc in preferences:
+            _set_format(cap, fourcc, width, height)
+            if get_fourcc(cap) == fourcc:
+                break
+
+    actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    actual_fourcc = get_fourcc(cap)
+    print(f"实际分辨率: {actual_width}x{actual_height}，像素格式: {actual_fourcc or '未知'}")
+    return actual_width, actual_height, actual_fourcc
+
+
+def enable_passthrough(cap):
+    """
+    开启 MJPEG 直通：关闭 OpenCV 的颜色转换，retrieve() 直接返回摄像头输出的 JPEG 数据
+    仅当当前像素格式为 MJPG 时可用，返回是否开启成功
+    """
+    fourcc = get_fourcc(cap)
+    if fourcc != "MJPG":
+        print(f"注意: 当前像素格式为 {fourcc or '未知'}，无法使用 MJPEG 直通，将解码后重新编码")
+        return False
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    if cap.get(cv2.CAP_PROP_CONVERT_RGB) != 0:
+        print("注意: 当前后端不支持关闭颜色转换，无法使用 MJPEG 直通")
+        return False
+    print("已开启 MJPEG 直通：直接保存摄像头输出的 JPEG 数据")
+    return True
+
+
+@dataclass
+class WarmupResult:
+    """
+    预热结果：实测帧率、实际用时（秒）、读取帧数、是否检测到曝光收敛
+    """
+    fps: float = 0.0
+    seconds: float = 0.0
+    frames: int = 0
+    converged: bool = False
+
+
+def warmup_camera(cap, warmup_frames=30, warmup_seconds=3, expected_fps=None, adaptive=True,
+                  tolerance=WARMUP_TOLERANCE, stable_frames=WARMUP_STABLE_FRAMES):
+    """
+    预热摄像头：读取并丢弃帧让摄像头调整曝光，同时测量实际帧率
+
+    自适应模式（默认）持续读取帧并跟踪每帧的平均亮度，最近 stable_frames 帧的亮度极差
+    不超过 tolerance 时立即结束；未收敛时以已读取 warmup_frames 帧且已用时 warmup_seconds 秒
+    为上限。固定模式与原来一致：读取 warmup_frames 帧后再等待 warmup_seconds 秒
+
+    参数:
+        cap: 已打开的 cv2.VideoCapture
+        warmup_frames: 预热帧数（自适应模式下为上限）
+        warmup_seconds: 预热后额外等待时间（秒）（自适应模式下为上限）
+        expected_fps: 模式标称帧率，实测帧率明显偏低时给出警告
+        adaptive: 是否按亮度收敛提前结束
+        tolerance: 亮度收敛容差（灰度级）
+        stable_frames: 判断收敛的连续帧数
+    返回:
+        WarmupResult
+    """
+    print("正在预热摄像头（调整曝光）...")
+    if adaptive:
+        print(f"  亮度稳定后结束（容差 {tolerance:g}，连续 {stable_frames} 帧），"
+              f"上限: {warmup_frames} 帧且 {warmup_seconds}秒")
+    else:
+        print(f"  预热帧数: {warmup_frames}, 等待时间: {warmup_seconds}秒")
+    result = WarmupResult()
+    start_time = time.perf_counter()
+    first_frame_time = None
+    frames_timed = 0
+    recent = []
+    i = 0
+    while True:
+        if adaptive:
+            if i >= warmup_frames and time.perf_counter() - start_time >= warmup_seconds:
+                break
+        elif i >= warmup_frames:
+            break
+        ret, frame = cap.read()
+        if not ret:
+            break
+        i += 1
+        # 第一帧包含启动流的延迟，从第一帧之后开始计时
+        if first_frame_time is None:
+            first_frame_time = time.perf_counter()
+        else:
+            frames_timed += 1
+        if i % 10 == 0 and i <= warmup_frames:
+            print(f"  预热进度: {i}/{warmup_frames} 帧")
+        if adaptive:
+            luminance = frame_luminance(frame)
+            if luminance is None or luminance < WARMUP_DARK_LEVEL:
+                recent = []
+                continue
+            recent = (recent + [luminance])[-stable_frames:]
+            if len(recent) == stable_frames and max(recent) - min(recent) <= tolerance:
+                result.converged = True
+                break
+
+    result.frames = i
+    if frames_timed > 0:
+        result.fps = frames_timed / (time.perf_counter() - first_frame_time)
+        print(f"  实测帧率: {result.fps:.1f} fps")
+        if expected_fps and result.fps < expected_fps * FPS_WARNING_RATIO:
+            print(f"  注意: 实测帧率低于标称帧率 {expected_fps:g} fps"
+                  f"（可能受曝光时间或 USB 带宽限制）")
+
+    if not adaptive:
+        print(f"等待曝光稳定 ({warmup_seconds}秒)...")
+        time.sleep(warmup_seconds)
+    result.seconds = time.perf_counter() - start_time
+    if result.converged:
+        print(f"  曝光已稳定（平均亮度 {recent[-1]:.1f}/255），预热用时 {result.seconds:.2f} 秒，共 {result.frames} 帧")
+    elif adaptive:
+        print(f"  注意: 达到预热上限仍未检测到曝光稳定，预热用时 {result.seconds:.2f} 秒，共 {result.frames} 帧")
+    else:
+        print(f"  预热用时 {result.seconds:.2f} 秒")
+    return result
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+感知哈希去重模块
+固定间隔录制的画面经常长时间几乎不变。保存前为每帧计算 64 位感知哈希（在 9x8 / 8x8 的缩略图上计算，
+每帧约几十微秒），与上一次实际保存的帧的哈希比较，汉明距离不超过阈值的帧视为重复:
+  skip - 不保存重复帧
+  link - 不重新编码和写入，以硬链接指向上一次保存的文件（文件序列保持完整，不占用额外磁盘空间）
+
+哈希方式:
+  dhash - 相邻像素亮度差的符号（对整体亮度变化不敏感，默认）
+  ahash - 像素亮度是否高于平均值
+"""
+
+import cv2
+import numpy as np
+
+from dh_usb_scoring import SCORE_STEP, downsample, to_gray
+
+
+DEDUP_MODES = ("skip", "link")
+# 汉明距离不超过该值视为重复帧（64 位哈希）
+DEDUP_DISTANCE = 3
+
+
+def dhash(small):
+    """
+    差值哈希：缩小到 9x8 灰度图，比较每行相邻像素
+    """
+    thumb = cv2.resize(to_gray(small), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = thumb[:, 1:] > thumb[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def ahash(small):
+    """
+    均值哈希：缩小到 8x8 灰度图，比较每个像素与平均值
+    """
+    thumb = cv2.resize(to_gray(small), (8, 8), interpolation=cv2.INTER_AREA)
+    bits = thumb > thumb.mean()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+HASHES = {
+    "dhash": dhash,
+    "ahash": ahash,
+}
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class FrameDeduplicator:
+    """
+    重复帧检测：check() 判断当前帧是否与上一次保存的帧重复
+
+    参数:
+        mode: 重复帧的处理方式（DEDUP_MODES 之一）
+        distance: 视为重复的最大汉明距离
+        hash: 哈希方式（HASHES 中的键）
+    """
+
+    def __init__(self, mode="skip", distance=DEDUP_DISTANCE, hash="dhash"):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"未知的去重方式: {mode}")
+        self.mode = mode
+        self.distance = distance
+        self.hash_name = hash
+        self.hash = HASHES[hash]
+        self.checked = 0
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.last_filename = None
+        self._last_hash = None
+        self._last_bytes = 0
+
+    def check(self, frame, filename, force=False):
+        """
+        计算当前帧的哈希并与上一次保存的帧比较
+        参数:
+            frame: BGR 图像或直通模式的 JPEG 数据
+            filename: 当前帧保存时使用的文件名
+            force: 为 True 时不判断重复（例如运动门控的保活帧），直接记为上一次保存的帧
+        返回:
+            重复时返回上一次保存的文件名（link 模式的链接目标），否则返回 None 并将当前帧记为上一次保存的帧
+        """
+        self.checked += 1
+        small = downsample(frame, SCORE_STEP)
+        if small is None:
+            return None
+        value = self.hash(small)
+        if not force and self._last_hash is not None and hamming(value, self._last_hash) <= self.distance:
+            self.duplicates += 1
+            # 重复帧的大小按上一次保存的文件估计
+            self.bytes_saved += self._last_bytes
+            return self.last_filename
+        self._last_hash = value
+        self.last_filename = filename
+        return None
+
+    def reset(self):
+        """
+        清除参考帧（参考帧未能保存时调用），下一帧将作为新的参考帧保存
+        """
+        self._last_hash = None
+        self.last_filename = None
+
+    def record_written(self, nbytes):
+        """
+        记录上一次保存的文件大小（用于估计节省的字节数）
+        """
+        self._last_bytes = nbytes
+
+    def summary(self):
+        return {
+            "dedup_mode": self.mode,
+            "dedup_checked": self.checked,
+            "dedup_duplicates": self.duplicates,
+            "dedup_bytes_saved": self.bytes_saved,
+        }
+
+    def format_summary(self):
+        action = "跳过" if self.mode == "skip" else "硬链接"
+        ratio = self.duplicates / self.checked if self.checked else 0.0
+        return (f"{action}重复帧 {self.duplicates}/{self.checked} 帧（{ratio:.0%}，{self.hash_name} 距离 <= {self.distance}），"
+                f"节省约 {self.bytes_saved / 1024 / 1024:.1f} MB")
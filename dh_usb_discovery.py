@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+DH USB 摄像头发现模块
+直接读取 sysfs（/sys/class/video4linux 及其父 USB 设备属性）枚举摄像头，
+不调用 udevadm、不打开 VideoCapture，毫秒级返回排序后的候选设备
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+
+# DH 摄像头识别关键字（与原 udevadm 输出匹配规则一致）
+DH_KEYWORDS = ("DH_USB", "DH")
+# 发现缓存文件：记录 USB 序列号/端口路径 到 /dev/videoN 的映射
+discovery_cache_path = "/tmp/dh_usb_camera_discovery.json"
+# 并行验证候选设备时的整体截止时间（秒）和最大线程数
+probe_deadline = 5.0
+probe_workers = 4
+
+
+@dataclass
+class CameraCandidate:
+    """
+    一个 video4linux 设备节点及其父 USB 设备信息
+    """
+    dev_path: str
+    node: str
+    name: str = ""
+    index: int = 0
+    sysfs_path: str = ""
+    usb_path: str = ""
+    port_path: str = ""
+    id_vendor: str = ""
+    id_product: str = ""
+    serial: str = ""
+    product: str = ""
+    manufacturer: str = ""
+    devnum: str = ""
+    score: int = 0
+
+    @property
+    def number(self):
+        """
+        设备编号（videoN 中的 N），无法解析时返回一个很大的值用于排序
+        """
+        digits = self.node[len("video"):]
+        return int(digits) if digits.isdigit() else sys.maxsize
+
+    @property
+    def is_dh(self):
+        """
+        是否为 DH 摄像头（名称、产品名、厂商或序列号中包含 DH 关键字）
+        """
+        fields = (self.name, self.product, self.manufacturer, self.serial)
+        return any(keyword in field for field in fields for keyword in DH_KEYWORDS)
+
+    @property
+    def usb_key(self):
+        """
+        USB 设备标识：优先使用序列号，没有序列号时使用总线端口路径
+        """
+        return self.serial or self.port_path
+
+
+def _read_attr(directory, attr):
+    """
+    读取 sysfs 属性文件，失败时返回空字符串
+    """
+    try:
+        with open(os.path.join(directory, attr), 'r', errors='replace') as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _find_usb_parent(device_dir, max_depth=4):
+    """
+    从 video4linux 节点的 device 目录（通常是 USB 接口）向上查找包含 idVendor 的 USB 设备目录
+    """
+    current = device_dir
+    for _ in range(max_depth):
+        if os.path.exists(os.path.join(current, "idVendor")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    return None
+
+
+def _score_candidate(candidate):
+    """
+    候选设备排序分数：DH 设备优先，其次是主采集节点（index 0），再次是 USB 设备
+    """
+    score = 0
+    if candidate.is_dh:
+        score += 100
+        if "DH_USB" in candidate.name or "DH_USB" in candidate.product:
+            score += 10
+    if candidate.index == 0:
+        score += 20
+    if candidate.usb_path:
+        score += 5
+    return score
+
+
+def read_candidate(node, sysfs_root="/sys", dev_root="/dev"):
+    """
+    读取单个 video4linux 节点的信息
+
+    参数:
+        node: 节点名，如 "video2"
+        sysfs_root: sysfs 根目录，默认 "/sys"（测试时可指向伪造的目录树）
+        dev_root: 设备节点目录，默认 "/dev"
+    返回:
+        CameraCandidate，设备节点不存在时返回 None
+    """
+    dev_path = os.path.join(dev_root, node)
+    if not os.path.exists(dev_path):
+        return None
+
+    node_dir = os.path.join(sysfs_root, "class", "video4linux", node)
+    index = _read_attr(node_dir, "index")
+    candidate = CameraCandidate(
+        dev_path=dev_path,
+        node=node,
+        name=_read_attr(node_dir, "name"),
+        index=int(index) if index.isdigit() else 0,
+        sysfs_path=os.path.realpath(node_dir),
+    )
+
+    usb_dir = _find_usb_parent(os.path.realpath(os.path.join(node_dir, "device")))
+    if usb_dir is not None:
+        candidate.usb_path = usb_dir
+        candidate.port_path = os.path.basename(usb_dir)
+        candidate.id_vendor = _read_attr(usb_dir, "idVendor")
+        candidate.id_product = _read_attr(usb_dir, "idProduct")
+        candidate.serial = _read_attr(usb_dir, "serial")
+        candidate.product = _read_attr(usb_dir, "product")
+        candidate.manufacturer = _read_attr(usb_dir, "manufacturer")
+        candidate.devnum = _read_attr(usb_dir, "devnum")
+
+    candidate.score = _score_candidate(candidate)
+    return candidate
+
+
+def scan_video_devices(sysfs_root="/sys", dev_root="/dev"):
+    """
+    枚举所有 video4linux 设备并按分数排序（分数相同则按设备编号）
+
+    参数:
+        sysfs_root: sysfs 根目录，默认 "/sys"
+        dev_root: 设备节点目录，默认 "/dev"
+    返回:
+        CameraCandidate 列表，sysfs 不可用时返回空列表
+    """
+    class_dir = os.path.join(sysfs_root, "class", "video4linux")
+    try:
+        nodes = os.listdir(class_dir)
+    except OSError:
+        return []
+
+    candidates = []
+    for node in nodes:
+        if not node.startswith("video"):
+            continue
+        candidate = read_candidate(node, sysfs_root, dev_root)
+        if candidate is not None:
+            candidates.append(candidate)
+
+    candidates.sort(key=lambda c: (-c.score, c.number))
+    return candidates
+
+
+def find_dh_candidates(sysfs_root="/sys", dev_root="/dev"):
+    """
+    返回排序后的 DH 摄像头候选设备列表
+    """
+    return [c for c in scan_video_devices(sysfs_root, dev_root) if c.is_dh]
+
+
+def _class_link(sysfs_root, node):
+    """
+    读取 /sys/class/video4linux/<node> 符号链接目标，失败时返回空字符串
+    """
+    try:
+        return os.readlink(os.path.join(sysfs_root, "class", "video4linux", node))
+    except OSError:
+        return ""
+
+
+def _read_cache(cache_path):
+    """
+    读取缓存文件：{"last": 最近使用的 usb_key, "cameras": {usb_key: 条目}}，不存在或格式不对时返回空缓存
+    """
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        if isinstance(cache.get("cameras"), dict):
+            return cache
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"last": None, "cameras": {}}
+
+
+def _write_cache(cache_path, cache):
+    """
+    先写临时文件再原子替换，写入失败时忽略
+    """
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_cached_camera(cache_path=None, sysfs_root="/sys", usb_key=None):
+    """
+    读取发现缓存并验证是否仍然有效
+
+    缓存按 USB 设备标识（有序列号时为序列号，否则为端口路径）分别记录每个摄像头，
+    usb_key 可以是序列号或端口路径，为 None 时使用最近一次找到的摄像头。
+    验证只需一次 readlink 和一次 sysfs 读取：
+      - /sys/class/video4linux/<node> 仍指向同一 USB 接口下的节点
+      - 父 USB 设备的 devnum 未变化（设备重新枚举后 devnum 会改变）
+    返回:
+        缓存的设备路径，缓存不存在或已失效时返回 None
+    """
+    cache = _read_cache(cache_path or discovery_cache_path)
+    key = usb_key if usb_key is not None else cache.get("last")
+    entry = cache["cameras"].get(key)
+    if entry is None and usb_key is not None:
+        # 条目以序列号为键时也可以按端口路径查找
+        entry = next((e for e in cache["cameras"].values()
+                      if isinstance(e, dict) and usb_key in (e.get("serial"), e.get("port_path"))), None)
+    try:
+        node = entry["node"]
+        link = entry["link"]
+        usb_path = entry["usb_path"]
+        devnum = entry["devnum"]
+        dev_path = entry["dev_path"]
+    except (KeyError, TypeError):
+        return None
+
+    if not link or _class_link(sysfs_root, node) != link:
+        return None
+    if usb_path and _read_attr(usb_path, "devnum") != devnum:
+        return None
+    return dev_path
+
+
+def save_cached_camera(candidate, cache_path=None, sysfs_root="/sys"):
+    """
+    将发现结果写入缓存中该摄像头（candidate.usb_key）的条目，并记为最近使用的摄像头
+    其他摄像头的条目保持不变
+    """
+    cache_path = cache_path or discovery_cache_path
+    cache = _read_cache(cache_path)
+    cache["cameras"][candidate.usb_key] = {
+        "serial": candidate.serial,
+        "port_path": candidate.port_path,
+        "usb_path": candidate.usb_path,
+        "devnum": candidate.devnum,
+        "node": candidate.node,
+        "link": _class_link(sysfs_root, candidate.node),
+        "dev_path": candidate.dev_path,
+    }
+    cache["last"] = candidate.usb_key
+    _write_cache(cache_path, cache)
+
+
+def invalidate_cached_camera(cache_path=None, dev_path=None):
+    """
+    清除发现缓存：dev_path 为 None 时删除整个缓存，否则只删除指向该设备路径的条目
+    """
+    cache_path = cache_path or discovery_cache_path
+    if dev_path is None:
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return
+    cache = _read_cache(cache_path)
+    stale = [key for key, entry in cache["cameras"].items()
+             if isinstance(entry, dict) and entry.get("dev_path") == dev_path]
+    if not stale:
+        return
+    for key in stale:
+        del cache["cameras"][key]
+    if cache.get("last") in stale:
+        cache["last"] = None
+    _write_cache(cache_path, cache)
+
+
+@dataclass
+class ProbeResult:
+    """
+    单个候选设备的验证结果
+    """
+    candidate: CameraCandidate
+    ok: bool = False
+    elapsed: float = 0.0
+    error: str = ""
+    finished: bool = False
+
+
+def open_and_read(dev_path):
+    """
+    默认验证方法：打开设备并读取一帧，无论结果如何都释放设备
+    返回 (是否成功, 错误信息)
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(dev_path)
+    try:
+        if not cap.isOpened():
+            return False, "无法打开"
+        ret, _ = cap.read()
+        return (True, "") if ret else (False, "无法读取帧")
+    finally:
+        cap.release()
+
+
+def _timed_probe(candidate, probe):
+    start = time.perf_counter()
+    try:
+        ok, error = probe(candidate.dev_path)
+    except Exception as e:
+        ok, error = False, str(e)
+    return ProbeResult(candidate, ok, time.perf_counter() - start, error, True)
+
+
+def probe_candidates(candidates, deadline=None, max_workers=None, probe=None):
+    """
+    使用有界线程池并行验证候选设备，取第一个验证成功的设备
+
+    参数:
+        candidates: CameraCandidate 列表
+        deadline: 整体截止时间（秒），默认使用 probe_deadline
+        max_workers: 最大线程数，默认使用 probe_workers
+        probe: 验证函数 probe(dev_path) -> (ok, error)，默认 open_and_read
+    返回:
+        (验证成功的 CameraCandidate 或 None, 按候选顺序排列的 ProbeResult 列表)
+        截止时间到达时仍未完成的候选设备 finished 为 False
+
+    找到设备或到达截止时间后立即返回：尚未开始的验证被取消，
+    正在进行的验证在后台线程中结束并自行释放设备
+    """
+    deadline = probe_deadline if deadline is None else deadline
+    max_workers = max_workers or probe_workers
+    probe = probe or open_and_read
+    if not candidates:
+        return None, []
+
+    start = time.perf_counter()
+    end_time = start + deadline
+    results = {id(c): ProbeResult(c) for c in candidates}
+    found = None
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(candidates)),
+                                  thread_name_prefix="dh_usb_probe")
+    pending = {executor.submit(_timed_probe, c, probe) for c in candidates}
+    try:
+        while pending and found is None:
+            remaining = end_time - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[id(result.candidate)] = result
+                if result.ok and found is None:
+                    found = result.candidate
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    for result in results.values():
+        if not result.finished:
+            result.elapsed = elapsed
+    return found, [results[id(c)] for c in candidates]
+
+
+def print_probe_report(results):
+    """
+    打印每个候选设备的验证耗时，便于发现响应缓慢的设备节点
+    """
+    for result in results:
+        if not result.finished:
+            status = f"未完成 (>{result.elapsed * 1000:.0f} ms)"
+        elif result.ok:
+            status = f"成功 ({result.elapsed * 1000:.0f} ms)"
+        else:
+            status = f"失败: {result.error} ({result.elapsed * 1000:.0f} ms)"
+        print(f"  验证 {result.candidate.dev_path}: {status}")
+
+
+def find_dh_usb_camera(sysfs_root="/sys", dev_root="/dev", use_cache=True, cache_path=None,
+                       verify=True, probe=None, usb_key=None):
+    """
+    查找 DH USB 摄像头设备
+    先检查发现缓存，缓存未命中时才进行完整的 sysfs 扫描；
+    存在多个 DH 采集节点（index 0，不含元数据节点）时并行打开验证，取第一个能读取帧的设备
+    返回设备路径（如 /dev/video2），如果未找到则返回 None
+
+    参数:
+        sysfs_root: sysfs 根目录，默认 "/sys"
+        dev_root: 设备节点目录，默认 "/dev"
+        use_cache: 是否使用发现缓存，默认 True
+        cache_path: 缓存文件路径，默认使用 discovery_cache_path
+        verify: 存在多个采集节点时是否并行验证，默认 True
+        probe: 验证函数，默认 open_and_read
+        usb_key: 指定摄像头的 USB 序列号或端口路径（如 "1-2"），None 时使用缓存中最近一次找到的摄像头，
+            缓存未命中时取排序最前（或验证成功）的摄像头
+    """
+    print("正在查找 DH USB 摄像头...")
+    start = time.perf_counter()
+
+    if use_cache:
+        dev_path = load_cached_camera(cache_path, sysfs_root, usb_key)
+        if dev_path is not None:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"找到 DH USB 摄像头: {dev_path} (缓存命中，用时 {elapsed_ms:.1f} ms)")
+            return dev_path
+
+    candidates = find_dh_candidates(sysfs_root, dev_root)
+    if usb_key is not None:
+        candidates = [c for c in candidates if usb_key in (c.usb_key, c.serial, c.port_path)]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if not candidates:
+        print(f"未找到 DH USB 摄像头（扫描用时 {elapsed_ms:.1f} ms）")
+        return None
+
+    # 一个 UVC 摄像头有采集节点（index 0）和元数据节点（index 1）两个节点，
+    # 只有多个摄像头（多个采集节点）时才需要打开验证
+    capture_nodes = [c for c in candidates if c.index == 0] or candidates
+    best = capture_nodes[0]
+    if verify and len(capture_nodes) > 1:
+        print(f"发现 {len(capture_nodes)} 个候选设备，正在并行验证...")
+        verified, results = probe_candidates(capture_nodes, probe=probe)
+        print_probe_report(results)
+        if verified is None:
+            print("未找到可读取图像的 DH USB 摄像头")
+            return None
+        best = verified
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if use_cache:
+        save_cached_camera(best, cache_path, sysfs_root)
+    print(f"找到 DH USB 摄像头: {best.dev_path} ({best.product or best.name}，用时 {elapsed_ms:.1f} ms)")
+    return best.dev_path
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    devices = scan_video_devices()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if not devices:
+        print("未找到任何 video4linux 设备")
+    for c in devices:
+        mark = "DH" if c.is_dh else "  "
+        print(f"[{mark}] {c.dev_path:<14} score={c.score:<4} index={c.index} "
+              f"{c.id_vendor}:{c.id_product} port={c.port_path or '-'} "
+              f"serial={c.serial or '-'} name={c.name!r}")
+    print(f"扫描用时 {elapsed_ms:.1f} ms")
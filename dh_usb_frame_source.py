@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+帧源接口
+捕获和录制代码只依赖 cv2.VideoCapture 的一个子集（isOpened/grab/retrieve/read/get/set/release），
+FrameSource 定义了这个子集，cv2.VideoCapture 本身即满足该接口，其他后端继承 FrameSource 实现
+
+除真实摄像头外还提供两种虚拟帧源，用于没有摄像头时的负载测试和基准测试：
+  synthetic[:key=value,...]  合成图像，可设置分辨率、帧率和曝光爬升时间
+  replay[:目录]              按原始时间间隔回放录制目录中的 JPEG 文件
+"""
+
+import glob
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+
+# 可选的采集后端
+BACKEND_OPENCV = "opencv"
+BACKEND_V4L2 = "v4l2"
+BACKENDS = (BACKEND_OPENCV, BACKEND_V4L2)
+
+# 帧源类型（命令行 --source 的取值前缀）
+SOURCE_CAMERA = "camera"
+SOURCE_SYNTHETIC = "synthetic"
+SOURCE_REPLAY = "replay"
+SOURCE_KINDS = (SOURCE_CAMERA, SOURCE_SYNTHETIC, SOURCE_REPLAY)
+
+
+class FrameSource(ABC):
+    """
+    帧源基类
+
+    子类必须实现 isOpened()、grab()、retrieve() 和 release()（缺少时实例化即报错）。
+    zero_copy 为 True 的帧源，retrieve() 返回的数组可能直接引用驱动缓冲区，
+    只在下一次 grab() 之前有效，需要跨帧保留时调用方必须自行复制。
+    """
+
+    zero_copy = False
+    # 有限长度的帧源（如不循环的回放）播放完毕后置为 True，此后 grab() 始终返回 False
+    exhausted = False
+
+    @abstractmethod
+    def isOpened(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def grab(self):
+        """
+        取下一帧（不解码），返回是否成功
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def retrieve(self, image=None):
+        """
+        解码/转换最近一次 grab() 取到的帧，返回 (ret, frame)
+        image 与 cv2.VideoCapture.retrieve() 相同：尺寸和类型匹配时结果写入该数组并返回它
+        """
+        raise NotImplementedError
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop):
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    @abstractmethod
+    def release(self):
+        raise NotImplementedError
+
+
+def _fourcc_str(value):
+    code = int(value)
+    return "".join(chr((code >> (8 * i)) & 0xff) for i in range(4))
+
+
+def _clock_sleep(deadline):
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def output_into(frame, image):
+    """
+    retrieve() 的输出数组处理：image 与 frame 尺寸和类型一致时复制到 image 并返回 image，否则返回 frame
+    """
+    if image is None or frame is None or image.shape != frame.shape or image.dtype != frame.dtype:
+        return frame
+    np.copyto(image, frame)
+    return image
+
+
+class SyntheticSource(FrameSource):
+    """
+    合成帧源：输出固定的纹理图像，按帧率出帧，亮度在 exposure_ramp 秒内从 start_gain 线性
+    升到 1（模拟自动曝光收敛）
+
+    像素格式为 MJPG 时 retrieve() 解码 JPEG（与真实摄像头的解码开销一致），
+    set(cv2.CAP_PROP_CONVERT_RGB, 0) 后返回 JPEG 数据；其他像素格式直接返回 BGR 图像
+    时间以流开始后的帧序号 / fps 计算，realtime 为 False 时 grab() 不等待，用于测量最大吞吐
+
+    参数:
+        width, height: 分辨率（也可通过 set() 修改）
+        fps: 帧率
+        exposure_ramp: 曝光爬升时间（秒），0 表示第一帧即稳定
+        start_gain: 第一帧的相对亮度
+        realtime: 是否按帧率实时出帧
+        quality: MJPG 帧的 JPEG 质量
+    """
+
+    # MJPG 模式下按亮度量化缓存编码结果，爬升期间最多编码 GAIN_LEVELS 次
+    GAIN_LEVELS = 256
+
+    def __init__(self, width=1920, height=1080, fps=30.0, exposure_ramp=1.0, start_gain=0.2, realtime=True,
+                 quality=90):
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps)
+        self.exposure_ramp = float(exposure_ramp)
+        self.start_gain = float(start_gain)
+        self.realtime = realtime
+        self.quality = int(quality)
+        self.fourcc = "MJPG"
+        self.convert_rgb = True
+        self.opened = True
+        self.frame_index = -1
+        self._stream_start = None
+        self._base = None
+        self._jpeg_cache = {}
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FOURCC:
+            return float(cv2.VideoWriter_fourcc(*self.fourcc))
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            return 1.0 if self.convert_rgb else 0.0
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.elapsed() * 1000
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        elif prop == cv2.CAP_PROP_FOURCC:
+            self.fourcc = _fourcc_str(value)
+        elif prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        else:
+            return False
+        self._base = None
+        self._jpeg_cache = {}
+        return True
+
+    def elapsed(self):
+        """
+        当前帧相对流开始的时间（秒）
+        """
+        return max(self.frame_index, 0) / self.fps
+
+    def gain(self):
+        """
+        当前帧的相对亮度
+        """
+        if self.exposure_ramp <= 0:
+            return 1.0
+        ratio = min(1.0, self.elapsed() / self.exposure_ramp)
+        return self.start_gain + (1.0 - self.start_gain) * ratio
+
+    def _base_image(self):
+        if self._base is None:
+            # 低分辨率噪声放大得到平滑纹理，JPEG 压缩率和真实场景接近
+            rng = np.random.default_rng(0)
+            small = rng.integers(0, 256, (max(1, self.height // 8), max(1, self.width // 8), 3), dtype=np.uint8)
+            self._base = cv2.resize(small, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        return self._base
+
+    def _render(self, gain, image=None):
+        return cv2.convertScaleAbs(self._base_image(), dst=image, alpha=gain)
+
+    def _jpeg(self, gain):
+        level = round(gain * self.GAIN_LEVELS)
+        data = self._jpeg_cache.get(level)
+        if data is None:
+            ok, data = cv2.imencode(".jpg", self._render(level / self.GAIN_LEVELS),
+                                    [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            self._jpeg_cache[level] = data
+        return data
+
+    def grab(self):
+        if not self.opened:
+            return False
+        now = time.monotonic()
+        if self._stream_start is None:
+            self._stream_start = now
+        self.frame_index += 1
+        if self.realtime:
+            _clock_sleep(self._stream_start + self.frame_index / self.fps)
+        return True
+
+    def retrieve(self, image=None):
+        if not self.opened or self.frame_index < 0:
+            return False, None
+        gain = self.gain()
+        if self.fourcc != "MJPG":
+            return True, self._render(gain, image)
+        data = self._jpeg(gain)
+        if not self.convert_rgb:
+            return True, data
+        return True, output_into(cv2.imdecode(data, cv2.IMREAD_COLOR), image)
+
+    def release(self):
+        self.opened = False
+
+
+# 录制文件名中的时间戳：dh_usb_YYYYMMDD_HHMMSS_mmm.jpg
+_RECORDING_TIMESTAMP = re.compile(r"(\d{8}_\d{6}_\d{3})")
+
+
+def recording_timestamp(path):
+    """
+    从录制文件名解析采集时刻，文件名不含时间戳时使用文件修改时间
+    """
+    match = _RECORDING_TIMESTAMP.search(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1) + "000", "%Y%m%d_%H%M%S_%f")
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+class ReplaySource(FrameSource):
+    """
+    回放帧源：按文件名中的时间戳排序回放目录中的 JPEG 文件，帧间隔与录制时一致
+
+    参数:
+        directory: 录制目录（SavePipeline 保存的 dh_usb_*.jpg）
+        loop: 播放完毕后是否从头循环
+        realtime: 是否按原始时间间隔出帧，False 时尽快出帧
+        speed: 回放速度倍率
+    """
+
+    def __init__(self, directory="recordings", loop=False, realtime=True, speed=1.0):
+        self.directory = directory
+        self.loop = loop
+        self.realtime = realtime
+        self.speed = float(speed)
+        self.convert_rgb = True
+        paths = glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.jpeg"))
+        entries = sorted((recording_timestamp(path), path) for path in paths)
+        self.paths = [path for _, path in entries]
+        self.timestamps = [timestamp for timestamp, _ in entries]
+        # 各帧相对第一帧的时间（秒）
+        self.offsets = [(t - self.timestamps[0]).total_seconds() for t in self.timestamps] if entries else []
+        self.opened = False
+        self.index = -1
+        self.data = None
+        self._loop_start = None
+        self.width = self.height = 0
+        if not self.paths:
+            print(f"错误: 回放目录 {directory} 中没有 JPEG 文件")
+            return
+        first = cv2.imread(self.paths[0])
+        if first is None:
+            print(f"错误: 无法读取回放文件 {self.paths[0]}")
+            return
+        self.height, self.width = first.shape[:2]
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    @property
+    def captured_at(self):
+        """
+        当前帧的原始采集时刻
+        """
+        return self.timestamps[self.index] if 0 <= self.index < len(self.timestamps) else None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            span = self.offsets[-1] if self.offsets else 0
+            return (len(self.offsets) - 1) / span if span > 0 else 0.0
+        if prop == cv2.CAP_PROP_FOURCC:
+            return float(cv2.VideoWriter_fourcc(*"MJPG"))
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            return 1.0 if self.convert_rgb else 0.0
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.offsets[self.index] * 1000 if self.index >= 0 else 0.0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return 0.0
+
+    def set(self, prop, value):
+        # 回放的分辨率和格式由文件决定，只支持切换直通模式
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        return False
+
+    def grab(self):
+        if not self.opened or self.exhausted:
+            return False
+        self.index += 1
+        if self.index >= len(self.paths):
+            if not self.loop:
+                self.exhausted = True
+                return False
+            self.index = 0
+            self._loop_start = None
+        if self._loop_start is None:
+            self._loop_start = time.monotonic()
+        if self.realtime:
+            _clock_sleep(self._loop_start + self.offsets[self.index] / self.speed)
+        try:
+            with open(self.paths[self.index], "rb") as f:
+                self.data = np.frombuffer(f.read(), dtype=np.uint8)
+        except OSError as e:
+            print(f"警告: 无法读取回放文件 {self.paths[self.index]}: {e}")
+            self.data = None
+        return self.data is not None
+
+    def retrieve(self, image=None):
+        if self.data is None:
+            return False, None
+        if not self.convert_rgb:
+            return True, self.data
+        frame = cv2.imdecode(self.data, cv2.IMREAD_COLOR)
+        return frame is not None, output_into(frame, image)
+
+    def release(self):
+        self.opened = False
+        self.data = None
+
+
+def _parse_options(text):
+    """
+    解析 key=value,key=value 形式的帧源参数
+    """
+    options = {}
+    for item in filter(None, text.split(",")):
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"帧源参数应为 key=value 形式: {item}")
+        options[key.strip()] = value.strip()
+    return options
+
+
+def _parse_bool(value):
+    return value.lower() not in ("0", "false", "no", "off")
+
+
+def source_kind(spec):
+    """
+    帧源类型：synthetic / replay，其他取值（设备路径或 camera）视为真实摄像头
+    """
+    kind = str(spec).partition(":")[0]
+    return kind if kind in SOURCE_KINDS else SOURCE_CAMERA
+
+
+def is_virtual_source(spec):
+    """
+    是否为不需要摄像头的虚拟帧源
+    """
+    return spec is not None and source_kind(spec) != SOURCE_CAMERA
+
+
+def open_virtual_source(spec):
+    """
+    按描述打开虚拟帧源
+
+    参数:
+        spec: "synthetic[:width=W,height=H,fps=F,ramp=秒,realtime=0]"
+              或 "replay[:目录]"、"replay:dir=目录,loop=1,speed=2,realtime=0"
+    返回:
+        SyntheticSource 或 ReplaySource
+    """
+    kind, _, arg = spec.partition(":")
+    if kind == SOURCE_SYNTHETIC:
+        options = _parse_options(arg)
+        names = {"width": int, "height": int, "fps": float, "ramp": float, "start_gain": float,
+                 "quality": int, "realtime": _parse_bool}
+        unknown = set(options) - set(names)
+        if unknown:
+            raise ValueError(f"未知的合成帧源参数: {', '.join(sorted(unknown))}")
+        kwargs = {("exposure_ramp" if key == "ramp" else key): names[key](value) for key, value in options.items()}
+        return SyntheticSource(**kwargs)
+    if kind == SOURCE_REPLAY:
+        options = _parse_options(arg) if "=" in arg else {"dir": arg} if arg else {}
+        directory = options.pop("dir", "recordings")
+        names = {"loop": _parse_bool, "realtime": _parse_bool, "speed": float}
+        unknown = set(options) - set(names)
+        if unknown:
+            raise ValueError(f"未知的回放帧源参数: {', '.join(sorted(unknown))}")
+        return ReplaySource(directory, **{key: names[key](value) for key, value in options.items()})
+    raise ValueError(f"未知的帧源: {spec}")
+
+
+def open_frame_source(device, backend=BACKEND_OPENCV):
+    """
+    按后端打开帧源
+
+    参数:
+        device: 设备路径，如 /dev/video2；也可以是虚拟帧源描述（见 open_virtual_source），此时忽略 backend
+        backend: "opencv"（cv2.VideoCapture）或 "v4l2"（V4L2 mmap 零拷贝后端）
+    返回:
+        满足 FrameSource 接口的对象，调用方通过 isOpened() 判断是否打开成功
+    """
+    if is_virtual_source(device):
+        return open_virtual_source(device)
+    if backend == BACKEND_V4L2:
+        from dh_usb_v4l2_capture import V4L2Capture
+        return V4L2Capture(device)
+    if backend != BACKEND_OPENCV:
+        raise ValueError(f"未知的采集后端: {backend}")
+    return cv2.VideoCapture(device)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+DH USB 摄像头热插拔监听模块
+通过 netlink 套接字接收内核/udev uevent，阻塞等待设备插入和移除事件（不轮询）
+"""
+
+import os
+import select
+import socket
+import struct
+import threading
+from dataclasses import dataclass, field
+
+
+NETLINK_KOBJECT_UEVENT = 15
+# netlink 多播组：1 为内核事件，2 为 udev 处理完成后（设备权限已设置）转发的事件
+UEVENT_GROUP_KERNEL = 1
+UEVENT_GROUP_UDEV = 2
+UDEV_MONITOR_MAGIC = 0xfeedcafe
+# udev 消息头：prefix[8], magic, header_size, properties_off, properties_len
+UDEV_HEADER = struct.Struct("!8sIIII")
+
+
+@dataclass
+class Uevent:
+    """
+    一条 uevent 消息
+    """
+    action: str
+    devpath: str
+    subsystem: str = ""
+    devname: str = ""
+    properties: dict = field(default_factory=dict)
+
+
+def _parse_properties(payload):
+    properties = {}
+    for item in payload.split(b"\0"):
+        key, sep, value = item.partition(b"=")
+        if sep:
+            properties[key.decode(errors="replace")] = value.decode(errors="replace")
+    return properties
+
+
+def parse_uevent(data):
+    """
+    解析 uevent 消息，支持内核格式（"action@devpath\\0KEY=VALUE\\0..."）和 libudev 格式
+    无法解析时返回 None
+    """
+    if data.startswith(b"libudev\0"):
+        if len(data) < UDEV_HEADER.size:
+            return None
+        _, magic, _, offset, length = UDEV_HEADER.unpack_from(data)
+        if magic != UDEV_MONITOR_MAGIC:
+            return None
+        properties = _parse_properties(data[offset:offset + length])
+    else:
+        header, _, payload = data.partition(b"\0")
+        if b"@" not in header:
+            return None
+        properties = _parse_properties(payload)
+
+    if "ACTION" not in properties or "DEVPATH" not in properties:
+        return None
+    return Uevent(
+        action=properties["ACTION"],
+        devpath=properties["DEVPATH"],
+        subsystem=properties.get("SUBSYSTEM", ""),
+        devname=os.path.basename(properties.get("DEVNAME", "")),
+        properties=properties,
+    )
+
+
+def open_uevent_socket(group=None):
+    """
+    打开 netlink uevent 套接字
+
+    参数:
+        group: 订阅的多播组，默认在 udev 运行时使用 UEVENT_GROUP_UDEV，
+               否则使用 UEVENT_GROUP_KERNEL
+    """
+    if group is None:
+        group = UEVENT_GROUP_UDEV if os.path.exists("/run/udev/control") else UEVENT_GROUP_KERNEL
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        sock.bind((0, group))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class UeventMonitor:
+    """
+    uevent 监听线程
+
+    在后台线程中阻塞等待事件，收到指定子系统的事件时调用 callback(event)。
+    sock 可以是任何支持 fileno() 和 recv() 的对象（如 socket.socketpair() 的一端），
+    便于在没有真实设备的环境中注入事件。
+    """
+
+    def __init__(self, callback, sock=None, subsystems=("video4linux",)):
+        self.callback = callback
+        self.sock = sock
+        self.subsystems = subsystems
+        self._thread = None
+        self._wake_r = None
+        self._wake_w = None
+
+    def start(self):
+        """
+        启动监听线程，无法打开 netlink 套接字时抛出 OSError
+        """
+        if self.sock is None:
+            self.sock = open_uevent_socket()
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="dh_usb_uevent", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止监听线程并关闭套接字
+        """
+        if self._thread is None:
+            return
+        os.write(self._wake_w, b"x")
+        self._thread.join(timeout=2)
+        self._thread = None
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+        self.sock.close()
+
+    def _run(self):
+        while True:
+            # 阻塞等待套接字可读或停止信号，不设置超时
+            readable, _, _ = select.select([self.sock, self._wake_r], [], [])
+            if self._wake_r in readable:
+                return
+            try:
+                data = self.sock.recv(1 << 16)
+            except OSError:
+                return
+            if not data:
+                return
+            event = parse_uevent(data)
+            if event is None or (self.subsystems and event.subsystem not in self.subsystems):
+                continue
+            try:
+                self.callback(event)
+            except Exception as e:
+                print(f"处理 uevent 时出错: {e}")
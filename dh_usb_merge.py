@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+多帧降噪合并模块
+将连续捕获的多帧逐帧累加到 float32 累加器中合并为一张低噪声图像（用于 3D 视觉标定拍摄），
+不保存所有帧，内存占用固定为一到两个 float32 整帧缓冲区，与帧数无关
+
+合并方式:
+  mean   - 逐帧累加求平均（cv2.accumulate），随机噪声标准差约降低到 1/sqrt(N)
+  median - 流式近似中值：每帧只按截断后的残差更新估计值，
+           偶发的异常值（闪烁、移动物体、热像素）对结果的影响有限
+可选对齐：以第一帧为参考，用缩小灰度图的相位相关估计平移，平移后再累加
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+MERGE_METHODS = ("mean", "median")
+# median：每帧残差截断到 ±MEDIAN_CLIP 灰度级后按 1/k 更新
+MEDIAN_CLIP = 8.0
+# 对齐：估计平移使用的缩小倍数
+ALIGN_STEP = 4
+
+
+def _gray_small(frame, step=ALIGN_STEP):
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape[:2]
+    small = cv2.resize(gray, (width // step, height // step), interpolation=cv2.INTER_AREA)
+    return np.float32(small)
+
+
+class FrameMerger:
+    """
+    多帧合并器：逐帧调用 add()，最后调用 result() 得到合并后的 uint8 图像
+
+    参数:
+        method: 合并方式（MERGE_METHODS 之一）
+        align: 是否在累加前按平移对齐到第一帧（默认假设画面静止）
+    """
+
+    def __init__(self, method="mean", align=False):
+        if method not in MERGE_METHODS:
+            raise ValueError(f"未知的合并方式: {method}")
+        self.method = method
+        self.align = align
+        self.frames = 0
+        self.merge_seconds = 0.0
+        self.max_shift = 0.0
+        self._acc = None
+        self._scratch = None
+        self._reference = None
+        self._window = None
+
+    @property
+    def memory_bytes(self):
+        """
+        累加器占用的内存（字节）
+        """
+        buffers = (self._acc, self._scratch, self._reference, self._window)
+        return sum(buf.nbytes for buf in buffers if buf is not None)
+
+    def _aligned(self, frame):
+        """
+        估计相对第一帧的平移并平移当前帧，第一帧作为参考直接返回
+        """
+        small = _gray_small(frame)
+        if self._reference is None:
+            self._reference = small
+            self._window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+            return frame
+        (dx, dy), _ = cv2.phaseCorrelate(self._reference, small, self._window)
+        dx, dy = -dx * ALIGN_STEP, -dy * ALIGN_STEP
+        self.max_shift = max(self.max_shift, abs(dx), abs(dy))
+        if abs(dx) < 0.5 and abs(dy) < 0.5:
+            return frame
+        matrix = np.float32([[1, 0, dx], [0, 1, dy]])
+        return cv2.warpAffine(frame, matrix, (frame.shape[1], frame.shape[0]), borderMode=cv2.BORDER_REPLICATE)
+
+    def add(self, frame):
+        """
+        合并一帧（frame 只在调用期间使用，调用后可被帧源复用）
+        """
+        start = time.perf_counter()
+        if self.align:
+            frame = self._aligned(frame)
+        self.frames += 1
+        if self._acc is None:
+            self._acc = np.float32(frame)
+            if self.method == "median":
+                self._scratch = np.empty_like(self._acc)
+        elif self.method == "mean":
+            cv2.accumulate(frame, self._acc)
+        else:
+            # 估计值 += clip(帧 - 估计值, ±MEDIAN_CLIP) / k
+            cv2.subtract(frame, self._acc, dst=self._scratch, dtype=cv2.CV_32F)
+            np.clip(self._scratch, -MEDIAN_CLIP, MEDIAN_CLIP, out=self._scratch)
+            cv2.scaleAdd(self._scratch, 1.0 / self.frames, self._acc, dst=self._acc)
+        self.merge_seconds += time.perf_counter() - start
+
+    def result(self):
+        """
+        合并结果（uint8），尚未添加帧时返回 None
+        """
+        if self._acc is None:
+            return None
+        scale = 1.0 / self.frames if self.method == "mean" else 1.0
+        return cv2.convertScaleAbs(self._acc, alpha=scale)
+
+    @property
+    def ms_per_frame(self):
+        return self.merge_seconds / self.frames * 1000 if self.frames else 0.0
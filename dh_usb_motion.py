@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+运动门控模块
+长时间无人值守录制时画面往往长时间不变，逐帧保存会写入大量相同的图像。
+录制循环在每个保存时间点先比较当前帧与上一次保存的帧（缩小后的灰度图），
+变化像素比例超过阈值才保存；画面一直不变时按保活间隔保存一帧，便于确认录制仍在运行
+
+与上一次保存的帧（而不是上一个时间点的帧）比较，缓慢的变化累积到阈值后同样会触发保存
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from dh_usb_scoring import SCORE_STEP, downsample, to_gray
+
+
+# 默认阈值：变化像素占比（%）
+MOTION_THRESHOLD = 1.0
+# 灰度差超过 PIXEL_DELTA 的像素计为变化像素（忽略传感器噪声和轻微的曝光波动）
+PIXEL_DELTA = 15
+
+
+class MotionGate:
+    """
+    运动门控：check() 判断当前帧是否需要保存，帧实际保存后调用 commit() 更新参考帧
+
+    参数:
+        threshold: 变化像素占比阈值（%）
+        keepalive: 画面不变时的保活保存间隔（秒），0 表示不保活
+        step: 比较用缩小倍数（1080p 缩小 16 倍为 120x67）
+        pixel_delta: 计为变化像素的灰度差
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, keepalive=0.0, step=SCORE_STEP, pixel_delta=PIXEL_DELTA):
+        self.threshold = threshold
+        self.keepalive = keepalive
+        self.step = step
+        self.pixel_delta = pixel_delta
+        self.motion_saves = 0
+        self.keepalive_saves = 0
+        self.skipped = 0
+        self.checks = 0
+        self.last_change = None
+        self.check_seconds = 0.0
+        self._reference = None
+        self._diff = None
+        self._last_save = None
+
+    def change_ratio(self, small):
+        """
+        缩小灰度图相对参考帧的变化像素占比（%）
+        """
+        cv2.absdiff(small, self._reference, dst=self._diff)
+        cv2.threshold(self._diff, self.pixel_delta, 255, cv2.THRESH_BINARY, dst=self._diff)
+        return cv2.countNonZero(self._diff) * 100.0 / self._diff.size
+
+    def check(self, frame, now=None):
+        """
+        判断是否保存当前帧（frame 可以是 BGR 图像或直通模式的 JPEG 数据），不修改参考帧
+        返回:
+            (保存原因, 缩小灰度图)：保存原因为 first/motion/keepalive，不需要保存时为 None；
+            帧实际保存后调用 commit() 以其作为新的参考帧
+        """
+        now = time.monotonic() if now is None else now
+        start = time.perf_counter()
+        self.checks += 1
+        small = downsample(frame, self.step)
+        if small is None:
+            # 无法比较时保存，避免因解码失败丢失画面
+            return "first", None
+        small = to_gray(small)
+        if self._reference is None or self._reference.shape != small.shape:
+            reason = "first"
+        else:
+            self.last_change = self.change_ratio(small)
+            if self.last_change >= self.threshold:
+                reason = "motion"
+            elif self.keepalive > 0 and now - self._last_save >= self.keepalive:
+                reason = "keepalive"
+            else:
+                reason = None
+                self.skipped += 1
+        self.check_seconds += time.perf_counter() - start
+        return reason, small
+
+    def commit(self, small, now, reason):
+        """
+        记录一次实际保存：以 check() 返回的缩小灰度图作为新的参考帧
+        （帧被保存流水线拒绝时不调用，参考帧和保活计时保持不变）
+        """
+        if small is not None:
+            # downsample() 每次返回新数组，可直接作为参考帧
+            if self._diff is None or self._diff.shape != small.shape:
+                self._diff = np.empty_like(small)
+            self._reference = small
+        self._last_save = now
+        if reason == "keepalive":
+            self.keepalive_saves += 1
+        else:
+            self.motion_saves += 1
+
+    def summary(self):
+        """
+        门控统计（供 stats 命令返回）
+        """
+        return {
+            "motion_saved": self.motion_saves,
+            "keepalive_saved": self.keepalive_saves,
+            "motion_skipped": self.skipped,
+            "motion_last_change_pct": round(self.last_change, 2) if self.last_change is not None else None,
+            "motion_check_us": round(self.check_seconds / self.checks * 1e6, 1) if self.checks else None,
+        }
+
+    def format_summary(self):
+        stats = self.summary()
+        return (f"运动保存 {stats['motion_saved']} 帧，保活保存 {stats['keepalive_saved']} 帧，"
+                f"跳过 {stats['motion_skipped']} 帧（阈值 {self.threshold:g}%）")
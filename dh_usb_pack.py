@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+帧打包存储模块
+逐帧保存 JPEG 文件时，每帧都要创建目录项（长时间录制后目录中有数十万个文件，列目录和备份都很慢）。
+打包模式把编码好的 JPEG 数据依次追加到大的 .pack 文件中，同名的 .idx 文件为每帧记录一条定长索引，
+每帧的开销只有两次追加写入；读取时内存映射索引和数据，按帧序号或时间范围直接定位，不需要扫描数据
+
+文件格式（小端）:
+  .pack - 各帧 JPEG 数据首尾相接（每段都是完整的 JPEG 文件）
+  .idx  - 16 字节文件头（INDEX_MAGIC + 记录长度 uint32 + 保留 uint32），
+          之后每帧一条 24 字节记录：偏移 uint64、长度 uint32、Unix 时间戳 float64、评分 float32
+          记录按写入顺序追加，重复帧（去重 link 方式）的记录指向已写入的数据，不重复存储
+
+文件命名: dh_usb_YYYYMMDD_HHMMSS_mmm.pack / .idx（第一帧的采集时刻），按时长或大小滚动到新文件
+"""
+
+import glob
+import math
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from dh_usb_pipeline import (_STOP, POLICY_DROP_NEWEST, SavePipeline, make_filename)
+from dh_usb_scoring import SCORERS, downsample
+
+
+INDEX_MAGIC = b"DHPKIDX1"
+INDEX_HEADER = struct.Struct("<8sII")
+INDEX_RECORD = struct.Struct("<QIdf")
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("timestamp", "<f8"), ("score", "<f4")])
+# 默认分包时长（秒）
+PACK_SECONDS = 300.0
+# 链接目标的最近写入位置保留条数（重复帧只会链接到最近保存的帧）
+_RECENT_LOCATIONS = 4
+
+
+def pack_paths(path):
+    """
+    由 .pack 或 .idx 路径得到 (数据文件路径, 索引文件路径)
+    """
+    root = os.path.splitext(path)[0]
+    return root + ".pack", root + ".idx"
+
+
+def list_packs(directory):
+    """
+    目录中的打包文件（按文件名即第一帧时刻排序）
+    """
+    return sorted(glob.glob(os.path.join(directory, "*.pack")))
+
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+class PackWriter:
+    """
+    追加写入一个打包文件对（数据 + 索引）
+
+    参数:
+        path: .pack 文件路径
+    """
+
+    def __init__(self, path):
+        self.path, self.index_path = pack_paths(path)
+        self._data = open(self.path, "ab")
+        self._index = open(self.index_path, "ab")
+        if self._index.tell() == 0:
+            self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_RECORD.size, 0))
+        self.size = self._data.tell()
+        self.frames = (self._index.tell() - INDEX_HEADER.size) // INDEX_RECORD.size
+
+    def append(self, data, timestamp, score=math.nan):
+        """
+        追加一帧，返回 (偏移, 长度)
+        """
+        offset = self.size
+        self._data.write(data)
+        self.size += len(data)
+        self.add_record(offset, len(data), timestamp, score)
+        return offset, len(data)
+
+    def add_record(self, offset, length, timestamp, score=math.nan):
+        """
+        追加一条索引记录（数据已在包中，例如重复帧）
+        """
+        self._index.write(INDEX_RECORD.pack(offset, length, _timestamp(timestamp), score))
+        self.frames += 1
+
+    def flush(self, sync=False):
+        """
+        刷新缓冲区，sync 为 True 时同步到磁盘（先数据后索引，索引不会指向未落盘的数据）
+        """
+        self._data.flush()
+        if sync:
+            os.fsync(self._data.fileno())
+        self._index.flush()
+        if sync:
+            os.fsync(self._index.fileno())
+
+    def close(self):
+        self.flush(sync=True)
+        self._data.close()
+        self._index.close()
+
+
+class PackReader:
+    """
+    打包文件读取：内存映射索引和数据，按帧序号或时间范围随机访问
+
+    帧序号按采集时刻排序（多个编码线程时记录可能不按时间顺序写入，打开时只对索引排序，不读取数据）
+    正在写入的包也可以打开，只包含打开时已写入的记录
+
+    参数:
+        path: .pack 或 .idx 文件路径
+    """
+
+    def __init__(self, path):
+        self.path, self.index_path = pack_paths(path)
+        with open(self.index_path, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+            if len(header) < INDEX_HEADER.size:
+                raise ValueError(f"索引文件不完整: {self.index_path}")
+            magic, record_size, _ = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or record_size != INDEX_RECORD.size:
+                raise ValueError(f"不是有效的帧打包索引: {self.index_path}")
+            count = (os.fstat(f.fileno()).st_size - INDEX_HEADER.size) // record_size
+            self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        self.records = (np.frombuffer(self._index_map, INDEX_DTYPE, count, INDEX_HEADER.size)
+                        if count else np.empty(0, INDEX_DTYPE))
+        if count > 1 and np.any(np.diff(self.records["timestamp"]) < 0):
+            self.records = self.records[np.argsort(self.records["timestamp"], kind="stable")]
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        # 只保留数据已完整写入的记录
+        if count:
+            complete = self.records["offset"] + self.records["length"] <= size
+            if not complete.all():
+                self.records = self.records[complete]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def timestamps(self):
+        """
+        各帧的 Unix 时间戳（按时间排序）
+        """
+        return self.records["timestamp"]
+
+    @property
+    def scores(self):
+        return self.records["score"]
+
+    def frame_bytes(self, k):
+        """
+        第 k 帧的 JPEG 数据（内存映射的 memoryview，不复制）
+        """
+        record = self.records[k]
+        offset = int(record["offset"])
+        return memoryview(self._data_map)[offset:offset + int(record["length"])]
+
+    def frame(self, k, flags=cv2.IMREAD_COLOR):
+        """
+        解码第 k 帧，失败时返回 None
+        """
+        return cv2.imdecode(np.frombuffer(self.frame_bytes(k), np.uint8), flags)
+
+    def find_range(self, start=None, end=None):
+        """
+        时间范围 [start, end) 内的帧序号范围（二分查找），start/end 为 Unix 时间戳或 datetime
+        返回:
+            range 对象
+        """
+        first = 0 if start is None else int(np.searchsorted(self.timestamps, _timestamp(start), "left"))
+        last = len(self) if end is None else int(np.searchsorted(self.timestamps, _timestamp(end), "left"))
+        return range(first, max(first, last))
+
+    def frames_between(self, start=None, end=None, decode=True):
+        """
+        依次返回时间范围内各帧的 (Unix 时间戳, 图像或 JPEG 数据)
+        """
+        for k in self.find_range(start, end):
+            yield float(self.timestamps[k]), self.frame(k) if decode else self.frame_bytes(k)
+
+    def close(self):
+        self.records = np.empty(0, INDEX_DTYPE)
+        for name in ("_index_map", "_data_map"):
+            mapped = getattr(self, name)
+            if mapped is not None:
+                try:
+                    mapped.close()
+                except BufferError:
+                    # 仍有 frame_bytes() 返回的 memoryview 在使用，映射随对象释放
+                    pass
+                setattr(self, name, None)
+
+
+class PackPipeline(SavePipeline):
+    """
+    打包保存流水线：编码线程池与 SavePipeline 相同，写盘线程把编码结果追加到打包文件
+
+    参数:
+        output_dir: 保存目录
+        quality: JPEG 质量，默认 95
+        encoder_workers: 编码线程数，默认 2
+        score: 写入索引的评分方式（dh_usb_scoring.SCORERS 中的键），None 时不评分；
+            在写盘线程中对 JPEG 数据按 1/8 缩小解码后计算
+        pack_seconds: 分包时长（秒），按采集时刻计算
+        pack_bytes: 分包大小上限（字节），0 表示不限制
+        sync_seconds: 至少每隔多少秒 fsync 一次（0 表示只在分包结束和停止时 fsync）
+        其余参数同 SavePipeline
+    """
+
+    def __init__(self, output_dir="recordings", quality=95, encoder_workers=2, score="brightness",
+                 pack_seconds=PACK_SECONDS, pack_bytes=0, sync_seconds=0.0, queue_size=8, verbose=True,
+                 policy=POLICY_DROP_NEWEST, history=10000, dedup=None):
+        super().__init__(output_dir, quality, encoder_workers, queue_size=queue_size, verbose=verbose,
+                         policy=policy, history=history, dedup=dedup)
+        self.score = SCORERS[score] if score else None
+        self.pack_seconds = pack_seconds
+        self.pack_bytes = pack_bytes
+        self.sync_seconds = sync_seconds
+        self.packs = 0
+        self.pack = None
+        self._pack_start = None
+        self._last_sync = 0.0
+        self._locations = OrderedDict()
+
+    def _score(self, data):
+        if self.score is None:
+            return math.nan
+        buf = np.frombuffer(data, np.uint8)
+        small = downsample(buf)
+        if small is None:
+            return math.nan
+        details = self.score(buf, small)
+        return float(details["score"] if isinstance(details, dict) else details)
+
+    def _finish_pack(self):
+        if self.pack is None:
+            return
+        self.pack.close()
+        if self.verbose:
+            print(f"  [{datetime.now().strftime('%H:%M:%S')}] 打包: {os.path.basename(self.pack.path)}"
+                  f"（{self.pack.frames} 帧，{self.pack.size / 1e6:.1f} MB）")
+        with self._lock:
+            self.packs += 1
+        self.pack = None
+
+    def _pack_for(self, captured_at):
+        """
+        当前分包，达到时长或大小上限时滚动到新文件
+        """
+        if self.pack is not None:
+            elapsed = (captured_at - self._pack_start).total_seconds()
+            if elapsed >= self.pack_seconds or (self.pack_bytes > 0 and self.pack.size >= self.pack_bytes):
+                self._finish_pack()
+        if self.pack is None:
+            self.pack = PackWriter(os.path.join(self.output_dir, make_filename(captured_at, ext=".pack")))
+            self._pack_start = captured_at
+        return self.pack
+
+    def _add_link(self, location, captured_at):
+        """
+        重复帧：添加指向已写入数据的索引记录（目标在之前的分包中时重新写入数据）
+        """
+        pack, offset, length, score, data = location
+        current = self._pack_for(captured_at)
+        if current is pack:
+            current.add_record(offset, length, captured_at, score)
+        else:
+            current.append(data, captured_at, score)
+        with self._lock:
+            self.linked += 1
+
+    def _write_worker(self):
+        # 等待目标写入的重复帧：{目标文件名: [采集时刻, ...]}，停止时未能创建的由 close() 统计
+        pending = self._pending_links
+        while True:
+            item = self.write_queue.get()
+            if item is _STOP:
+                self._finish_pack()
+                return
+            self._discard_lost_links(pending)
+            captured_at, data, submitted_at, encoded_at, link = item
+            filename = make_filename(captured_at)
+            if link is not None:
+                if link in self._locations:
+                    self._add_link(self._locations[link], captured_at)
+                elif self._lost_reason(link) is not None:
+                    self._discard_links(link, 1, self._lost_reason(link))
+                else:
+                    # 目标帧仍在编码，写入后再添加记录
+                    pending.setdefault(link, []).append(captured_at)
+                continue
+            start = time.perf_counter()
+            score = self._score(data)
+            try:
+                pack = self._pack_for(captured_at)
+                offset, length = pack.append(data, captured_at, score)
+                # 每帧刷新到内核（读取端可以看到正在写入的包），按 sync_seconds 间隔 fsync
+                now = time.monotonic()
+                sync = self.sync_seconds > 0 and now - self._last_sync >= self.sync_seconds
+                pack.flush(sync)
+                if sync:
+                    self._last_sync = now
+                success = True
+            except OSError as e:
+                print(f"  错误: 无法写入打包文件: {e}")
+                success = False
+            end = time.perf_counter()
+            with self._lock:
+                self.write_seconds += end - start
+                self.latencies["write"].append(end - encoded_at)
+                self.latencies["total"].append(end - submitted_at)
+                if success:
+                    self.saved += 1
+                    self.bytes_written += len(data)
+                else:
+                    self.errors += 1 + len(pending.get(filename, []))
+            links = pending.pop(filename, [])
+            if not success:
+                self._mark_lost(filename, "error")
+                continue
+            if self.dedup is not None:
+                self.dedup.record_written(len(data))
+            self._locations[filename] = (pack, offset, length, score, data)
+            if len(self._locations) > _RECENT_LOCATIONS:
+                self._locations.popitem(last=False)
+            for linked_at in links:
+                self._add_link(self._locations[filename], linked_at)
+            if self.verbose:
+                print(f"  [{datetime.now().strftime('%H:%M:%S')}] 保存: {filename} -> {os.path.basename(pack.path)}"
+                      f" #{pack.frames - 1}")
+
+    def summary(self):
+        stats = super().summary()
+        stats["container"] = "pack"
+        stats["packs"] = self.packs + (1 if self.pack is not None else 0)
+        return stats
+
+    def format_summary(self):
+        stats = self.summary()
+        return f"{super().format_summary()}，打包文件 {stats['packs']} 个"
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+图像保存流水线
+采集线程只把帧放入有界队列，由编码线程池（cv2.imencode 编码时释放 GIL）
+和独立的写盘线程完成 JPEG 编码和文件写入，采集线程不会因编码或磁盘 I/O 阻塞
+队列积压时按背压策略处理：阻塞、丢弃最新帧、丢弃最旧帧或降低 JPEG 质量
+摄像头输出 MJPEG 时支持直通模式：直接写入摄像头压缩好的数据，不解码也不重新编码
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+# 停止信号
+_STOP = object()
+
+# 背压策略
+POLICY_BLOCK = "block"
+POLICY_DROP_NEWEST = "drop-newest"
+POLICY_DROP_OLDEST = "drop-oldest"
+POLICY_DEGRADE_QUALITY = "degrade-quality"
+BACKPRESSURE_POLICIES = (POLICY_BLOCK, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST, POLICY_DEGRADE_QUALITY)
+# degrade-quality 策略：队列占用超过该比例后开始降低质量，最低降到 MIN_DEGRADED_QUALITY
+DEGRADE_START_FILL = 0.5
+MIN_DEGRADED_QUALITY = 60
+# 各阶段延迟：排队等待编码、编码、等待写盘+写盘、提交到写入完成
+LATENCY_STAGES = ("queue_wait", "encode", "write", "total")
+# 记录最近多少个未能保存的帧（用于丢弃以它们为链接目标的重复帧）
+_LOST_TARGETS = 64
+
+
+def percentile(ordered, q):
+    """
+    已排序样本的 q 分位数（0 <= q <= 1，取最近秩）
+    """
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def make_filename(captured_at, prefix="dh_usb", ext=".jpg"):
+    """
+    按采集时刻生成文件名：dh_usb_YYYYMMDD_HHMMSS_mmm.jpg
+    """
+    return f"{prefix}_{captured_at.strftime('%Y%m%d_%H%M%S_%f')[:-3]}{ext}"
+
+
+def encode_jpeg(frame, quality=95):
+    """
+    JPEG 编码，返回 bytes 形式的数据，失败时返回 None
+    """
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+
+_standard_dht = None
+
+
+def _standard_huffman_tables():
+    """
+    取得标准 Huffman 表（DHT 段）：libjpeg 未开启优化时使用 JPEG 标准附录 K 的默认表，
+    从一次小图编码结果中提取，避免在代码中硬编码表数据
+    """
+    global _standard_dht
+    if _standard_dht is None:
+        data = encode_jpeg(np.zeros((8, 8, 3), dtype=np.uint8), 95)
+        segments = []
+        pos = 2
+        while pos + 4 <= len(data) and data[pos] == 0xFF:
+            marker = data[pos + 1]
+            length = int.from_bytes(data[pos + 2:pos + 4], "big")
+            if marker == 0xC4:
+                segments.append(data[pos:pos + 2 + length])
+            if marker == 0xDA:
+                break
+            pos += 2 + length
+        _standard_dht = b"".join(segments)
+    return _standard_dht
+
+
+def ensure_huffman_tables(data):
+    """
+    UVC 摄像头输出的 MJPEG 帧通常省略 Huffman 表（依赖解码器使用默认表），
+    单独保存为 JPEG 文件时部分软件无法打开。缺少 DHT 段时在 SOS 之前插入标准表
+    """
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xC4:
+            return data
+        if marker == 0xDA:
+            return data[:pos] + _standard_huffman_tables() + data[pos:]
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+    return data
+
+
+def is_jpeg(data):
+    """
+    是否为 JPEG 数据（以 SOI 标记 FF D8 开头）
+    """
+    return len(data) > 4 and data[0] == 0xFF and data[1] == 0xD8
+
+
+def decode_frame(data):
+    """
+    将直通模式下的压缩帧解码为 BGR 图像（只在需要像素的分析阶段调用）
+    失败时返回 None
+    """
+    buf = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else data.reshape(-1)
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def write_file(filepath, data):
+    """
+    写入文件，返回是否成功
+    """
+    try:
+        with open(filepath, "wb") as f:
+            f.write(data)
+        return True
+    except OSError:
+        return False
+
+
+class SavePipeline:
+    """
+    两级保存流水线：编码队列 -> 编码线程池 -> 写盘队列 -> 写盘线程
+
+    参数:
+        output_dir: 保存目录
+        quality: JPEG 质量，默认 95
+        encoder_workers: 编码线程数，默认 2
+        queue_size: 编码队列和写盘队列的容量（帧），默认 8
+        verbose: 是否打印每个保存的文件名
+        history: 用于计算各阶段延迟分位数的最近样本数
+        dedup: 可选的重复帧检测器（dh_usb_dedup.FrameDeduplicator），与上一次保存的帧重复时跳过或硬链接
+        policy: 编码队列已满时的背压策略（BACKPRESSURE_POLICIES 之一），默认 drop-newest
+            block           - 采集线程等待队列空出位置（调度会因此延迟）
+            drop-newest     - 丢弃新提交的帧
+            drop-oldest     - 丢弃队列中最旧的帧，放入新帧
+            degrade-quality - 队列占用超过一半后逐步降低 JPEG 质量，仍然已满时丢弃新帧
+    """
+
+    def __init__(self, output_dir="recordings", quality=95, encoder_workers=2, queue_size=8, verbose=True,
+                 policy=POLICY_DROP_NEWEST, history=10000, dedup=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"未知的背压策略: {policy}")
+        self.output_dir = output_dir
+        self.quality = quality
+        self.encoder_workers = max(1, encoder_workers)
+        self.verbose = verbose
+        self.policy = policy
+        self.dedup = dedup
+        self.encode_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._writer = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.saved = 0
+        self.dropped = 0
+        self.degraded = 0
+        self.linked = 0
+        self.errors = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self.latencies = {stage: deque(maxlen=history) for stage in LATENCY_STAGES}
+        # 硬链接目标尚未写入时暂存：{目标文件名: [链接文件名, ...]}（只在写盘线程中访问）
+        self._pending_links = {}
+        # 被丢弃或编码/写入失败的帧：{文件名: "dropped" 或 "error"}，以它们为目标的重复帧随之丢弃
+        self._lost_targets = OrderedDict()
+
+    def start(self):
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        for i in range(self.encoder_workers):
+            thread = threading.Thread(target=self._encode_worker, name=f"dh_usb_encode_{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._writer = threading.Thread(target=self._write_worker, name="dh_usb_writer", daemon=True)
+        self._writer.start()
+        return self
+
+    def _degraded_quality(self):
+        """
+        按编码队列占用比例线性降低 JPEG 质量
+        """
+        fill = self.encode_queue.qsize() / self.encode_queue.maxsize
+        if fill < DEGRADE_START_FILL:
+            return self.quality
+        ratio = (fill - DEGRADE_START_FILL) / (1 - DEGRADE_START_FILL)
+        lowest = min(self.quality, MIN_DEGRADED_QUALITY)
+        return int(round(self.quality - (self.quality - lowest) * ratio))
+
+    def _drop(self, captured_at, reason):
+        with self._lock:
+            self.dropped += 1
+        self._mark_lost(make_filename(captured_at), "dropped")
+        print(f"  警告: {reason}，丢弃帧 {make_filename(captured_at)}")
+
+    def _mark_lost(self, filename, reason):
+        """
+        记录未能保存的帧（reason 为 "dropped" 或 "error"），以它为链接目标的重复帧将被丢弃
+        """
+        if self.dedup is None:
+            return
+        if self.dedup.last_filename == filename:
+            # 丢失的是去重参考帧，之后的重复帧无法链接到它
+            self.dedup.reset()
+        with self._lock:
+            self._lost_targets[filename] = reason
+            if len(self._lost_targets) > _LOST_TARGETS:
+                self._lost_targets.popitem(last=False)
+
+    def _lost_reason(self, target):
+        with self._lock:
+            return self._lost_targets.get(target)
+
+    def _discard_links(self, target, count, reason):
+        """
+        丢弃 count 个链接目标未能保存的重复帧：目标被丢弃时计入 dropped，编码/写入失败时计入 errors
+        """
+        with self._lock:
+            if reason == "dropped":
+                self.dropped += count
+            else:
+                self.errors += count
+        print(f"  警告: 链接目标 {target} 未能保存，丢弃 {count} 个重复帧")
+
+    def _discard_lost_links(self, pending):
+        """
+        丢弃暂存中目标已确定无法保存的链接（pending: {目标文件名: [...]}）
+        """
+        if not pending:
+            return
+        with self._lock:
+            lost = [(target, self._lost_targets[target]) for target in pending if target in self._lost_targets]
+        for target, reason in lost:
+            self._discard_links(target, len(pending.pop(target)), reason)
+
+    def submit(self, frame, captured_at=None, encoded=False, force=False):
+        """
+        提交一帧。除 block 策略外不会阻塞，编码队列已满时按背压策略处理
+        encoded 为 True 时 frame 是摄像头输出的 MJPEG 数据，直接写盘不重新编码
+        force 为 True 时不做去重（必须保存的帧，例如运动门控的保活帧）
+        返回新帧是否已放入队列
+        """
+        captured_at = captured_at or datetime.now()
+        link = None
+        if self.dedup is not None:
+            link = self.dedup.check(frame, make_filename(captured_at), force)
+            if link is not None and self.dedup.mode == "skip":
+                return False
+        quality = self.quality
+        if self.policy == POLICY_DEGRADE_QUALITY:
+            quality = self._degraded_quality()
+        # 硬链接的重复帧不需要编码，只保留链接目标
+        item = (None if link else frame, captured_at, quality, encoded, time.perf_counter(), link)
+
+        if self.policy == POLICY_BLOCK:
+            self.encode_queue.put(item)
+        else:
+            try:
+                self.encode_queue.put_nowait(item)
+            except queue.Full:
+                if self.policy != POLICY_DROP_OLDEST:
+                    self._drop(captured_at, "保存队列已满")
+                    return False
+                # 取出最旧的帧为新帧腾出位置（编码线程可能恰好取走，此时无需丢弃）
+                try:
+                    old_captured_at = self.encode_queue.get_nowait()[1]
+                    self._drop(old_captured_at, "保存队列已满，为新帧腾出位置")
+                except queue.Empty:
+                    pass
+                try:
+                    self.encode_queue.put_nowait(item)
+                except queue.Full:
+                    self._drop(captured_at, "保存队列已满")
+                    return False
+        with self._lock:
+            self.submitted += 1
+            if quality < self.quality and not encoded:
+                self.degraded += 1
+        return True
+
+    def close(self):
+        """
+        等待队列中的帧全部写入后停止所有线程
+        """
+        for _ in self._threads:
+            self.encode_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._writer is not None:
+            self.write_queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+        # 目标帧被丢弃或编码/写入失败时，等待中的链接无法创建
+        self._discard_lost_links(self._pending_links)
+        with self._lock:
+            self.errors += sum(len(names) for names in self._pending_links.values())
+        self._pending_links = {}
+
+    def _encode_worker(self):
+        while True:
+            item = self.encode_queue.get()
+            if item is _STOP:
+                return
+            frame, captured_at, quality, encoded, submitted_at, link = item
+            if link is not None:
+                self.write_queue.put((captured_at, None, submitted_at, time.perf_counter(), link))
+                continue
+            start = time.perf_counter()
+            if encoded:
+                data = frame.tobytes() if isinstance(frame, np.ndarray) else bytes(frame)
+                data = ensure_huffman_tables(data) if is_jpeg(data) else None
+            else:
+                data = encode_jpeg(frame, quality)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.encode_seconds += elapsed
+                self.latencies["queue_wait"].append(start - submitted_at)
+                self.latencies["encode"].append(elapsed)
+            if data is None:
+                with self._lock:
+                    self.errors += 1
+                print(f"  错误: 无法编码图像 {make_filename(captured_at)}")
+                self._mark_lost(make_filename(captured_at), "error")
+                continue
+            # 写盘队列满时在编码线程中等待（不影响采集线程）
+            self.write_queue.put((captured_at, data, submitted_at, time.perf_counter(), None))
+
+    def _write_worker(self):
+        while True:
+            item = self.write_queue.get()
+            if item is _STOP:
+                return
+            self._discard_lost_links(self._pending_links)
+            captured_at, data, submitted_at, encoded_at, link = item
+            filename = make_filename(captured_at)
+            if link is not None:
+                if os.path.exists(os.path.join(self.output_dir, link)):
+                    self._link(link, filename)
+                elif self._lost_reason(link) is not None:
+                    self._discard_links(link, 1, self._lost_reason(link))
+                else:
+                    # 目标帧仍在编码（多个编码线程时可能晚于重复帧到达），写入后再创建链接
+                    self._pending_links.setdefault(link, []).append(filename)
+                continue
+            filepath = os.path.join(self.output_dir, filename)
+            start = time.perf_counter()
+            success = write_file(filepath, data)
+            end = time.perf_counter()
+            elapsed = end - start
+            with self._lock:
+                self.write_seconds += elapsed
+                self.latencies["write"].append(end - encoded_at)
+                self.latencies["total"].append(end - submitted_at)
+                if success:
+                    self.saved += 1
+                    self.bytes_written += len(data)
+                else:
+                    self.errors += 1
+            pending = self._pending_links.pop(filename, [])
+            if not success:
+                print(f"  错误: 无法保存图像到 {filepath}")
+                with self._lock:
+                    self.errors += len(pending)
+                self._mark_lost(filename, "error")
+                continue
+            if self.dedup is not None:
+                self.dedup.record_written(len(data))
+            for name in pending:
+                self._link(filename, name)
+            if self.verbose:
+                print(f"  [{datetime.now().strftime('%H:%M:%S')}] 保存: {filename}")
+
+    def _link(self, target, filename):
+        """
+        创建指向已保存文件的硬链接（重复帧）
+        """
+        try:
+            os.link(os.path.join(self.output_dir, target), os.path.join(self.output_dir, filename))
+        except OSError as e:
+            with self._lock:
+                self.errors += 1
+            print(f"  错误: 无法创建硬链接 {filename} -> {target}: {e}")
+            return
+        with self._lock:
+            self.linked += 1
+        if self.verbose:
+            print(f"  [{datetime.now().strftime('%H:%M:%S')}] 重复帧: {filename} -> {target}")
+
+    def latency_summary(self):
+        """
+        各阶段延迟分位数（毫秒）：{阶段: {"p50", "p95", "p99", "max"}}，没有样本的阶段不返回
+        """
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self.latencies.items() if values}
+        return {stage: {"p50": percentile(ordered, 0.5) * 1000, "p95": percentile(ordered, 0.95) * 1000,
+                        "p99": percentile(ordered, 0.99) * 1000, "max": ordered[-1] * 1000}
+                for stage, ordered in samples.items()}
+
+    def summary(self):
+        with self._lock:
+            stats = {
+                "policy": self.policy,
+                "queued": self.encode_queue.qsize() + self.write_queue.qsize(),
+                "submitted": self.submitted,
+                "saved": self.saved,
+                "linked": self.linked,
+                "dropped": self.dropped,
+                "degraded": self.degraded,
+                "errors": self.errors,
+                "bytes_written": self.bytes_written,
+                "encode_ms_avg": self.encode_seconds / max(1, self.saved) * 1000,
+                "write_ms_avg": self.write_seconds / max(1, self.saved) * 1000,
+            }
+        if self.dedup is not None:
+            stats.update(self.dedup.summary())
+        return stats
+
+    def format_summary(self):
+        stats = self.summary()
+        return (f"策略 {stats['policy']}，排队 {stats['queued']} 帧，提交 {stats['submitted']} 帧，"
+                f"保存 {stats['saved']} 帧，硬链接 {stats['linked']} 帧，丢弃 {stats['dropped']} 帧，降质 {stats['degraded']} 帧，"
+                f"错误 {stats['errors']} 次，写入 {stats['bytes_written'] / 1e6:.1f} MB，"
+                f"平均编码 {stats['encode_ms_avg']:.1f} ms，平均写盘 {stats['write_ms_avg']:.1f} ms"
+                + (f"，去重: {self.dedup.format_summary()}" if self.dedup is not None else ""))
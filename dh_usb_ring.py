@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+帧环形缓冲区模块
+在待机和录制期间持续保留最近若干秒的帧，收到快照命令时写入磁盘，
+操作员触发较晚时仍能拿到触发之前的画面
+
+存储在第一帧到达时一次性分配，之后每帧直接写入下一个槽位，不再分配内存:
+  解码帧 - (容量, 高, 宽, 通道) 的 uint8 数组，cv2.VideoCapture.retrieve() 直接解码到槽位中
+  直通帧 - 摄像头输出的 MJPEG 数据复制到 (容量, 槽位字节数) 的 uint8 数组，记录每帧长度，
+           超过槽位大小的帧跳过（计入 oversize）
+"""
+
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dh_usb_pipeline import encode_jpeg, ensure_huffman_tables, is_jpeg, make_filename, write_file
+
+
+# 直通帧槽位大小 = 第一帧大小 * SLOT_MARGIN（至少 MIN_SLOT_BYTES）
+SLOT_MARGIN = 2.0
+MIN_SLOT_BYTES = 64 * 1024
+
+
+class FrameRing:
+    """
+    最近 seconds 秒的帧环形缓冲区，由取帧线程在每次 grab() 之后调用 offer()
+
+    参数:
+        seconds: 保留时长（秒）
+        fps: 存入帧率上限，默认每个 grab() 到的帧都存入（容量按帧源帧率计算）
+        quality: 快照时解码帧的 JPEG 质量
+    """
+
+    def __init__(self, seconds, fps=None, quality=95):
+        self.seconds = seconds
+        self.fps = fps
+        self.quality = quality
+        self.capacity = 0
+        self.encoded = False
+        self.stored = 0
+        self.oversize = 0
+        self.frozen = False
+        self._lock = threading.Lock()
+        self._slots = None
+        self._lengths = None
+        self._times = None
+        self._next = 0
+        self._count = 0
+        self._due = 0.0
+
+    @property
+    def frames(self):
+        """
+        缓冲区中的帧数
+        """
+        return self._count
+
+    @property
+    def memory_bytes(self):
+        """
+        预分配存储占用的内存（字节）
+        """
+        return self._slots.nbytes if self._slots is not None else 0
+
+    def _allocate(self, frame, encoded, source_fps):
+        rate = self.fps or source_fps or 30.0
+        self.capacity = max(1, math.ceil(self.seconds * rate))
+        self.encoded = encoded
+        if encoded:
+            slot_bytes = max(MIN_SLOT_BYTES, int(frame.size * SLOT_MARGIN))
+            self._slots = np.empty((self.capacity, slot_bytes), dtype=np.uint8)
+        else:
+            self._slots = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+        self._lengths = np.zeros(self.capacity, dtype=np.int64)
+        self._times = np.zeros(self.capacity, dtype=np.float64)
+        self._next = 0
+        self._count = 0
+        print(f"帧环形缓冲区: {self.capacity} 帧（{self.seconds:g} 秒），"
+              f"{'直通 MJPEG' if encoded else '解码帧'}，预分配 {self.memory_bytes / 1024 / 1024:.0f} MB")
+
+    def _store(self, cap, encoded):
+        """
+        从帧源取出最近一次 grab() 的帧写入下一个槽位，返回槽位中的帧（失败时返回 None）
+        """
+        if self._slots is None or self.encoded != encoded:
+            ret, frame = cap.retrieve()
+            if not ret or frame is None:
+                return None
+            self._allocate(frame.reshape(-1) if encoded else frame, encoded, cap.get(cv2.CAP_PROP_FPS))
+        slot = self._slots[self._next]
+        if encoded:
+            ret, data = cap.retrieve()
+            if not ret or data is None:
+                return None
+            data = data.reshape(-1)
+            if data.size > slot.size:
+                self.oversize += 1
+                return None
+            slot[:data.size] = data
+            self._lengths[self._next] = data.size
+            return slot[:data.size]
+        ret, frame = cap.retrieve(slot)
+        if not ret or frame is None:
+            return None
+        if frame is not slot:
+            if frame.shape != slot.shape:
+                # 分辨率变化：按新尺寸重新分配
+                self._slots = None
+                return self._store(cap, encoded)
+            np.copyto(slot, frame)
+        return slot
+
+    def offer(self, cap, now, encoded=False):
+        """
+        到达存入时间时保存帧源最近一次 grab() 的帧
+        参数:
+            cap: 帧源（已 grab()）
+            now: 当前时刻（time.monotonic()），用于限制存入帧率
+            encoded: 帧源是否输出直通的 MJPEG 数据
+        返回:
+            写入槽位的帧（槽位之后会被覆盖，长期持有需复制），未存入时返回 None
+        """
+        if now < self._due:
+            return None
+        with self._lock:
+            if self.frozen:
+                return None
+            frame = self._store(cap, encoded)
+            if frame is None:
+                return None
+            self._times[self._next] = time.time()
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self.stored += 1
+        if self.fps:
+            self._due = max(self._due + 1.0 / self.fps, now - 1.0 / self.fps)
+        return frame
+
+    def dump(self, output_dir):
+        """
+        将缓冲区中的帧按时间顺序写入 output_dir（文件名为各帧的采集时刻）
+        写盘期间暂停存入新帧，保证写出的是触发时刻之前的画面
+        返回 (写入帧数, 写入字节数)
+        """
+        with self._lock:
+            if self._slots is None or self._count == 0:
+                return 0, 0
+            self.frozen = True
+            order = [(self._next - self._count + i) % self.capacity for i in range(self._count)]
+        try:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            written = total = 0
+            for index in order:
+                if self.encoded:
+                    data = self._slots[index, :self._lengths[index]].tobytes()
+                    data = ensure_huffman_tables(data) if is_jpeg(data) else None
+                else:
+                    data = encode_jpeg(self._slots[index], self.quality)
+                if data is None:
+                    continue
+                filename = make_filename(datetime.fromtimestamp(self._times[index]))
+                if write_file(os.path.join(output_dir, filename), data):
+                    written += 1
+                    total += len(data)
+            return written, total
+        finally:
+            self.frozen = False
+
+    def summary(self):
+        """
+        缓冲区状态（供 stats 命令返回）
+        """
+        with self._lock:
+            span = 0.0
+            if self._count > 1:
+                newest = self._times[(self._next - 1) % self.capacity]
+                oldest = self._times[(self._next - self._count) % self.capacity]
+                span = newest - oldest
+        return {
+            "ring_frames": self._count,
+            "ring_capacity": self.capacity,
+            "ring_seconds_held": round(float(span), 2),
+            "ring_memory_mb": round(self.memory_bytes / 1024 / 1024, 1),
+            "ring_oversize": self.oversize,
+        }
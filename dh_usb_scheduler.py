@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+录制间隔调度模块
+基于单调时钟，以绝对时间点 t0 + k*interval 为保存截止时间，
+长时间运行时保存速率不漂移，并统计每次保存的抖动和错过的时间点
+"""
+
+import math
+import time
+from collections import deque
+
+
+class IntervalScheduler:
+    """
+    绝对截止时间调度器
+
+    参数:
+        interval: 保存间隔（秒）
+        clock: 单调时钟函数，默认 time.monotonic
+        history: 用于计算抖动分位数的最近样本数
+    """
+
+    def __init__(self, interval, clock=time.monotonic, history=10000):
+        self.interval = interval
+        self.clock = clock
+        self.t0 = None
+        self.k = 1
+        self.saves = 0
+        self.skipped = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.jitters = deque(maxlen=history)
+
+    def start(self, now=None, immediate=False):
+        """
+        从当前时刻开始计时，第一次保存在 t0 + interval（immediate 为 True 时第一次保存在 t0）
+        """
+        self.t0 = self.clock() if now is None else now
+        self.k = 0 if immediate else 1
+
+    @property
+    def next_deadline(self):
+        return self.t0 + self.k * self.interval
+
+    def time_until_deadline(self, now=None):
+        now = self.clock() if now is None else now
+        return self.next_deadline - now
+
+    def is_due(self, now=None):
+        return self.time_until_deadline(now) <= 0
+
+    def record_save(self, now=None):
+        """
+        记录一次保存：统计相对截止时间的延迟（抖动），
+        延迟超过一个间隔时记为错过的时间点，并跳到下一个未来的截止时间
+        返回本次抖动（秒）
+        """
+        now = self.clock() if now is None else now
+        jitter = now - self.next_deadline
+        self.saves += 1
+        self.jitter_sum += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        self.jitters.append(jitter)
+
+        self._advance(now)
+        return jitter
+
+    def record_skip(self, now=None):
+        """
+        记录一个按条件跳过（不保存）的时间点，跳到下一个截止时间
+        """
+        now = self.clock() if now is None else now
+        self.skipped += 1
+        self._advance(now)
+
+    def _advance(self, now):
+        next_k = math.floor((now - self.t0) / self.interval) + 1
+        self.missed += max(0, next_k - self.k - 1)
+        self.k = max(self.k + 1, next_k)
+
+    def summary(self):
+        """
+        返回统计信息字典（抖动单位为毫秒）
+        """
+        stats = {"saves": self.saves, "skipped": self.skipped, "missed": self.missed}
+        if self.jitters:
+            ordered = sorted(self.jitters)
+            stats.update({
+                "jitter_mean_ms": self.jitter_sum / self.saves * 1000,
+                "jitter_p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "jitter_max_ms": self.jitter_max * 1000,
+            })
+        if self.t0 is not None and self.saves:
+            elapsed = self.clock() - self.t0
+            stats["rate_hz"] = self.saves / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def format_summary(self):
+        stats = self.summary()
+        text = f"保存 {stats['saves']} 帧，错过 {stats['missed']} 个时间点"
+        if stats["skipped"]:
+            text += f"，跳过 {stats['skipped']} 个时间点"
+        if "jitter_mean_ms" in stats:
+            text += (f"，抖动 平均 {stats['jitter_mean_ms']:.1f} ms / "
+                     f"P95 {stats['jitter_p95_ms']:.1f} ms / 最大 {stats['jitter_max_ms']:.1f} ms")
+        return text
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+帧评分模块
+从连续读取的多帧中挑选最佳帧。评分在缩小后的图像上计算（最近邻缩小，1080p 每帧约 20 微秒），
+最佳帧只保存引用、不复制整帧；评分函数可替换，接收原始帧和缩小后的图像，
+返回越大越好的分数，或包含 "score" 及各分项的字典
+
+评分方式:
+  brightness - 平均亮度最高（原有方式，容易选中过曝或运动模糊的帧）
+  exposure   - 平均亮度接近目标值且过曝/欠曝像素少
+  sharpness  - 画面中心区域的拉普拉斯方差（对焦/运动模糊）最大
+  composite  - 曝光和清晰度加权组合，减去过曝/欠曝比例
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+# 评分用缩小倍数（宽高各缩小 SCORE_STEP 倍）
+SCORE_STEP = 16
+# BGR 转灰度的权重（与 cv2.COLOR_BGR2GRAY 一致）
+GRAY_WEIGHTS = (0.114, 0.587, 0.299)
+# 曝光评分：目标平均亮度，以及视为欠曝/过曝的灰度阈值
+EXPOSURE_TARGET = 118.0
+CLIP_LOW = 3
+CLIP_HIGH = 252
+# 清晰度评分：取画面中心 SHARPNESS_ROI 比例的区域，宽高各缩小 SHARPNESS_STEP 倍后计算拉普拉斯方差；
+# 方差为 SHARPNESS_REFERENCE 时归一化清晰度为 0.5
+SHARPNESS_ROI = 0.5
+SHARPNESS_STEP = 2
+SHARPNESS_REFERENCE = 100.0
+# 综合评分权重
+COMPOSITE_WEIGHTS = {"exposure": 0.4, "sharpness": 0.6, "clipped": 1.0}
+
+
+def downsample(frame, step=SCORE_STEP):
+    """
+    缩小帧用于评分：BGR/灰度图最近邻缩小，YUYV 原始数据取 Y 分量，
+    直通模式的 JPEG 数据按 1/8 缩小解码（libjpeg 直接输出缩小图，无需完整解码）
+
+    返回:
+        缩小后的 BGR 或灰度图，无法处理时返回 None
+    """
+    if frame is None or frame.size == 0:
+        return None
+    if frame.ndim == 1:
+        return cv2.imdecode(frame, cv2.IMREAD_REDUCED_COLOR_8)
+    if frame.ndim == 3 and frame.shape[2] == 2:
+        frame = frame[:, :, 0]
+    height, width = frame.shape[:2]
+    size = (max(1, width // step), max(1, height // step))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_NEAREST)
+
+
+def mean_luminance(small):
+    """
+    缩小图的平均亮度（0-255）
+    """
+    means = cv2.mean(small)
+    if small.ndim == 2:
+        return means[0]
+    return sum(weight * value for weight, value in zip(GRAY_WEIGHTS, means))
+
+
+def frame_luminance(frame, step=SCORE_STEP):
+    """
+    低开销的平均亮度估计，无法计算时返回 None
+    """
+    small = downsample(frame, step)
+    return mean_luminance(small) if small is not None else None
+
+
+def to_gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def exposure_metrics(small):
+    """
+    曝光指标：平均亮度、与目标亮度的接近程度（0-1）、过曝/欠曝像素比例
+    """
+    gray = to_gray(small)
+    luminance = float(cv2.mean(gray)[0])
+    clipped = np.count_nonzero((gray <= CLIP_LOW) | (gray >= CLIP_HIGH)) / gray.size
+    closeness = 1.0 - abs(luminance - EXPOSURE_TARGET) / max(EXPOSURE_TARGET, 255.0 - EXPOSURE_TARGET)
+    return luminance, closeness, clipped
+
+
+def laplacian_variance(frame, roi=SHARPNESS_ROI, step=SHARPNESS_STEP):
+    """
+    对焦程度：画面中心区域（缩小 step 倍）的拉普拉斯方差，越大越清晰
+    BGR 帧只取绿色通道（近似亮度，无需颜色转换）；直通模式的 JPEG 数据先按 1/2 缩小解码
+    """
+    if frame.ndim == 1:
+        frame = cv2.imdecode(frame, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        step = 1
+        if frame is None:
+            return 0.0
+    height, width = frame.shape[:2]
+    top, left = int(height * (1 - roi) / 2), int(width * (1 - roi) / 2)
+    center = frame[top:height - top:step, left:width - left:step]
+    if center.ndim == 3:
+        # YUYV 原始数据取 Y 分量，BGR 取绿色通道
+        center = center[:, :, 0 if center.shape[2] == 2 else 1]
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(np.ascontiguousarray(center), cv2.CV_16S))
+    return float(stddev[0][0]) ** 2
+
+
+def score_brightness(frame, small):
+    """
+    亮度评分：平均亮度越高越好（原有的选帧方式）
+    """
+    return mean_luminance(small)
+
+
+def score_exposure(frame, small):
+    """
+    曝光评分：接近目标亮度且过曝/欠曝像素少
+    """
+    luminance, closeness, clipped = exposure_metrics(small)
+    return {"score": closeness - COMPOSITE_WEIGHTS["clipped"] * clipped,
+            "luminance": luminance, "exposure": closeness, "clipped": clipped}
+
+
+def score_sharpness(frame, small):
+    """
+    清晰度评分：中心区域拉普拉斯方差
+    """
+    variance = laplacian_variance(frame)
+    return {"score": variance, "laplacian_var": variance}
+
+
+def score_composite(frame, small):
+    """
+    综合评分：曝光 + 归一化清晰度（方差 / (方差 + 参考值)），减去过曝/欠曝比例
+    """
+    luminance, closeness, clipped = exposure_metrics(small)
+    variance = laplacian_variance(frame)
+    sharpness = variance / (variance + SHARPNESS_REFERENCE)
+    score = (COMPOSITE_WEIGHTS["exposure"] * closeness + COMPOSITE_WEIGHTS["sharpness"] * sharpness
+             - COMPOSITE_WEIGHTS["clipped"] * clipped)
+    return {"score": score, "luminance": luminance, "exposure": closeness, "clipped": clipped,
+            "laplacian_var": variance, "sharpness": sharpness}
+
+
+# 可选的评分方式：名称 -> 评分函数(原始帧, 缩小图) -> 分数或 {"score": 分数, 分项...}
+SCORERS = {
+    "brightness": score_brightness,
+    "exposure": score_exposure,
+    "sharpness": score_sharpness,
+    "composite": score_composite,
+}
+
+
+def format_details(details):
+    """
+    评分分项的可读文本
+    """
+    labels = (("score", "评分 {:.3f}"), ("luminance", "平均亮度 {:.1f}/255"), ("exposure", "曝光 {:.2f}"),
+              ("clipped", "过曝/欠曝 {:.1%}"), ("laplacian_var", "拉普拉斯方差 {:.1f}"),
+              ("sharpness", "清晰度 {:.2f}"))
+    return "，".join(text.format(details[key]) for key, text in labels if key in details)
+
+
+class FrameSelector:
+    """
+    最佳帧选择器：逐帧调用 offer()，保留分数最高的帧
+
+    参数:
+        score: 评分方式名称（SCORERS 中的键）或评分函数 score(原始帧, 缩小图)
+        copy: 是否复制保留的帧。帧源每次返回新数组时（cv2.VideoCapture.read()）无需复制；
+              零拷贝帧源返回的视图在下一次 grab() 后失效，需要复制
+        step: 评分用缩小倍数
+    """
+
+    def __init__(self, score="brightness", copy=False, step=SCORE_STEP):
+        self.name = score if isinstance(score, str) else getattr(score, "__name__", "custom")
+        self.score = SCORERS[score] if isinstance(score, str) else score
+        self.copy = copy
+        self.step = step
+        self.best = None
+        self.best_score = None
+        self.best_details = None
+        self.best_index = -1
+        self.frames = 0
+        self.score_seconds = 0.0
+
+    def offer(self, frame):
+        """
+        评分一帧，分数高于当前最佳时替换（只交换引用），返回是否成为新的最佳帧
+        """
+        start = time.perf_counter()
+        small = downsample(frame, self.step)
+        details = self.score(frame, small) if small is not None else None
+        self.score_seconds += time.perf_counter() - start
+        index = self.frames
+        self.frames += 1
+        if details is None:
+            return False
+        if not isinstance(details, dict):
+            details = {"score": details}
+        value = details["score"]
+        if self.best_score is not None and value <= self.best_score:
+            return False
+        self.best = frame.copy() if self.copy else frame
+        self.best_score = value
+        self.best_details = details
+        self.best_index = index
+        return True
+
+    @property
+    def score_us_per_frame(self):
+        return self.score_seconds / self.frames * 1e6 if self.frames else 0.0
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+V4L2 设备查询模块
+直接通过 ioctl（QUERYCAP、ENUM_FMT、ENUM_FRAMESIZES、ENUM_FRAMEINTERVALS）
+查询摄像头支持的像素格式、分辨率和帧率，无需打开 OpenCV 捕获
+同时定义 mmap 流式采集所需的结构体和 ioctl（供 dh_usb_v4l2_capture 使用）
+"""
+
+import ctypes
+import errno
+import fcntl
+import mmap
+import os
+import select
+import struct
+import sys
+from dataclasses import dataclass, field
+
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (ord('V') << 8) | nr
+
+
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+# struct v4l2_capability: driver[16], card[32], bus_info[32], version, capabilities, device_caps, reserved[3]
+CAPABILITY = struct.Struct("=16s32s32sIII12x")
+# struct v4l2_fmtdesc: index, type, flags, description[32], pixelformat, mbus_code, reserved[3]
+FMTDESC = struct.Struct("=III32sII12x")
+# struct v4l2_frmsizeenum: index, pixel_format, type, union{discrete/stepwise}[6], reserved[2]
+FRMSIZEENUM = struct.Struct("=III6I8x")
+# struct v4l2_frmivalenum: index, pixel_format, width, height, type, union{discrete/stepwise}[6], reserved[2]
+FRMIVALENUM = struct.Struct("=IIIII6I8x")
+
+VIDIOC_QUERYCAP = _ioc(_IOC_READ, 0, CAPABILITY.size)
+VIDIOC_ENUM_FMT = _ioc(_IOC_READ | _IOC_WRITE, 2, FMTDESC.size)
+VIDIOC_ENUM_FRAMESIZES = _ioc(_IOC_READ | _IOC_WRITE, 74, FRMSIZEENUM.size)
+VIDIOC_ENUM_FRAMEINTERVALS = _ioc(_IOC_READ | _IOC_WRITE, 75, FRMIVALENUM.size)
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_STREAMING = 0x04000000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+V4L2_MEMORY_MMAP = 1
+V4L2_FIELD_ANY = 0
+V4L2_CAP_TIMEPERFRAME = 0x1000
+
+
+# 流式采集使用的结构体包含 long 和指针，大小与平台相关，使用 ctypes 定义以保证对齐正确
+class V4L2PixFormat(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_uint32),
+        ("height", ctypes.c_uint32),
+        ("pixelformat", ctypes.c_uint32),
+        ("field", ctypes.c_uint32),
+        ("bytesperline", ctypes.c_uint32),
+        ("sizeimage", ctypes.c_uint32),
+        ("colorspace", ctypes.c_uint32),
+        ("priv", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("ycbcr_enc", ctypes.c_uint32),
+        ("quantization", ctypes.c_uint32),
+        ("xfer_func", ctypes.c_uint32),
+    ]
+
+
+class _V4L2FormatUnion(ctypes.Union):
+    # _align 使联合体按指针对齐（内核中 v4l2_window 含指针）
+    _fields_ = [("pix", V4L2PixFormat), ("raw_data", ctypes.c_uint8 * 200), ("_align", ctypes.c_void_p)]
+
+
+class V4L2Format(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("fmt", _V4L2FormatUnion)]
+
+
+class V4L2RequestBuffers(ctypes.Structure):
+    _fields_ = [
+        ("count", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("memory", ctypes.c_uint32),
+        ("capabilities", ctypes.c_uint32),
+        ("flags", ctypes.c_uint8),
+        ("reserved", ctypes.c_uint8 * 3),
+    ]
+
+
+class V4L2Timecode(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("frames", ctypes.c_uint8),
+        ("seconds", ctypes.c_uint8),
+        ("minutes", ctypes.c_uint8),
+        ("hours", ctypes.c_uint8),
+        ("userbits", ctypes.c_uint8 * 4),
+    ]
+
+
+class Timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_usec", ctypes.c_long)]
+
+
+class _V4L2BufferM(ctypes.Union):
+    _fields_ = [
+        ("offset", ctypes.c_uint32),
+        ("userptr", ctypes.c_ulong),
+        ("planes", ctypes.c_void_p),
+        ("fd", ctypes.c_int32),
+    ]
+
+
+class V4L2Buffer(ctypes.Structure):
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("bytesused", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("field", ctypes.c_uint32),
+        ("timestamp", Timeval),
+        ("timecode", V4L2Timecode),
+        ("sequence", ctypes.c_uint32),
+        ("memory", ctypes.c_uint32),
+        ("m", _V4L2BufferM),
+        ("length", ctypes.c_uint32),
+        ("reserved2", ctypes.c_uint32),
+        ("request_fd", ctypes.c_int32),
+    ]
+
+
+class V4L2Fract(ctypes.Structure):
+    _fields_ = [("numerator", ctypes.c_uint32), ("denominator", ctypes.c_uint32)]
+
+
+class V4L2CaptureParm(ctypes.Structure):
+    _fields_ = [
+        ("capability", ctypes.c_uint32),
+        ("capturemode", ctypes.c_uint32),
+        ("timeperframe", V4L2Fract),
+        ("extendedmode", ctypes.c_uint32),
+        ("readbuffers", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 4),
+    ]
+
+
+class _V4L2StreamParmUnion(ctypes.Union):
+    _fields_ = [("capture", V4L2CaptureParm), ("raw_data", ctypes.c_uint8 * 200)]
+
+
+class V4L2StreamParm(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("parm", _V4L2StreamParmUnion)]
+
+
+VIDIOC_G_FMT = _ioc(_IOC_READ | _IOC_WRITE, 4, ctypes.sizeof(V4L2Format))
+VIDIOC_S_FMT = _ioc(_IOC_READ | _IOC_WRITE, 5, ctypes.sizeof(V4L2Format))
+VIDIOC_REQBUFS = _ioc(_IOC_READ | _IOC_WRITE, 8, ctypes.sizeof(V4L2RequestBuffers))
+VIDIOC_QUERYBUF = _ioc(_IOC_READ | _IOC_WRITE, 9, ctypes.sizeof(V4L2Buffer))
+VIDIOC_QBUF = _ioc(_IOC_READ | _IOC_WRITE, 15, ctypes.sizeof(V4L2Buffer))
+VIDIOC_DQBUF = _ioc(_IOC_READ | _IOC_WRITE, 17, ctypes.sizeof(V4L2Buffer))
+VIDIOC_STREAMON = _ioc(_IOC_WRITE, 18, ctypes.sizeof(ctypes.c_int))
+VIDIOC_STREAMOFF = _ioc(_IOC_WRITE, 19, ctypes.sizeof(ctypes.c_int))
+VIDIOC_S_PARM = _ioc(_IOC_READ | _IOC_WRITE, 22, ctypes.sizeof(V4L2StreamParm))
+
+# 帧率相同时的像素格式优先级：MJPG 压缩传输，USB 2.0 下 1080p 也能达到满帧率
+PIXEL_FORMATS = ("MJPG", "YUYV", "NV12")
+
+
+def fourcc_to_str(code):
+    """
+    将 FOURCC 整数转换为字符串，如 0x47504a4d -> "MJPG"
+    """
+    return struct.pack("<I", code).decode("ascii", errors="replace").rstrip("\0 ")
+
+
+def fourcc_from_str(text):
+    """
+    将 FOURCC 字符串转换为整数，如 "MJPG" -> 0x47504a4d
+    """
+    return struct.unpack("<I", text.ljust(4).encode("ascii")[:4])[0]
+
+
+def _cstr(raw):
+    return raw.split(b"\0", 1)[0].decode(errors="replace")
+
+
+@dataclass
+class DeviceCapability:
+    """
+    VIDIOC_QUERYCAP 查询结果
+    """
+    driver: str
+    card: str
+    bus_info: str
+    version: int
+    capabilities: int
+    device_caps: int
+
+    @property
+    def caps(self):
+        """
+        当前设备节点的能力（驱动支持 device_caps 时使用它，否则使用整个设备的能力）
+        """
+        if self.capabilities & V4L2_CAP_DEVICE_CAPS:
+            return self.device_caps
+        return self.capabilities
+
+    @property
+    def is_capture(self):
+        """
+        是否为视频采集节点（UVC 摄像头的元数据节点返回 False）
+        """
+        return bool(self.caps & V4L2_CAP_VIDEO_CAPTURE)
+
+
+@dataclass
+class VideoMode:
+    """
+    一种采集模式：像素格式 + 分辨率 + 支持的帧率
+    """
+    fourcc: str
+    width: int
+    height: int
+    fps_list: list = field(default_factory=list)
+    description: str = ""
+
+    @property
+    def max_fps(self):
+        return max(self.fps_list) if self.fps_list else 0.0
+
+    def __str__(self):
+        rates = ", ".join(f"{fps:g}" for fps in sorted(set(self.fps_list), reverse=True))
+        return f"{self.fourcc:<4} {self.width}x{self.height} @ {rates or '?'} fps ({self.description})"
+
+
+class V4L2Device:
+    """
+    V4L2 设备节点：查询能力和模式，并提供采集后端（dh_usb_v4l2_capture）使用的
+    ioctl / mmap / wait 基本操作
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ioctl(self, request, buf):
+        """
+        执行 ioctl，buf 为可写的 bytearray 或 ctypes 结构体，EINTR 时自动重试
+        """
+        while True:
+            try:
+                return fcntl.ioctl(self.fd, request, buf, True)
+            except InterruptedError:
+                continue
+
+    def mmap(self, length, offset):
+        """
+        映射驱动缓冲区（共享、可读写）
+        """
+        return mmap.mmap(self.fd, length, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=offset)
+
+    def wait(self, timeout):
+        """
+        阻塞等待设备有帧可读，返回是否在超时前就绪
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+    def _enumerate(self, request, layout, *fields):
+        """
+        按 index 递增枚举，直到驱动返回 EINVAL
+        """
+        index = 0
+        while True:
+            buf = bytearray(layout.pack(index, *fields))
+            try:
+                self.ioctl(request, buf)
+            except OSError as e:
+                if e.errno == errno.EINVAL:
+                    return
+                raise
+            yield layout.unpack(buf)
+            index += 1
+
+    def query_capability(self):
+        buf = bytearray(CAPABILITY.size)
+        self.ioctl(VIDIOC_QUERYCAP, buf)
+        driver, card, bus_info, version, capabilities, device_caps = CAPABILITY.unpack(buf)
+        return DeviceCapability(_cstr(driver), _cstr(card), _cstr(bus_info),
+                                version, capabilities, device_caps)
+
+    def enum_formats(self):
+        """
+        返回 [(pixelformat, description), ...]
+        """
+        return [(values[4], _cstr(values[3]))
+                for values in self._enumerate(VIDIOC_ENUM_FMT, FMTDESC,
+                                              V4L2_BUF_TYPE_VIDEO_CAPTURE, 0, b"", 0, 0)]
+
+    def enum_frame_sizes(self, pixelformat):
+        """
+        返回 [(width, height), ...]；连续/步进类型只返回最小和最大尺寸
+        """
+        sizes = []
+        for values in self._enumerate(VIDIOC_ENUM_FRAMESIZES, FRMSIZEENUM, pixelformat, 0, 0, 0, 0, 0, 0, 0):
+            size_type, data = values[2], values[3:]
+            if size_type == V4L2_FRMSIZE_TYPE_DISCRETE:
+                sizes.append((data[0], data[1]))
+            else:
+                min_w, max_w, _, min_h, max_h, _ = data
+                sizes.extend([(min_w, min_h), (max_w, max_h)])
+                break
+        return sizes
+
+    def enum_frame_intervals(self, pixelformat, width, height):
+        """
+        返回该格式和分辨率支持的帧率列表（fps）；连续/步进类型只返回最高和最低帧率
+        """
+        rates = []
+        for values in self._enumerate(VIDIOC_ENUM_FRAMEINTERVALS, FRMIVALENUM,
+                                      pixelformat, width, height, 0, 0, 0, 0, 0, 0, 0):
+            ival_type, data = values[4], values[5:]
+            if ival_type == V4L2_FRMIVAL_TYPE_DISCRETE:
+                fractions = [data[0:2]]
+            else:
+                fractions = [data[0:2], data[2:4]]
+            for numerator, denominator in fractions:
+                if numerator:
+                    rates.append(denominator / numerator)
+            if ival_type != V4L2_FRMIVAL_TYPE_DISCRETE:
+                break
+        return rates
+
+    def list_modes(self):
+        """
+        列出所有 像素格式 x 分辨率 组合及其支持的帧率
+        """
+        modes = []
+        for pixelformat, description in self.enum_formats():
+            for width, height in self.enum_frame_sizes(pixelformat):
+                modes.append(VideoMode(
+                    fourcc=fourcc_to_str(pixelformat),
+                    width=width,
+                    height=height,
+                    fps_list=self.enum_frame_intervals(pixelformat, width, height),
+                    description=description,
+                ))
+        return modes
+
+
+def list_modes(dev_path):
+    """
+    查询设备支持的所有采集模式，设备无法打开或不是 V4L2 设备时返回空列表
+    """
+    try:
+        with V4L2Device(dev_path) as dev:
+            return dev.list_modes()
+    except OSError:
+        return []
+
+
+def _format_rank(fourcc):
+    return PIXEL_FORMATS.index(fourcc) if fourcc in PIXEL_FORMATS else len(PIXEL_FORMATS)
+
+
+def choose_mode(modes, width, height, pixel_format="auto"):
+    """
+    选择满足请求的最快模式
+
+    优先选择与请求分辨率完全一致的模式；没有时选择不小于请求分辨率的最小模式；
+    都没有时选择最大的模式。同一分辨率下选择最高帧率的像素格式，
+    帧率相同时按 PIXEL_FORMATS 顺序优先。
+    pixel_format 不为 "auto" 时只在该像素格式的模式中选择（设备不支持时忽略）。
+    返回 VideoMode，modes 为空时返回 None
+    """
+    if pixel_format != "auto":
+        matching = [m for m in modes if m.fourcc == pixel_format]
+        if matching:
+            modes = matching
+        elif modes:
+            print(f"  注意: 摄像头不支持像素格式 {pixel_format}，自动选择")
+    if not modes:
+        return None
+
+    exact = [m for m in modes if (m.width, m.height) == (width, height)]
+    if exact:
+        pool = exact
+    else:
+        larger = [m for m in modes if m.width >= width and m.height >= height]
+        if larger:
+            area = min(m.width * m.height for m in larger)
+            pool = [m for m in larger if m.width * m.height == area]
+        else:
+            area = max(m.width * m.height for m in modes)
+            pool = [m for m in modes if m.width * m.height == area]
+    return max(pool, key=lambda m: (m.max_fps, -_format_rank(m.fourcc)))
+
+
+def select_camera_mode(dev_path, width, height, pixel_format="auto"):
+    """
+    查询设备模式并选择满足请求的最快模式，打印选择结果
+    返回 VideoMode，无法查询时返回 None（调用方退回到通过 OpenCV 协商像素格式）
+    """
+    mode = choose_mode(list_modes(dev_path), width, height, pixel_format)
+    if mode is None:
+        print("  无法查询 V4L2 模式，将通过 OpenCV 协商像素格式")
+        return None
+    print(f"  选择模式: {mode}")
+    if (mode.width, mode.height) != (width, height):
+        print(f"  注意: 摄像头不支持 {width}x{height}，将使用 {mode.width}x{mode.height}")
+    return mode
+
+
+def print_modes(dev_path):
+    """
+    打印设备能力和所有采集模式
+    返回是否查询成功
+    """
+    try:
+        with V4L2Device(dev_path) as dev:
+            cap = dev.query_capability()
+            modes = dev.list_modes()
+    except OSError as e:
+        print(f"错误: 无法查询设备 {dev_path}: {e}")
+        return False
+
+    print(f"设备: {dev_path}")
+    print(f"  驱动: {cap.driver}  名称: {cap.card}  总线: {cap.bus_info}")
+    print(f"  视频采集: {'是' if cap.is_capture else '否'}  "
+          f"流式 I/O: {'是' if cap.caps & V4L2_CAP_STREAMING else '否'}")
+    if not modes:
+        print("  （没有可用的采集模式）")
+    for mode in modes:
+        print(f"  {mode}")
+    return True
+
+
+if __name__ == "__main__":
+    devices = sys.argv[1:]
+    if not devices:
+        from dh_usb_discovery import find_dh_usb_camera
+        device = find_dh_usb_camera()
+        if device is None:
+            sys.exit(1)
+        devices = [device]
+    ok = all([print_modes(dev) for dev in devices])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+V4L2 mmap 采集后端
+纯 Python 实现：通过 ioctl 申请驱动缓冲区并 mmap 映射，每个出队的缓冲区直接以
+NumPy 视图返回（不复制），可控制缓冲区数量并获得驱动提供的帧时间戳和序号
+另提供 FakeV4L2Device 模拟设备，用于在没有摄像头的环境中测试
+"""
+
+import ctypes
+import errno
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from dh_usb_frame_source import FrameSource, output_into
+from dh_usb_v4l2 import (
+    CAPABILITY, FMTDESC, FRMIVALENUM, FRMSIZEENUM, V4L2_BUF_TYPE_VIDEO_CAPTURE, V4L2_CAP_DEVICE_CAPS,
+    V4L2_CAP_STREAMING, V4L2_CAP_TIMEPERFRAME, V4L2_CAP_VIDEO_CAPTURE, V4L2_FIELD_ANY,
+    V4L2_FRMIVAL_TYPE_DISCRETE, V4L2_FRMSIZE_TYPE_DISCRETE, V4L2_MEMORY_MMAP, VIDIOC_DQBUF,
+    VIDIOC_ENUM_FMT, VIDIOC_ENUM_FRAMEINTERVALS, VIDIOC_ENUM_FRAMESIZES, VIDIOC_G_FMT, VIDIOC_QBUF,
+    VIDIOC_QUERYBUF, VIDIOC_QUERYCAP, VIDIOC_REQBUFS, VIDIOC_S_FMT, VIDIOC_S_PARM, VIDIOC_STREAMOFF,
+    VIDIOC_STREAMON, V4L2Buffer, V4L2Device, V4L2Format, V4L2RequestBuffers, V4L2StreamParm,
+    fourcc_from_str, fourcc_to_str,
+)
+
+
+# 默认驱动缓冲区数量和取帧超时（秒）
+DEFAULT_BUFFER_COUNT = 4
+DEFAULT_TIMEOUT = 2.0
+
+
+class V4L2Capture(FrameSource):
+    """
+    V4L2 mmap 帧源
+
+    与 cv2.VideoCapture 一样通过 set() 设置 FOURCC、分辨率、帧率，第一次 grab() 时才开始采集。
+    retrieve() 默认返回 BGR 图像；set(cv2.CAP_PROP_CONVERT_RGB, 0) 后返回驱动缓冲区的
+    NumPy 视图（MJPG 为一维 JPEG 数据，YUYV 为 (高, 宽, 2)），该视图在下一次 grab() 后失效。
+
+    参数:
+        path: 设备路径
+        device: 已打开的 V4L2Device（或 FakeV4L2Device），提供时忽略 path
+        buffer_count: 驱动缓冲区数量
+        timeout: grab() 等待一帧的超时时间（秒）
+    """
+
+    zero_copy = True
+
+    def __init__(self, path=None, device=None, buffer_count=DEFAULT_BUFFER_COUNT, timeout=DEFAULT_TIMEOUT):
+        self.buffer_count = buffer_count
+        self.timeout = timeout
+        self.convert_rgb = True
+        self.timestamp = 0.0
+        self.sequence = 0
+        self._mmaps = []
+        self._views = []
+        self._current = None
+        self._streaming = False
+        self._dirty = True
+        self.dev = device
+        if self.dev is None:
+            try:
+                self.dev = V4L2Device(path)
+            except OSError as e:
+                print(f"错误: 无法打开 V4L2 设备 {path}: {e}")
+                return
+
+        # 以设备当前格式作为默认值
+        fmt = V4L2Format(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        try:
+            self.dev.ioctl(VIDIOC_G_FMT, fmt)
+        except OSError as e:
+            print(f"错误: 无法读取 V4L2 设备格式: {e}")
+            self.release()
+            return
+        self.width = fmt.fmt.pix.width
+        self.height = fmt.fmt.pix.height
+        self.fourcc = fourcc_to_str(fmt.fmt.pix.pixelformat)
+        self.bytesperline = fmt.fmt.pix.bytesperline
+        self.fps = 0.0
+
+    def isOpened(self):
+        return self.dev is not None
+
+    def get(self, prop):
+        if not self.isOpened():
+            return 0.0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FOURCC:
+            return float(fourcc_from_str(self.fourcc))
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            return 1.0 if self.convert_rgb else 0.0
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.timestamp * 1000
+        if prop == cv2.CAP_PROP_BUFFERSIZE:
+            return float(self.buffer_count)
+        return 0.0
+
+    def set(self, prop, value):
+        """
+        设置格式类属性后在下一次 grab() 时重新配置设备（与 OpenCV 一样立即读回请求值，
+        实际生效的值以配置后驱动返回的为准）
+        """
+        if not self.isOpened():
+            return False
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        if prop == cv2.CAP_PROP_FOURCC:
+            self.fourcc = fourcc_to_str(int(value))
+        elif prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        elif prop == cv2.CAP_PROP_BUFFERSIZE:
+            self.buffer_count = max(1, int(value))
+        else:
+            return False
+        self._dirty = True
+        return True
+
+    def _configure(self):
+        """
+        停止采集，设置格式和帧率，申请并映射缓冲区，全部入队后开始采集
+        """
+        self._stop_streaming()
+
+        fmt = V4L2Format(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        fmt.fmt.pix.width = self.width
+        fmt.fmt.pix.height = self.height
+        fmt.fmt.pix.pixelformat = fourcc_from_str(self.fourcc)
+        fmt.fmt.pix.field = V4L2_FIELD_ANY
+        self.dev.ioctl(VIDIOC_S_FMT, fmt)
+        self.width = fmt.fmt.pix.width
+        self.height = fmt.fmt.pix.height
+        self.fourcc = fourcc_to_str(fmt.fmt.pix.pixelformat)
+        self.bytesperline = fmt.fmt.pix.bytesperline
+
+        if self.fps > 0:
+            parm = V4L2StreamParm(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+            parm.parm.capture.timeperframe.numerator = 1000
+            parm.parm.capture.timeperframe.denominator = int(round(self.fps * 1000))
+            try:
+                self.dev.ioctl(VIDIOC_S_PARM, parm)
+                if parm.parm.capture.capability & V4L2_CAP_TIMEPERFRAME:
+                    tpf = parm.parm.capture.timeperframe
+                    if tpf.numerator:
+                        self.fps = tpf.denominator / tpf.numerator
+            except OSError:
+                pass
+
+        req = V4L2RequestBuffers(count=self.buffer_count, type=V4L2_BUF_TYPE_VIDEO_CAPTURE,
+                                 memory=V4L2_MEMORY_MMAP)
+        self.dev.ioctl(VIDIOC_REQBUFS, req)
+        if req.count < 1:
+            raise OSError(errno.ENOMEM, "驱动没有分配缓冲区")
+
+        for index in range(req.count):
+            buf = V4L2Buffer(index=index, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+            self.dev.ioctl(VIDIOC_QUERYBUF, buf)
+            mapped = self.dev.mmap(buf.length, buf.m.offset)
+            self._mmaps.append(mapped)
+            self._views.append(np.frombuffer(mapped, dtype=np.uint8, count=buf.length))
+            self.dev.ioctl(VIDIOC_QBUF, buf)
+
+        self.dev.ioctl(VIDIOC_STREAMON, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+        self._streaming = True
+        self._dirty = False
+
+    def _stop_streaming(self):
+        if self._streaming:
+            try:
+                self.dev.ioctl(VIDIOC_STREAMOFF, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+            except OSError:
+                pass
+            self._streaming = False
+        self._current = None
+        self._views = []
+        for mapped in self._mmaps:
+            try:
+                mapped.close()
+            except BufferError:
+                # 调用方仍持有视图，映射在视图释放后由垃圾回收关闭
+                pass
+        self._mmaps = []
+        if self.dev is not None:
+            try:
+                self.dev.ioctl(VIDIOC_REQBUFS, V4L2RequestBuffers(
+                    count=0, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP))
+            except OSError:
+                pass
+
+    def grab(self):
+        if not self.isOpened():
+            return False
+        try:
+            if self._dirty:
+                self._configure()
+            # 上一帧的缓冲区归还给驱动
+            if self._current is not None:
+                self.dev.ioctl(VIDIOC_QBUF, self._current)
+                self._current = None
+            if not self.dev.wait(self.timeout):
+                return False
+            buf = V4L2Buffer(type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+            self.dev.ioctl(VIDIOC_DQBUF, buf)
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                print(f"V4L2 取帧失败: {e}")
+            return False
+        self._current = buf
+        self.timestamp = buf.timestamp.tv_sec + buf.timestamp.tv_usec / 1e6
+        self.sequence = buf.sequence
+        return True
+
+    def buffer_view(self):
+        """
+        当前帧缓冲区的 NumPy 视图（不复制），没有当前帧时返回 None
+        """
+        if self._current is None:
+            return None
+        return self._views[self._current.index][:self._current.bytesused]
+
+    def retrieve(self, image=None):
+        data = self.buffer_view()
+        if data is None or data.size == 0:
+            return False, None
+
+        if self.fourcc in ("YUYV", "NV12"):
+            stride = self.bytesperline or self.width * (2 if self.fourcc == "YUYV" else 1)
+            rows = self.height if self.fourcc == "YUYV" else self.height * 3 // 2
+            plane = data[:stride * rows].reshape(rows, stride)
+            if self.fourcc == "YUYV":
+                raw = plane[:, :self.width * 2].reshape(self.height, self.width, 2)
+                code = cv2.COLOR_YUV2BGR_YUYV
+            else:
+                raw = plane[:, :self.width]
+                code = cv2.COLOR_YUV2BGR_NV12
+            if not self.convert_rgb:
+                return True, raw
+            return True, cv2.cvtColor(raw, code, dst=image)
+
+        if not self.convert_rgb:
+            return True, data
+        if self.fourcc == "MJPG":
+            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            return frame is not None, output_into(frame, image)
+        return False, None
+
+    def release(self):
+        if self.dev is None:
+            return
+        self._stop_streaming()
+        self.dev.close()
+        self.dev = None
+
+
+class _FakeMapping(bytearray):
+    """
+    模拟设备的缓冲区，提供与 mmap 对象相同的 close()
+    """
+
+    def close(self):
+        pass
+
+
+class FakeV4L2Device(V4L2Device):
+    """
+    模拟 V4L2 设备：实现 V4L2Capture 和模式查询用到的 ioctl，缓冲区为普通内存
+
+    支持 MJPG、YUYV 和 NV12 三种格式，帧内容为随帧序号移动的渐变图案，按 fps 控制出帧节奏。
+    MODES: {fourcc: {(宽, 高): 帧率}}
+    """
+
+    MODES = {
+        "MJPG": {(1920, 1080): 30.0, (1280, 720): 30.0, (640, 480): 30.0},
+        "YUYV": {(1920, 1080): 5.0, (1280, 720): 10.0, (640, 480): 30.0},
+        "NV12": {(1280, 720): 10.0, (640, 480): 30.0},
+    }
+
+    def __init__(self, path="/dev/fake_video", realtime=True):
+        self.path = path
+        self.fd = -1
+        self.realtime = realtime
+        self.fourcc = "MJPG"
+        self.width, self.height = 1920, 1080
+        self.fps = self.MODES[self.fourcc][(self.width, self.height)]
+        self.buffers = []
+        self.queued = deque()
+        self.streaming = False
+        self.sequence = 0
+        self.next_frame_time = 0.0
+        self._jpeg_cache = {}
+
+    def close(self):
+        self.fd = None
+
+    def mmap(self, length, offset):
+        return self.buffers[offset // self._buffer_length]
+
+    def wait(self, timeout):
+        if not self.streaming or not self.queued:
+            if self.realtime:
+                time.sleep(timeout)
+            return False
+        if self.realtime:
+            delay = self.next_frame_time - time.monotonic()
+            if delay > timeout:
+                time.sleep(timeout)
+                return False
+            if delay > 0:
+                time.sleep(delay)
+        return True
+
+    @property
+    def _buffer_length(self):
+        return self.width * self.height * 2
+
+    def _render(self, sequence):
+        """
+        生成第 sequence 帧的数据
+        """
+        shift = (sequence * 8) % self.width
+        if self.fourcc == "YUYV":
+            x = (np.arange(self.width * 2) // 2 + shift) % 256
+            yuyv = np.empty((self.height, self.width * 2), dtype=np.uint8)
+            yuyv[:, 0::2] = x[0::2].astype(np.uint8)
+            yuyv[:, 1::2] = 128
+            return yuyv.tobytes()
+        if self.fourcc == "NV12":
+            x = ((np.arange(self.width) + shift) % 256).astype(np.uint8)
+            nv12 = np.full((self.height * 3 // 2, self.width), 128, dtype=np.uint8)
+            nv12[:self.height] = x
+            return nv12.tobytes()
+        key = (self.width, self.height, shift)
+        if key not in self._jpeg_cache:
+            gradient = ((np.arange(self.width) + shift) % 256).astype(np.uint8)
+            image = np.repeat(np.tile(gradient, (self.height, 1))[:, :, None], 3, axis=2)
+            self._jpeg_cache[key] = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+        return self._jpeg_cache[key]
+
+    def ioctl(self, request, arg):
+        handler = {
+            VIDIOC_QUERYCAP: self._querycap,
+            VIDIOC_ENUM_FMT: self._enum_fmt,
+            VIDIOC_ENUM_FRAMESIZES: self._enum_framesizes,
+            VIDIOC_ENUM_FRAMEINTERVALS: self._enum_frameintervals,
+            VIDIOC_G_FMT: self._g_fmt,
+            VIDIOC_S_FMT: self._s_fmt,
+            VIDIOC_S_PARM: self._s_parm,
+            VIDIOC_REQBUFS: self._reqbufs,
+            VIDIOC_QUERYBUF: self._querybuf,
+            VIDIOC_QBUF: self._qbuf,
+            VIDIOC_DQBUF: self._dqbuf,
+            VIDIOC_STREAMON: self._streamon,
+            VIDIOC_STREAMOFF: self._streamoff,
+        }.get(request)
+        if handler is None:
+            raise OSError(errno.ENOTTY, "不支持的 ioctl")
+        return handler(arg)
+
+    def _querycap(self, buf):
+        caps = V4L2_CAP_VIDEO_CAPTURE | V4L2_CAP_STREAMING
+        buf[:] = CAPABILITY.pack(b"fake", b"Fake DH_USB Camera", b"fake:0", 0,
+                                 caps | V4L2_CAP_DEVICE_CAPS, caps)
+
+    def _enum_fmt(self, buf):
+        index = FMTDESC.unpack(buf)[0]
+        formats = list(self.MODES)
+        if index >= len(formats):
+            raise OSError(errno.EINVAL, "没有更多格式")
+        buf[:] = FMTDESC.pack(index, V4L2_BUF_TYPE_VIDEO_CAPTURE, 0, formats[index].encode(),
+                              fourcc_from_str(formats[index]), 0)
+
+    def _enum_framesizes(self, buf):
+        index, pixelformat = FRMSIZEENUM.unpack(buf)[:2]
+        sizes = list(self.MODES.get(fourcc_to_str(pixelformat), {}))
+        if index >= len(sizes):
+            raise OSError(errno.EINVAL, "没有更多分辨率")
+        buf[:] = FRMSIZEENUM.pack(index, pixelformat, V4L2_FRMSIZE_TYPE_DISCRETE, *sizes[index], 0, 0, 0, 0)
+
+    def _enum_frameintervals(self, buf):
+        index, pixelformat, width, height = FRMIVALENUM.unpack(buf)[:4]
+        fps = self.MODES.get(fourcc_to_str(pixelformat), {}).get((width, height))
+        if fps is None or index > 0:
+            raise OSError(errno.EINVAL, "没有更多帧率")
+        buf[:] = FRMIVALENUM.pack(index, pixelformat, width, height, V4L2_FRMIVAL_TYPE_DISCRETE,
+                                  1000, int(fps * 1000), 0, 0, 0, 0)
+
+    def _fill_format(self, fmt):
+        pix = fmt.fmt.pix
+        pix.width, pix.height = self.width, self.height
+        pix.pixelformat = fourcc_from_str(self.fourcc)
+        pix.bytesperline = {"YUYV": self.width * 2, "NV12": self.width}.get(self.fourcc, 0)
+        pix.sizeimage = self._buffer_length
+
+    def _g_fmt(self, fmt):
+        self._fill_format(fmt)
+
+    def _s_fmt(self, fmt):
+        if self.streaming:
+            raise OSError(errno.EBUSY, "采集中不能修改格式")
+        fourcc = fourcc_to_str(fmt.fmt.pix.pixelformat)
+        if fourcc not in self.MODES:
+            fourcc = "MJPG"
+        sizes = self.MODES[fourcc]
+        # 与真实驱动一样选择最接近的分辨率
+        requested = (fmt.fmt.pix.width, fmt.fmt.pix.height)
+        size = min(sizes, key=lambda s: abs(s[0] - requested[0]) + abs(s[1] - requested[1]))
+        self.fourcc = fourcc
+        self.width, self.height = size
+        self.fps = sizes[size]
+        self._fill_format(fmt)
+
+    def _s_parm(self, parm):
+        tpf = parm.parm.capture.timeperframe
+        if tpf.numerator and tpf.denominator:
+            self.fps = min(self.fps, tpf.denominator / tpf.numerator)
+        parm.parm.capture.capability = V4L2_CAP_TIMEPERFRAME
+        tpf.numerator, tpf.denominator = 1000, int(round(self.fps * 1000))
+
+    def _reqbufs(self, req):
+        self.queued.clear()
+        self.buffers = [_FakeMapping(self._buffer_length) for _ in range(req.count)]
+
+    def _querybuf(self, buf):
+        if buf.index >= len(self.buffers):
+            raise OSError(errno.EINVAL, "缓冲区序号无效")
+        buf.length = self._buffer_length
+        buf.m.offset = buf.index * self._buffer_length
+
+    def _qbuf(self, buf):
+        self.queued.append(buf.index)
+
+    def _dqbuf(self, buf):
+        if not self.streaming or not self.queued:
+            raise OSError(errno.EAGAIN, "没有可用的帧")
+        index = self.queued.popleft()
+        data = self._render(self.sequence)
+        self.buffers[index][:len(data)] = data
+        now = time.monotonic()
+        buf.index = index
+        buf.bytesused = len(data)
+        buf.sequence = self.sequence
+        buf.timestamp.tv_sec = int(now)
+        buf.timestamp.tv_usec = int((now - int(now)) * 1e6)
+        self.sequence += 1
+        self.next_frame_time = max(self.next_frame_time + 1.0 / self.fps, now)
+
+    def _streamon(self, _):
+        self.streaming = True
+        self.next_frame_time = time.monotonic() + 1.0 / self.fps
+
+    def _streamoff(self, _):
+        self.streaming = False
+        self.queued.clear()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+分段视频录制模块
+长时间录制时逐帧保存 JPEG 会产生大量小文件。分段模式把帧依次写入视频文件（cv2.VideoWriter），
+按时长或文件大小滚动到新的分段，每个分段旁边写一个 CSV 时间戳索引，记录每帧的实际采集时刻
+（保存间隔不均匀或有丢帧时，视频文件的名义帧率不能给出准确时间）
+
+容器格式:
+  avi - MJPEG AVI（OpenCV 内置写入器，逐帧 JPEG 压缩，可随机访问，可设置质量）
+  mp4 - MPEG-4 Part 2（mp4v，帧间压缩，文件更小，需要 OpenCV 带 FFmpeg 支持）
+
+文件命名: dh_usb_YYYYMMDD_HHMMSS_mmm.avi（分段第一帧的采集时刻）和同名的 .csv 索引
+"""
+
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+
+from dh_usb_pipeline import (_STOP, POLICY_DROP_NEWEST, SavePipeline, decode_frame, make_filename)
+
+
+# 容器格式 -> (fourcc, 扩展名, VideoWriter 后端)
+CONTAINERS = {
+    "avi": ("MJPG", ".avi", cv2.CAP_OPENCV_MJPEG),
+    "mp4": ("mp4v", ".mp4", cv2.CAP_ANY),
+}
+# 默认分段时长（秒）
+SEGMENT_SECONDS = 300.0
+INDEX_HEADER = ("frame", "unix_time", "captured_at")
+
+
+def index_path(segment_path):
+    """
+    分段文件对应的时间戳索引路径
+    """
+    return os.path.splitext(segment_path)[0] + ".csv"
+
+
+def read_segment_index(segment_path):
+    """
+    读取分段的时间戳索引
+    返回:
+        [(帧序号, Unix 时间戳), ...]，帧序号与 cv2.VideoCapture 读取顺序一致
+    """
+    with open(index_path(segment_path), newline="") as f:
+        return [(int(row["frame"]), float(row["unix_time"])) for row in csv.DictReader(f)]
+
+
+class SegmentPipeline(SavePipeline):
+    """
+    分段视频保存流水线：与 SavePipeline 接口相同（submit/close/summary），
+    由单个写入线程按提交顺序把帧写入当前分段（VideoWriter 内部完成压缩）
+
+    参数:
+        output_dir: 保存目录
+        quality: MJPEG 质量（仅 avi），默认 95
+        container: 容器格式（CONTAINERS 之一），默认 avi
+        fps: 视频文件的名义帧率（通常为 1 / 保存间隔），实际时刻见索引
+        segment_seconds: 分段时长（秒），按采集时刻计算
+        segment_bytes: 分段大小上限（字节），0 表示不限制
+        其余参数同 SavePipeline（dedup 只支持 skip 方式）
+    """
+
+    def __init__(self, output_dir="recordings", quality=95, container="avi", fps=1.0,
+                 segment_seconds=SEGMENT_SECONDS, segment_bytes=0, queue_size=8, verbose=True,
+                 policy=POLICY_DROP_NEWEST, history=10000, dedup=None):
+        if container not in CONTAINERS:
+            raise ValueError(f"未知的容器格式: {container}")
+        if dedup is not None and dedup.mode != "skip":
+            raise ValueError("分段视频模式只支持 skip 去重方式")
+        super().__init__(output_dir, quality, encoder_workers=1, queue_size=queue_size, verbose=verbose,
+                         policy=policy, history=history, dedup=dedup)
+        self.container = container
+        self.fps = max(fps, 0.01)
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.segments = 0
+        self.segment_path = None
+        self._video = None
+        self._index = None
+        self._index_writer = None
+        self._segment_start = None
+        self._segment_frames = 0
+        self._segment_size = None
+        self._video_quality = None
+
+    def start(self):
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        thread = threading.Thread(target=self._segment_worker, name="dh_usb_segment", daemon=True)
+        thread.start()
+        self._threads = [thread]
+        return self
+
+    def _current_bytes(self):
+        try:
+            return os.path.getsize(self.segment_path)
+        except (OSError, TypeError):
+            return 0
+
+    def _open_segment(self, frame, captured_at):
+        fourcc, ext, api = CONTAINERS[self.container]
+        path = os.path.join(self.output_dir, make_filename(captured_at, ext=ext))
+        size = (frame.shape[1], frame.shape[0])
+        video = cv2.VideoWriter(path, api, cv2.VideoWriter_fourcc(*fourcc), self.fps, size)
+        if not video.isOpened():
+            print(f"  错误: 无法创建视频分段 {path}")
+            return False
+        self._video = video
+        self._video_quality = None
+        self.segment_path = path
+        self._segment_start = captured_at
+        self._segment_frames = 0
+        self._segment_size = size
+        self._index = open(index_path(path), "w", newline="")
+        self._index_writer = csv.writer(self._index)
+        self._index_writer.writerow(INDEX_HEADER)
+        return True
+
+    def _finish_segment(self):
+        if self._video is None:
+            return
+        self._video.release()
+        self._index.close()
+        self._video = None
+        self._index = None
+        written = self._current_bytes()
+        with self._lock:
+            self.segments += 1
+            self.bytes_written += written
+        if self.verbose:
+            print(f"  [{datetime.now().strftime('%H:%M:%S')}] 分段: {os.path.basename(self.segment_path)}"
+                  f"（{self._segment_frames} 帧，{written / 1e6:.1f} MB）")
+        self.segment_path = None
+
+    def _needs_rotation(self, frame, captured_at):
+        if self._video is None:
+            return True
+        if (frame.shape[1], frame.shape[0]) != self._segment_size:
+            return True
+        if (captured_at - self._segment_start).total_seconds() >= self.segment_seconds:
+            return True
+        return self.segment_bytes > 0 and self._current_bytes() >= self.segment_bytes
+
+    def _segment_worker(self):
+        while True:
+            item = self.encode_queue.get()
+            if item is _STOP:
+                self._finish_segment()
+                return
+            frame, captured_at, quality, encoded, submitted_at, _ = item
+            start = time.perf_counter()
+            if encoded:
+                # 直通模式的 MJPEG 数据需要解码后交给 VideoWriter
+                frame = decode_frame(frame)
+            if frame is None:
+                with self._lock:
+                    self.errors += 1
+                print(f"  错误: 无法解码图像 {make_filename(captured_at)}")
+                continue
+            if self._needs_rotation(frame, captured_at):
+                self._finish_segment()
+                if not self._open_segment(frame, captured_at):
+                    with self._lock:
+                        self.errors += 1
+                    continue
+            if self.container == "avi" and quality != self._video_quality:
+                self._video.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+                self._video_quality = quality
+            self._video.write(frame)
+            self._index_writer.writerow((self._segment_frames, f"{captured_at.timestamp():.6f}",
+                                         captured_at.isoformat(timespec="microseconds")))
+            self._segment_frames += 1
+            end = time.perf_counter()
+            with self._lock:
+                self.saved += 1
+                self.encode_seconds += end - start
+                self.latencies["queue_wait"].append(start - submitted_at)
+                self.latencies["encode"].append(end - start)
+                self.latencies["total"].append(end - submitted_at)
+
+    def summary(self):
+        stats = super().summary()
+        # 当前分段尚未结束，大小按已写入磁盘的部分计算
+        stats["bytes_written"] += self._current_bytes() if self._video is not None else 0
+        stats["container"] = self.container
+        stats["segments"] = self.segments + (1 if self._video is not None else 0)
+        return stats
+
+    def format_summary(self):
+        stats = self.summary()
+        return f"{super().format_summary()}，{self.container} 分段 {stats['segments']} 个"
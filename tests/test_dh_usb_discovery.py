@@ -0,0 +1,208 @@
+"""
+dh_usb_discovery 测试：在伪造的 sysfs 目录树上验证候选排序和发现缓存
+"""
+
+import os
+
+import pytest
+
+import dh_usb_discovery as discovery
+
+
+def add_usb_device(root, port, serial="", product="", devnum="2"):
+    """
+    在伪造的 sysfs 中创建一个 USB 设备目录，返回其路径
+    """
+    usb_dir = root / "sys" / "devices" / "pci0000:00" / "usb1" / port
+    usb_dir.mkdir(parents=True)
+    for attr, value in (("idVendor", "1234"), ("idProduct", "5678"), ("serial", serial),
+                        ("product", product), ("manufacturer", ""), ("devnum", devnum)):
+        (usb_dir / attr).write_text(value + "\n")
+    return usb_dir
+
+
+def add_video_node(root, usb_dir, node, name, index=0):
+    """
+    在 USB 设备的接口下创建 video4linux 节点，并在 /sys/class/video4linux 和 /dev 中建立对应项
+    """
+    interface = usb_dir / f"{usb_dir.name}:1.0"
+    node_dir = interface / "video4linux" / node
+    node_dir.mkdir(parents=True)
+    (node_dir / "name").write_text(name + "\n")
+    (node_dir / "index").write_text(f"{index}\n")
+    (node_dir / "device").symlink_to(interface)
+    class_dir = root / "sys" / "class" / "video4linux"
+    class_dir.mkdir(parents=True, exist_ok=True)
+    (class_dir / node).symlink_to(os.path.relpath(node_dir, class_dir))
+    dev_dir = root / "dev"
+    dev_dir.mkdir(exist_ok=True)
+    (dev_dir / node).touch()
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    """
+    一个普通摄像头（video0/video1）和一个 DH 摄像头（video2 采集节点、video3 元数据节点）
+    """
+    webcam = add_usb_device(tmp_path, "1-1", product="Integrated Webcam")
+    add_video_node(tmp_path, webcam, "video0", "Integrated Webcam", index=0)
+    add_video_node(tmp_path, webcam, "video1", "Integrated Webcam", index=1)
+    dh = add_usb_device(tmp_path, "1-2", serial="SN001", product="DH_USB Camera", devnum="5")
+    add_video_node(tmp_path, dh, "video3", "DH_USB Camera", index=1)
+    add_video_node(tmp_path, dh, "video2", "DH_USB Camera", index=0)
+    return tmp_path
+
+
+def roots(tree):
+    return {"sysfs_root": str(tree / "sys"), "dev_root": str(tree / "dev")}
+
+
+def test_scan_ranks_dh_capture_node_first(sysfs):
+    candidates = discovery.scan_video_devices(**roots(sysfs))
+    assert [c.node for c in candidates] == ["video2", "video3", "video0", "video1"]
+    best = candidates[0]
+    assert best.is_dh
+    assert best.serial == "SN001"
+    assert best.port_path == "1-2"
+    assert best.devnum == "5"
+    assert best.dev_path == str(sysfs / "dev" / "video2")
+
+
+def test_find_dh_candidates_excludes_other_cameras(sysfs):
+    assert [c.node for c in discovery.find_dh_candidates(**roots(sysfs))] == ["video2", "video3"]
+
+
+def test_scan_skips_nodes_without_device_file(sysfs):
+    (sysfs / "dev" / "video2").unlink()
+    assert "video2" not in [c.node for c in discovery.scan_video_devices(**roots(sysfs))]
+
+
+def test_scan_without_sysfs_returns_empty(tmp_path):
+    assert discovery.scan_video_devices(str(tmp_path / "missing"), str(tmp_path)) == []
+
+
+def test_cache_hit(sysfs, tmp_path):
+    cache_path = str(tmp_path / "cache.json")
+    best = discovery.find_dh_candidates(**roots(sysfs))[0]
+    discovery.save_cached_camera(best, cache_path, str(sysfs / "sys"))
+    assert discovery.load_cached_camera(cache_path, str(sysfs / "sys")) == best.dev_path
+
+
+def test_find_uses_cache_without_scanning(sysfs, tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "cache.json")
+    found = discovery.find_dh_usb_camera(cache_path=cache_path, verify=False, **roots(sysfs))
+    assert found == str(sysfs / "dev" / "video2")
+
+    def fail_scan(*args, **kwargs):
+        raise AssertionError("缓存命中时不应扫描 sysfs")
+
+    monkeypatch.setattr(discovery, "find_dh_candidates", fail_scan)
+    assert discovery.find_dh_usb_camera(cache_path=cache_path, verify=False, **roots(sysfs)) == found
+
+
+def test_cache_invalidated_when_devnum_changes(sysfs, tmp_path):
+    cache_path = str(tmp_path / "cache.json")
+    best = discovery.find_dh_candidates(**roots(sysfs))[0]
+    discovery.save_cached_camera(best, cache_path, str(sysfs / "sys"))
+    # 设备重新枚举后 devnum 改变
+    (sysfs / "sys" / "devices" / "pci0000:00" / "usb1" / "1-2" / "devnum").write_text("9\n")
+    assert discovery.load_cached_camera(cache_path, str(sysfs / "sys")) is None
+
+
+def test_cache_invalidated_when_node_moves(sysfs, tmp_path):
+    cache_path = str(tmp_path / "cache.json")
+    best = discovery.find_dh_candidates(**roots(sysfs))[0]
+    discovery.save_cached_camera(best, cache_path, str(sysfs / "sys"))
+    link = sysfs / "sys" / "class" / "video4linux" / "video2"
+    link.unlink()
+    link.symlink_to(os.path.relpath(sysfs / "sys" / "devices" / "pci0000:00" / "usb1" / "1-1" / "1-1:1.0"
+                                    / "video4linux" / "video0", link.parent))
+    assert discovery.load_cached_camera(cache_path, str(sysfs / "sys")) is None
+
+
+def test_missing_or_corrupt_cache(tmp_path):
+    cache_path = tmp_path / "cache.json"
+    assert discovery.load_cached_camera(str(cache_path), str(tmp_path)) is None
+    cache_path.write_text("{not json")
+    assert discovery.load_cached_camera(str(cache_path), str(tmp_path)) is None
+
+
+def test_single_camera_is_not_probed(sysfs, tmp_path):
+    # 一个摄像头的采集节点和元数据节点不需要打开验证
+    def fail_probe(dev_path):
+        raise AssertionError(f"不应验证 {dev_path}")
+
+    found = discovery.find_dh_usb_camera(cache_path=str(tmp_path / "cache.json"), probe=fail_probe,
+                                         **roots(sysfs))
+    assert found == str(sysfs / "dev" / "video2")
+
+
+def test_multiple_cameras_probe_capture_nodes_only(sysfs, tmp_path):
+    second = add_usb_device(sysfs, "1-3", serial="SN002", product="DH_USB Camera", devnum="6")
+    add_video_node(sysfs, second, "video4", "DH_USB Camera", index=0)
+    add_video_node(sysfs, second, "video5", "DH_USB Camera", index=1)
+    probed = []
+
+    def probe(dev_path):
+        probed.append(os.path.basename(dev_path))
+        return dev_path.endswith("video4"), "无法读取帧"
+
+    found = discovery.find_dh_usb_camera(cache_path=str(tmp_path / "cache.json"), probe=probe,
+                                         **roots(sysfs))
+    assert found == str(sysfs / "dev" / "video4")
+    assert sorted(probed) == ["video2", "video4"]
+
+
+def add_second_dh_camera(tree):
+    second = add_usb_device(tree, "1-3", serial="SN002", product="DH_USB Camera", devnum="6")
+    add_video_node(tree, second, "video4", "DH_USB Camera", index=0)
+    add_video_node(tree, second, "video5", "DH_USB Camera", index=1)
+
+
+def test_cache_keeps_one_entry_per_camera(sysfs, tmp_path):
+    add_second_dh_camera(sysfs)
+    cache_path = str(tmp_path / "cache.json")
+    sys_root = str(sysfs / "sys")
+    first, second = [c for c in discovery.find_dh_candidates(**roots(sysfs)) if c.index == 0]
+    discovery.save_cached_camera(first, cache_path, sys_root)
+    discovery.save_cached_camera(second, cache_path, sys_root)
+    # 写入第二个摄像头不会覆盖第一个
+    assert discovery.load_cached_camera(cache_path, sys_root, "SN001") == first.dev_path
+    assert discovery.load_cached_camera(cache_path, sys_root, "SN002") == second.dev_path
+    # 未指定时使用最近一次找到的摄像头
+    assert discovery.load_cached_camera(cache_path, sys_root) == second.dev_path
+    assert discovery.load_cached_camera(cache_path, sys_root, "SN999") is None
+
+
+def test_find_by_usb_key(sysfs, tmp_path, monkeypatch):
+    add_second_dh_camera(sysfs)
+    cache_path = str(tmp_path / "cache.json")
+    ok = lambda dev_path: (True, "")
+    assert discovery.find_dh_usb_camera(cache_path=cache_path, probe=ok, usb_key="1-3",
+                                        **roots(sysfs)) == str(sysfs / "dev" / "video4")
+    assert discovery.find_dh_usb_camera(cache_path=cache_path, probe=ok, usb_key="SN001",
+                                        **roots(sysfs)) == str(sysfs / "dev" / "video2")
+
+    def fail_scan(*args, **kwargs):
+        raise AssertionError("缓存命中时不应扫描 sysfs")
+
+    # 两个摄像头交替查找时都命中缓存
+    monkeypatch.setattr(discovery, "find_dh_candidates", fail_scan)
+    for key, node in (("1-3", "video4"), ("SN001", "video2"), ("1-3", "video4")):
+        assert discovery.find_dh_usb_camera(cache_path=cache_path, usb_key=key,
+                                            **roots(sysfs)) == str(sysfs / "dev" / node)
+
+
+def test_invalidate_by_dev_path_keeps_other_cameras(sysfs, tmp_path):
+    add_second_dh_camera(sysfs)
+    cache_path = str(tmp_path / "cache.json")
+    sys_root = str(sysfs / "sys")
+    first, second = [c for c in discovery.find_dh_candidates(**roots(sysfs)) if c.index == 0]
+    discovery.save_cached_camera(first, cache_path, sys_root)
+    discovery.save_cached_camera(second, cache_path, sys_root)
+    discovery.invalidate_cached_camera(cache_path, dev_path=second.dev_path)
+    assert discovery.load_cached_camera(cache_path, sys_root, "SN002") is None
+    assert discovery.load_cached_camera(cache_path, sys_root) is None
+    assert discovery.load_cached_camera(cache_path, sys_root, "SN001") == first.dev_path
+    discovery.invalidate_cached_camera(cache_path)
+    assert not os.path.exists(cache_path)
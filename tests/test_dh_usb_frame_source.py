@@ -0,0 +1,35 @@
+"""
+dh_usb_frame_source 测试：帧源接口
+"""
+
+import pytest
+
+from dh_usb_frame_source import FrameSource, ReplaySource, SyntheticSource
+from dh_usb_v4l2_capture import V4L2Capture
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class NoRetrieve(FrameSource):
+        def isOpened(self):
+            return True
+
+        def grab(self):
+            return True
+
+        def release(self):
+            pass
+
+    with pytest.raises(TypeError, match="retrieve"):
+        NoRetrieve()
+
+
+@pytest.mark.parametrize("source", [SyntheticSource, ReplaySource, V4L2Capture])
+def test_builtin_sources_implement_interface(source):
+    assert not source.__abstractmethods__
+
+
+def test_synthetic_source_reads_frames():
+    cap = SyntheticSource(64, 48, exposure_ramp=0, realtime=False)
+    ok, frame = cap.read()
+    assert ok and frame.shape == (48, 64, 3)
+    cap.release()
@@ -0,0 +1,107 @@
+"""
+热插拔测试：通过 socket.socketpair() 向 UeventMonitor 注入 uevent，
+验证服务的 handle_uevent() / reattach_camera() 处理移除和接入事件
+"""
+
+import socket
+import threading
+
+import pytest
+
+import capture_dh_usb_service as service
+from dh_usb_hotplug import UDEV_HEADER, UDEV_MONITOR_MAGIC, UeventMonitor, parse_uevent
+
+
+def uevent(action, node, subsystem="video4linux"):
+    """
+    内核格式的 uevent 消息
+    """
+    devpath = f"/devices/pci0000:00/usb1/1-2/1-2:1.0/{subsystem}/{node}"
+    fields = [f"ACTION={action}", f"DEVPATH={devpath}", f"SUBSYSTEM={subsystem}", f"DEVNAME={node}"]
+    return f"{action}@{devpath}\0".encode() + "\0".join(fields).encode() + b"\0"
+
+
+def libudev_uevent(action, node):
+    properties = f"ACTION={action}\0DEVPATH=/devices/x/{node}\0SUBSYSTEM=video4linux\0DEVNAME=/dev/{node}\0"
+    payload = properties.encode()
+    return UDEV_HEADER.pack(b"libudev\0", UDEV_MONITOR_MAGIC, UDEV_HEADER.size, UDEV_HEADER.size,
+                            len(payload)) + payload
+
+
+def test_parse_kernel_and_libudev_formats():
+    event = parse_uevent(uevent("remove", "video2"))
+    assert (event.action, event.subsystem, event.devname) == ("remove", "video4linux", "video2")
+    event = parse_uevent(libudev_uevent("add", "video4"))
+    assert (event.action, event.devname) == ("add", "video4")
+    assert parse_uevent(b"not an uevent") is None
+
+
+@pytest.fixture
+def hotplug(monkeypatch):
+    """
+    服务正在使用 /dev/video2；返回向监听线程发送 uevent 的一端
+    """
+    monkeypatch.setattr(service, "camera_device", "/dev/video2")
+    monkeypatch.setattr(service, "camera_attached", True)
+    monkeypatch.setattr(service, "camera_lost_time", None)
+    monkeypatch.setattr(service, "camera_condition", threading.Condition())
+    monkeypatch.setattr(service, "invalidate_cached_camera", lambda **kwargs: None)
+    monkeypatch.setattr(service, "find_dh_usb_camera", lambda **kwargs: "/dev/video4")
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    monitor = UeventMonitor(service.handle_uevent, sock=receiver)
+    monitor.start()
+    yield sender
+    monitor.stop()
+    sender.close()
+
+
+def wait_detached(timeout):
+    with service.camera_condition:
+        return service.camera_condition.wait_for(lambda: not service.camera_attached, timeout)
+
+
+def test_unrelated_uevents_are_ignored(hotplug):
+    hotplug.send(uevent("remove", "video0"))
+    hotplug.send(uevent("remove", "video2", subsystem="usb"))
+    assert not wait_detached(0.3)
+    assert service.camera_device == "/dev/video2"
+
+
+def test_remove_of_tracked_device_wakes_waiter(hotplug):
+    woken = threading.Event()
+
+    def waiter():
+        if wait_detached(5):
+            woken.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    hotplug.send(uevent("remove", "video0"))
+    assert not woken.wait(0.2)
+    hotplug.send(uevent("remove", "video2"))
+    thread.join(5)
+    assert woken.is_set()
+    assert service.camera_device is None
+    assert service.camera_lost_time is not None
+
+
+def test_add_after_remove_reattaches(hotplug, monkeypatch):
+    opened = []
+    monkeypatch.setattr(service, "recording", True)
+    monkeypatch.setattr(service, "close_camera", lambda: None)
+    monkeypatch.setattr(service, "initialize_camera", lambda **kwargs: opened.append(service.camera_device) or True)
+    hotplug.send(uevent("remove", "video2"))
+    assert wait_detached(5)
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(service.reattach_camera()))
+    thread.start()
+    # reattach_camera() 阻塞等待接入事件
+    thread.join(0.2)
+    assert thread.is_alive()
+    hotplug.send(uevent("add", "video4"))
+    thread.join(5)
+    assert not thread.is_alive()
+    assert opened == ["/dev/video4"]
+    assert result and result[0] is not None
+    assert service.camera_lost_time is None
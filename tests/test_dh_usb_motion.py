@@ -0,0 +1,48 @@
+"""
+dh_usb_motion 测试：门控判断与参考帧更新
+"""
+
+import numpy as np
+
+from dh_usb_motion import MotionGate
+
+
+def scene(value):
+    frame = np.full((480, 640, 3), 100, np.uint8)
+    frame[100:300, 100:300] = value
+    return frame
+
+
+def test_static_scene_is_skipped_after_first_save():
+    gate = MotionGate(1.0)
+    reason, small = gate.check(scene(100), 0.0)
+    assert reason == "first"
+    gate.commit(small, 0.0, reason)
+    assert gate.check(scene(100), 1.0)[0] is None
+    assert gate.check(scene(250), 2.0)[0] == "motion"
+    assert (gate.motion_saves, gate.skipped) == (1, 1)
+
+
+def test_rejected_frame_does_not_replace_reference():
+    gate = MotionGate(1.0, keepalive=10.0)
+    reason, small = gate.check(scene(100), 0.0)
+    gate.commit(small, 0.0, reason)
+    # 画面变化，但保存流水线拒绝了这一帧：不调用 commit()
+    assert gate.check(scene(250), 1.0)[0] == "motion"
+    # 参考帧仍是第一帧，之后同样的变化仍然触发保存
+    assert gate.check(scene(250), 2.0)[0] == "motion"
+    assert gate.motion_saves == 1
+
+
+def test_keepalive_counts_from_last_committed_save():
+    gate = MotionGate(1.0, keepalive=5.0)
+    reason, small = gate.check(scene(100), 0.0)
+    gate.commit(small, 0.0, reason)
+    assert gate.check(scene(100), 4.0)[0] is None
+    reason, small = gate.check(scene(100), 5.0)
+    assert reason == "keepalive"
+    # 保活帧被拒绝时不推迟下一次保活
+    assert gate.check(scene(100), 6.0)[0] == "keepalive"
+    gate.commit(small, 6.0, "keepalive")
+    assert gate.check(scene(100), 7.0)[0] is None
+    assert gate.keepalive_saves == 1
@@ -0,0 +1,116 @@
+"""
+dh_usb_pack 测试：打包写入与按时间范围读取
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import pytest
+
+from dh_usb_pack import PackPipeline, PackReader, PackWriter, list_packs
+from dh_usb_pipeline import POLICY_BLOCK
+
+
+def jpeg(value):
+    image = np.full((48, 64, 3), value, np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    return str(tmp_path / "test.pack")
+
+
+def test_round_trip_find_range(pack_path):
+    start = 1_700_000_000.0
+    frames = [jpeg(10 * i) for i in range(10)]
+    writer = PackWriter(pack_path)
+    for i, data in enumerate(frames):
+        writer.append(data, start + i, score=float(i))
+    writer.close()
+
+    with PackReader(pack_path) as reader:
+        assert len(reader) == 10
+        # [start + 3, start + 7) 包含第 3..6 帧
+        found = reader.find_range(start + 3, start + 7)
+        assert found == range(3, 7)
+        for k in found:
+            assert bytes(reader.frame_bytes(k)) == frames[k]
+        assert list(reader.scores[found.start:found.stop]) == [3.0, 4.0, 5.0, 6.0]
+        assert reader.frame(5).shape == (48, 64, 3)
+        assert reader.find_range(start + 100) == range(10, 10)
+        stamps = [t for t, _ in reader.frames_between(start + 8, decode=False)]
+        assert stamps == [start + 8, start + 9]
+
+
+def test_datetime_range_and_link_record(pack_path):
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    data = jpeg(100)
+    writer = PackWriter(pack_path)
+    offset, length = writer.append(data, start)
+    # 重复帧的记录指向已写入的数据
+    writer.add_record(offset, length, start + timedelta(seconds=1))
+    writer.close()
+    assert os.path.getsize(pack_path) == len(data)
+
+    with PackReader(pack_path) as reader:
+        assert reader.find_range(start, start + timedelta(seconds=2)) == range(0, 2)
+        assert bytes(reader.frame_bytes(1)) == data
+
+
+def test_out_of_order_records_are_sorted(pack_path):
+    writer = PackWriter(pack_path)
+    for t in (3.0, 1.0, 2.0):
+        writer.append(jpeg(int(t * 50)), t)
+    writer.close()
+    with PackReader(pack_path) as reader:
+        assert list(reader.timestamps) == [1.0, 2.0, 3.0]
+        assert reader.find_range(1.5, 3.0) == range(1, 2)
+
+
+def test_records_past_end_of_data_are_ignored(pack_path):
+    writer = PackWriter(pack_path)
+    writer.append(jpeg(10), 1.0)
+    writer.append(jpeg(20), 2.0)
+    writer.close()
+    # 模拟数据写入不完整（索引已写入）
+    with open(pack_path, "r+b") as f:
+        f.truncate(os.path.getsize(pack_path) - 1)
+    with PackReader(pack_path) as reader:
+        assert len(reader) == 1
+
+
+def test_reopened_writer_appends(pack_path):
+    for t in (1.0, 2.0):
+        writer = PackWriter(pack_path)
+        writer.append(jpeg(int(t * 50)), t)
+        writer.close()
+    with PackReader(pack_path) as reader:
+        assert list(reader.timestamps) == [1.0, 2.0]
+
+
+def test_invalid_index_is_rejected(tmp_path):
+    (tmp_path / "bad.idx").write_bytes(b"not an index at all")
+    (tmp_path / "bad.pack").write_bytes(b"")
+    with pytest.raises(ValueError):
+        PackReader(str(tmp_path / "bad.pack"))
+
+
+def test_pipeline_round_trip(tmp_path):
+    pipeline = PackPipeline(str(tmp_path), policy=POLICY_BLOCK, verbose=False).start()
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(5):
+        image = np.full((48, 64, 3), 40 * i, np.uint8)
+        assert pipeline.submit(image, start + timedelta(seconds=i))
+    pipeline.close()
+    assert pipeline.summary()["saved"] == 5
+
+    packs = list_packs(str(tmp_path))
+    assert len(packs) == 1
+    with PackReader(packs[0]) as reader:
+        found = reader.find_range(start + timedelta(seconds=1), start + timedelta(seconds=3))
+        assert found == range(1, 3)
+        # 评分为亮度，随帧递增
+        assert np.all(np.diff(reader.scores) > 0)
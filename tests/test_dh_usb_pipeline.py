@@ -0,0 +1,63 @@
+"""
+dh_usb_pipeline 测试：去重硬链接与背压丢帧的计数
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from dh_usb_dedup import FrameDeduplicator
+from dh_usb_pipeline import POLICY_BLOCK, POLICY_DROP_OLDEST, SavePipeline
+
+
+def frame():
+    image = np.full((240, 320, 3), 80, np.uint8)
+    image[60:180, 80:240] = 200
+    return image
+
+
+def times(count):
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    return [start + timedelta(milliseconds=100 * i) for i in range(count)]
+
+
+def test_links_are_reported_next_to_saved(tmp_path):
+    pipeline = SavePipeline(str(tmp_path), dedup=FrameDeduplicator("link"), policy=POLICY_BLOCK,
+                            verbose=False).start()
+    for captured_at in times(15):
+        assert pipeline.submit(frame(), captured_at)
+    pipeline.close()
+    stats = pipeline.summary()
+    assert (stats["saved"], stats["linked"], stats["errors"]) == (1, 14, 0)
+    assert len(os.listdir(tmp_path)) == 15
+    assert "硬链接 14 帧" in pipeline.format_summary()
+
+
+def test_links_to_evicted_target_are_dropped(tmp_path):
+    # 编码线程启动前提交，队列容量 2：第三帧挤掉链接目标（第一帧）
+    pipeline = SavePipeline(str(tmp_path), dedup=FrameDeduplicator("link"), queue_size=2,
+                            policy=POLICY_DROP_OLDEST, verbose=False)
+    for captured_at in times(3):
+        assert pipeline.submit(frame(), captured_at)
+    pipeline.start()
+    pipeline.close()
+    stats = pipeline.summary()
+    assert (stats["saved"], stats["linked"], stats["dropped"], stats["errors"]) == (0, 0, 3, 0)
+    assert os.listdir(tmp_path) == []
+
+
+def test_new_reference_after_evicted_target(tmp_path):
+    dedup = FrameDeduplicator("link")
+    pipeline = SavePipeline(str(tmp_path), dedup=dedup, queue_size=2, policy=POLICY_DROP_OLDEST,
+                            verbose=False)
+    first, second, third, fourth = times(4)
+    for captured_at in (first, second, third):
+        pipeline.submit(frame(), captured_at)
+    pipeline.start()
+    # 参考帧被丢弃后，下一帧重新作为参考帧保存
+    assert dedup.last_filename is None
+    pipeline.submit(frame(), fourth)
+    pipeline.close()
+    stats = pipeline.summary()
+    assert (stats["saved"], stats["dropped"], stats["errors"]) == (1, 3, 0)
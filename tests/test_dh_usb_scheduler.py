@@ -0,0 +1,62 @@
+"""
+dh_usb_scheduler 测试：使用注入的时钟验证截止时间、抖动和错过的时间点
+"""
+
+import pytest
+
+from dh_usb_scheduler import IntervalScheduler
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadlines_do_not_drift():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(1.0, clock=clock)
+    scheduler.start()
+    assert scheduler.next_deadline == 101.0
+    for k in range(1, 6):
+        # 每次都晚 0.2 秒保存，下一个截止时间仍是 t0 + k * interval
+        clock.now = 100.0 + k + 0.2
+        assert scheduler.is_due()
+        assert scheduler.record_save() == pytest.approx(0.2)
+        assert scheduler.next_deadline == 100.0 + k + 1
+    stats = scheduler.summary()
+    assert stats["saves"] == 5 and stats["missed"] == 0
+    assert stats["jitter_max_ms"] == pytest.approx(200.0)
+
+
+def test_immediate_start():
+    scheduler = IntervalScheduler(2.0, clock=FakeClock())
+    scheduler.start(immediate=True)
+    assert scheduler.is_due()
+    assert scheduler.time_until_deadline() == 0.0
+
+
+def test_late_save_counts_missed_deadlines():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(1.0, clock=clock)
+    scheduler.start()
+    # 第一个截止时间是 101，3.5 秒后才保存：错过 102 和 103，下一个截止时间为 104
+    clock.now = 103.5
+    scheduler.record_save()
+    assert scheduler.missed == 2
+    assert scheduler.next_deadline == 104.0
+    assert not scheduler.is_due()
+
+
+def test_skip_advances_without_counting_a_save():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(1.0, clock=clock)
+    scheduler.start()
+    clock.now = 101.0
+    scheduler.record_skip()
+    assert scheduler.next_deadline == 102.0
+    stats = scheduler.summary()
+    assert (stats["saves"], stats["skipped"], stats["missed"]) == (0, 1, 0)
+    assert "跳过 1 个时间点" in scheduler.format_summary()
@@ -0,0 +1,139 @@
+"""
+dh_usb_v4l2_capture 测试：通过 FakeV4L2Device 驱动 V4L2Capture
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from dh_usb_v4l2 import fourcc_from_str
+from dh_usb_v4l2_capture import FakeV4L2Device, V4L2Capture
+
+
+def open_capture(fourcc, width, height, convert_rgb=True):
+    cap = V4L2Capture(device=FakeV4L2Device(realtime=False))
+    cap.set(cv2.CAP_PROP_FOURCC, fourcc_from_str(fourcc))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 1 if convert_rgb else 0)
+    return cap
+
+
+@pytest.fixture
+def release():
+    caps = []
+    yield caps.append
+    for cap in caps:
+        cap.release()
+
+
+def test_mjpg_passthrough_returns_jpeg_view(release):
+    cap = open_capture("MJPG", 1920, 1080, convert_rgb=False)
+    release(cap)
+    assert cap.grab()
+    ok, data = cap.retrieve()
+    assert ok
+    assert data.ndim == 1 and data.dtype == np.uint8
+    assert bytes(data[:2]) == b"\xff\xd8" and bytes(data[-2:]) == b"\xff\xd9"
+    # 直通数据是驱动缓冲区的视图，不复制
+    assert np.shares_memory(data, cap.buffer_view())
+    assert cv2.imdecode(data, cv2.IMREAD_COLOR).shape == (1080, 1920, 3)
+
+
+def test_mjpg_decodes_to_bgr(release):
+    cap = open_capture("MJPG", 640, 480)
+    release(cap)
+    ok, frame = cap.read()
+    assert ok
+    assert frame.shape == (480, 640, 3)
+    assert not np.shares_memory(frame, cap.buffer_view())
+
+
+def test_yuyv_converts_to_bgr(release):
+    cap = open_capture("YUYV", 640, 480)
+    release(cap)
+    ok, frame = cap.read()
+    assert ok
+    assert frame.shape == (480, 640, 3)
+    # 模拟图案的色度为 128（灰色），三个通道相同，亮度沿水平方向渐变
+    assert np.array_equal(frame[..., 0], frame[..., 2])
+    assert frame[0, 100, 0] > frame[0, 10, 0]
+
+
+def test_yuyv_passthrough_is_packed_view(release):
+    cap = open_capture("YUYV", 640, 480, convert_rgb=False)
+    release(cap)
+    assert cap.grab()
+    ok, raw = cap.retrieve()
+    assert ok
+    assert raw.shape == (480, 640, 2)
+    assert np.shares_memory(raw, cap.buffer_view())
+
+
+def test_nv12_converts_to_bgr(release):
+    cap = open_capture("NV12", 1280, 720)
+    release(cap)
+    ok, frame = cap.read()
+    assert ok
+    assert cap.get(cv2.CAP_PROP_FOURCC) == fourcc_from_str("NV12")
+    assert frame.shape == (720, 1280, 3)
+    assert np.array_equal(frame[..., 0], frame[..., 2])
+    assert frame[0, 100, 0] > frame[0, 10, 0]
+
+
+def test_nv12_passthrough_is_plane_view(release):
+    cap = open_capture("NV12", 640, 480, convert_rgb=False)
+    release(cap)
+    assert cap.grab()
+    ok, raw = cap.retrieve()
+    assert ok
+    assert raw.shape == (720, 640)
+    assert np.shares_memory(raw, cap.buffer_view())
+
+
+@pytest.mark.parametrize("fourcc", ["MJPG", "YUYV", "NV12"])
+def test_retrieve_into_output_array(release, fourcc):
+    cap = open_capture(fourcc, 640, 480)
+    release(cap)
+    image = np.empty((480, 640, 3), np.uint8)
+    assert cap.grab()
+    ok, frame = cap.retrieve(image)
+    assert ok
+    assert frame is image
+
+
+def test_mode_switch_reconfigures_buffers(release):
+    cap = open_capture("MJPG", 1920, 1080, convert_rgb=False)
+    release(cap)
+    assert cap.grab()
+    ok, held = cap.retrieve()
+    assert ok
+
+    # 切换格式和分辨率后下一次 grab() 重新配置设备
+    cap.set(cv2.CAP_PROP_FOURCC, fourcc_from_str("YUYV"))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1000)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 700)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+    ok, frame = cap.read()
+    assert ok
+    # 与真实驱动一样选择最接近的分辨率
+    assert (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) == (1280, 720)
+    assert cap.get(cv2.CAP_PROP_FOURCC) == fourcc_from_str("YUYV")
+    # 请求的帧率超过该模式支持的帧率时读回驱动实际设置的值
+    assert cap.get(cv2.CAP_PROP_FPS) == 10.0
+    assert frame.shape == (720, 1280, 3)
+    # 调用方持有的旧视图仍可访问
+    assert bytes(held[:2]) == b"\xff\xd8"
+
+
+def test_sequence_and_buffer_count(release):
+    cap = open_capture("MJPG", 640, 480, convert_rgb=False)
+    release(cap)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
+    sequences = []
+    for _ in range(5):
+        assert cap.grab()
+        sequences.append(cap.sequence)
+    assert sequences == [0, 1, 2, 3, 4]
+    assert cap.get(cv2.CAP_PROP_BUFFERSIZE) == 2